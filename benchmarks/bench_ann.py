@@ -0,0 +1,73 @@
+"""Recall@k and latency of the IVF index against the exact RAG scorer.
+
+Vectors are drawn from a Gaussian mixture so that they cluster like real
+sentence embeddings; uniformly random vectors are a worst case for IVF.
+
+Usage: python benchmarks/bench_ann.py [--chunks 200000] [--nprobe 4,8,16,32]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _clustered(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    rows = centers[rng.integers(clusters, size=n)]
+    rows += 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=server.DEFAULT_TOP_K)
+    parser.add_argument("--nprobe", default="4,8,16,32,64")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = _clustered(args.chunks, args.dim, max(64, args.chunks // 500), rng)
+    queries = matrix[rng.integers(args.chunks, size=args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    ivf = server._ivf_build(matrix)
+    build_s = time.perf_counter() - start
+    print(f"chunks={args.chunks} dim={args.dim} nlist={len(ivf['lists'])} build={build_s:.2f}s")
+
+    start = time.perf_counter()
+    exact = [set(server._top_k_indices(matrix @ q, args.top_k).tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+    print(f"{'mode':>10} {'recall@k':>9} {'ms/query':>9} {'scanned':>8}")
+    print(f"{'exact':>10} {1.0:>9.3f} {exact_ms:>9.3f} {args.chunks:>8}")
+
+    for nprobe in (int(x) for x in args.nprobe.split(",")):
+        hits = 0
+        scanned = 0
+        start = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            candidates = server._ivf_candidates(ivf, q, nprobe)
+            top = candidates[server._top_k_indices(matrix[candidates] @ q, args.top_k)]
+            hits += len(truth & set(top.tolist()))
+            scanned += len(candidates)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        recall = hits / (len(queries) * args.top_k)
+        print(
+            f"{'ivf/' + str(nprobe):>10} {recall:>9.3f} {elapsed_ms:>9.3f} "
+            f"{scanned // len(queries):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
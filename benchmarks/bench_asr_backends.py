@@ -0,0 +1,124 @@
+"""WER and latency of each ASR engine and model size on local sample clips.
+
+Every audio file in --clips (wav, webm, ogg, mp3...) needs a reference
+transcript next to it with the same stem and a .txt extension. For each
+ASR_VARIANT in --variants and each engine in --engines, the engine is
+loaded in this process, the clips are decoded with the server's in-memory
+decoder and transcribed once untimed to warm up, then once timed. Reports
+load time, word error rate (accents, case and punctuation ignored),
+per-clip latency and real-time factor (processing seconds per audio second).
+Engines that are not installed are skipped.
+
+Usage: python benchmarks/bench_asr_backends.py samples/ [--variants tiny,base] [--out asr.json]
+"""
+
+import argparse
+import gc
+import json
+import re
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+AUDIO_SUFFIXES = {".wav", ".webm", ".ogg", ".mp3", ".m4a", ".flac"}
+
+
+def _words(text):
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.findall(r"\w+", text)
+
+
+def _edit_distance(ref, hyp):
+    row = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, hyp_word in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ref_word != hyp_word))
+    return row[-1]
+
+
+def _load_clips(directory):
+    clips = []
+    for path in sorted(Path(directory).iterdir()):
+        reference = path.with_suffix(".txt")
+        if path.suffix.lower() not in AUDIO_SUFFIXES or not reference.exists():
+            continue
+        samples = server._decode_audio_bytes(path.read_bytes())
+        clips.append((path.name, samples, _words(reference.read_text(encoding="utf-8"))))
+    return clips
+
+
+def _bench(engine, variant, clips, language):
+    server.ASR_VARIANT = variant
+    server.ASR_ENGINE = engine
+    server._ASR_BACKEND = None
+    gc.collect()
+    started = time.perf_counter()
+    name, backend = server._get_asr_backend()
+    load_s = time.perf_counter() - started
+    if name == "none":
+        print(f"  {engine:>18} {variant:<8} unavailable: {backend}")
+        return None
+
+    server._transcribe_samples(name, backend, clips[0][1], language)
+    edits = ref_words = 0
+    latencies, audio_s = [], 0.0
+    for _, samples, reference in clips:
+        started = time.perf_counter()
+        text = server._transcribe_samples(name, backend, samples, language)
+        latencies.append(time.perf_counter() - started)
+        audio_s += samples.size / server.ASR_TARGET_SAMPLE_RATE
+        edits += _edit_distance(reference, _words(text))
+        ref_words += len(reference)
+    result = {
+        "engine": engine,
+        "variant": variant,
+        "load_s": round(load_s, 2),
+        "wer": round(edits / max(ref_words, 1), 4),
+        "latency_ms_mean": round(float(np.mean(latencies)) * 1000.0, 1),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)) * 1000.0, 1),
+        "rtf": round(sum(latencies) / audio_s, 4),
+    }
+    print(
+        f"  {engine:>18} {variant:<8} load={result['load_s']:6.2f}s wer={result['wer']:6.1%} "
+        f"mean={result['latency_ms_mean']:8.1f}ms p95={result['latency_ms_p95']:8.1f}ms "
+        f"rtf={result['rtf']:.3f}"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("clips", help="directory of audio files with .txt references")
+    parser.add_argument("--engines", default=",".join(server.ASR_ENGINES))
+    parser.add_argument("--variants", default="tiny,base")
+    parser.add_argument("--language", default=server.ASR_DEFAULT_LANGUAGE)
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    clips = _load_clips(args.clips)
+    if not clips:
+        raise SystemExit(f"no audio clip with a .txt reference in {args.clips}")
+    total = sum(samples.size for _, samples, _ in clips) / server.ASR_TARGET_SAMPLE_RATE
+    print(f"{len(clips)} clips, {total:.1f}s of audio, language={args.language}")
+
+    results = []
+    for variant in [v for v in args.variants.split(",") if v]:
+        for engine in [e for e in args.engines.split(",") if e]:
+            result = _bench(engine, variant, clips, args.language)
+            if result is not None:
+                results.append(result)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
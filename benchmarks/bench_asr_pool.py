@@ -0,0 +1,123 @@
+"""Transcription throughput through the ASR worker pool.
+
+Runs the app in-process with uvicorn, waits for /api/health (the ASR
+workers load and warm their models at startup), then drives N concurrent
+clients posting the same clip to /api/audio/transcribe for --duration
+seconds at each concurrency level. Reports audio-seconds transcribed per
+wall-second, request latency, rejected (429) requests and the mean batch
+size the dispatcher formed.
+
+Pass --audio with a recording of speech; without it a synthetic WAV is
+used, which exercises decoding and the model but not realistic decoding
+lengths.
+
+Usage: python benchmarks/bench_asr_pool.py [--audio clip.webm] [--clients 1,2,4,8,16]
+"""
+
+import argparse
+import asyncio
+import io
+import sys
+import time
+import wave
+from pathlib import Path
+
+import httpx
+import numpy as np
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _synthetic_wav(seconds):
+    rate = server.ASR_TARGET_SAMPLE_RATE
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = (np.sin(2 * np.pi * 1.5 * t) > 0).astype(np.float32)
+    signal = 0.3 * envelope * np.sin(2 * np.pi * 220 * t)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((signal * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+async def _client(http, audio, filename, deadline):
+    latencies, batches, rejected, audio_s = [], [], 0, 0.0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await http.post(
+            "/api/audio/transcribe",
+            files={"file": (filename, audio)},
+            data={"language": server.ASR_DEFAULT_LANGUAGE},
+        )
+        if response.status_code == 429:
+            rejected += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+            continue
+        response.raise_for_status()
+        body = response.json()
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        batches.append(body["metrics"]["batch_size"])
+        audio_s += body["audio_s"]
+    return latencies, batches, rejected, audio_s
+
+
+async def _run(http, clients, audio, filename, duration):
+    started = time.perf_counter()
+    deadline = started + duration
+    results = await asyncio.gather(
+        *(_client(http, audio, filename, deadline) for _ in range(clients))
+    )
+    # Requests in flight at the deadline still finish: divide by real wall time.
+    wall = time.perf_counter() - started
+    latencies = np.asarray([v for r in results for v in r[0]] or [0.0])
+    batches = [v for r in results for v in r[1]] or [0]
+    print(
+        f"clients={clients:>3} {sum(r[3] for r in results) / wall:6.2f} audio-s/s "
+        f"requests={len(latencies):>4} rejected={sum(r[2] for r in results):>3} "
+        f"p50={np.percentile(latencies, 50):7.0f}ms p95={np.percentile(latencies, 95):7.0f}ms "
+        f"mean batch={np.mean(batches):4.2f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", default="")
+    parser.add_argument("--seconds", type=float, default=5.0, help="synthetic clip length")
+    parser.add_argument("--clients", default="1,2,4,8,16")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8771)
+    args = parser.parse_args()
+
+    if args.audio:
+        audio, filename = Path(args.audio).read_bytes(), Path(args.audio).name
+    else:
+        audio, filename = _synthetic_wav(args.seconds), "synthetic.wav"
+
+    server.PRELOAD_SUBSYSTEMS = ("asr",)
+    app_server = uvicorn.Server(
+        uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(app_server.serve())
+    while not app_server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+        while (await http.get("/api/health")).status_code == 503:
+            await asyncio.sleep(0.5)
+        print(f"workers={server.ASR_WORKERS} queue={server.ASR_QUEUE_MAX}")
+        for clients in [int(c) for c in args.clients.split(",") if c]:
+            await _run(http, clients, audio, filename, args.duration)
+        print((await http.get("/api/audio/stats")).json())
+
+    app_server.should_exit = True
+    await serve_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+"""Embedding backends and store precisions: throughput, recall drift, memory.
+
+Chunks a corpus (a directory of .txt/.md/.pdf files) the way /api/rag/index
+does, then:
+
+1. For each embedding backend (torch with each --threads value, 0 meaning
+   torch's default, and onnx-int8), loads the model, encodes every chunk
+   and reports chunks/s, single-query latency, model RSS growth and
+   recall@k against the fp32 torch reference.
+2. For each RAG_STORE_DTYPE, stores the reference embeddings, then reports
+   bytes per vector, exact-scan query time and recall@k against float32.
+
+Queries come from --queries (one per line) or, by default, the first
+sentence of randomly picked chunks.
+
+Usage: python benchmarks/bench_embeddings.py corpus/ [--threads 0,1,4] [--top-k 6]
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _load_chunks(directory):
+    chunks = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.suffix.lower() not in {".txt", ".md", ".pdf"}:
+            continue
+        text, err = server._text_from_bytes(path.name, path.read_bytes())
+        if err:
+            print(f"skip {path.name}: {err}")
+            continue
+        chunks.extend(
+            server._chunk_text(text, server.DEFAULT_CHUNK_SIZE, server.DEFAULT_CHUNK_OVERLAP)
+        )
+    return chunks
+
+
+def _queries(args, chunks):
+    if args.queries:
+        lines = Path(args.queries).read_text(encoding="utf-8").splitlines()
+        return [line.strip() for line in lines if line.strip()]
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(chunks), min(args.num_queries, len(chunks)), replace=False)
+    return [re.split(r"(?<=[.!?])\s", chunks[i].strip(), maxsplit=1)[0][:200] for i in picked]
+
+
+def _top_k(matrix_scores, k):
+    return [set(server._top_k_indices(scores, k).tolist()) for scores in matrix_scores]
+
+
+def _recall(reference, candidate):
+    return float(np.mean([len(r & c) / max(len(r), 1) for r, c in zip(reference, candidate)]))
+
+
+def _load_backend(backend, threads, default_threads):
+    import torch
+
+    server.EMBEDDING_BACKEND = backend
+    server._EMBEDDING_MODEL = None
+    torch.set_num_threads(threads or default_threads)
+    rss = server._resident_memory_mb() or 0.0
+    model = server._get_embedding_model()
+    return model, (server._resident_memory_mb() or 0.0) - rss
+
+
+def _bench_backend(label, model, rss_mb, chunks, queries, reference, args):
+    model.encode(chunks[: args.batch_size], batch_size=args.batch_size, normalize_embeddings=True)
+    started = time.perf_counter()
+    docs = np.asarray(
+        model.encode(chunks, batch_size=args.batch_size, normalize_embeddings=True),
+        dtype=np.float32,
+    )
+    throughput = len(chunks) / (time.perf_counter() - started)
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        model.encode([query], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    query_embs = np.asarray(model.encode(queries, normalize_embeddings=True), dtype=np.float32)
+    recall = None
+    if reference is not None:
+        recall = _recall(reference, _top_k(query_embs @ docs.T, args.top_k))
+    recall_text = f"{recall:.3f}" if recall is not None else "ref"
+    print(
+        f"  {label:<16} {throughput:8.1f} chunks/s query p50={np.percentile(latencies, 50):6.2f}ms "
+        f"model rss +{rss_mb:6.1f}MB recall@{args.top_k}={recall_text}"
+    )
+    return docs, query_embs
+
+
+def _bench_store(docs, query_embs, reference, top_k):
+    for dtype in ("float32", "float16", "int8"):
+        server.RAG_STORE_DTYPE = dtype
+        rows, scales = server._quantize_store_rows(docs)
+        started = time.perf_counter()
+        scores = [server._score_rows(rows, scales, q) for q in query_embs]
+        query_ms = (time.perf_counter() - started) / len(query_embs) * 1000.0
+        row_bytes = rows.shape[1] * rows.itemsize + (scales.itemsize if scales is not None else 0)
+        total_mb = row_bytes * len(rows) / (1024 * 1024)
+        print(
+            f"  {dtype:<8} {row_bytes:5d} B/vector {total_mb:8.2f}MB "
+            f"scan={query_ms:6.2f}ms recall@{top_k}={_recall(reference, _top_k(scores, top_k)):.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus")
+    parser.add_argument("--queries", default="")
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--threads", default="0,1,2,4")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=server.DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    import torch
+
+    default_threads = torch.get_num_threads()
+    chunks = _load_chunks(args.corpus)
+    if not chunks:
+        raise SystemExit(f"no text found in {args.corpus}")
+    queries = _queries(args, chunks)
+    print(f"{len(chunks)} chunks, {len(queries)} queries, torch default threads={default_threads}")
+
+    print("embedding backends")
+    reference = reference_docs = reference_queries = None
+    for threads in [int(t) for t in args.threads.split(",") if t]:
+        model, rss_mb = _load_backend("torch", threads, default_threads)
+        label = f"torch threads={threads or default_threads}"
+        docs, query_embs = _bench_backend(label, model, rss_mb, chunks, queries, reference, args)
+        if reference is None:
+            reference_docs, reference_queries = docs, query_embs
+            reference = _top_k(query_embs @ docs.T, args.top_k)
+    model, rss_mb = _load_backend("onnx-int8", 0, default_threads)
+    # The loader falls back to torch when the ONNX stack is missing.
+    label = f"onnx-int8 ({server._EMBEDDING_BACKEND_LOADED})"
+    _bench_backend(label, model, rss_mb, chunks, queries, reference, args)
+
+    print("store precision (fp32 torch embeddings)")
+    _bench_store(reference_docs, reference_queries, reference, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Aggregate /ws/emotion throughput: per-socket path vs batched IMAGE mode.
+
+Runs the app in-process with uvicorn and drives N lock-step clients twice,
+once with EMOTION_BATCH_ENABLED off (one VIDEO-mode FaceMesh lease per
+frame) and once on (frames from all sockets batched within
+EMOTION_BATCH_WINDOW). Also times the emotion post-processing alone,
+per face versus one vectorized call over the batch.
+
+Pass --image with a photo of a face: on random noise FaceMesh finds no face
+and only detection cost is measured.
+
+Usage: python benchmarks/bench_emotion_batch.py [--clients 1,4,16] [--image face.jpg]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import uvicorn
+import websockets
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _jpeg(image_path, width, height):
+    if image_path:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise SystemExit(f"cannot read {image_path}")
+        image = cv2.resize(image, (width, height))
+    else:
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    ok, jpg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    return jpg.tobytes()
+
+
+def _frame(jpg, width, height, frame_id):
+    header = server.FRAME_HEADER.pack(
+        server.FRAME_VERSION, server.FRAME_FORMAT_JPEG, width, height, 0, frame_id, 0.0
+    )
+    return header + jpg
+
+
+async def _client(url, jpg, width, height, duration):
+    frames = 0
+    batch_sizes = []
+    async with websockets.connect(url, max_size=None) as ws:
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            frames += 1
+            await ws.send(_frame(jpg, width, height, frames))
+            reply = json.loads(await ws.recv())
+            while reply.get("type") == "rate":
+                reply = json.loads(await ws.recv())
+            batch_sizes.append((reply.get("metrics") or {}).get("batch_size", 1))
+    return frames, batch_sizes
+
+
+async def _run(url, clients, jpg, width, height, duration):
+    results = await asyncio.gather(
+        *(_client(url, jpg, width, height, duration) for _ in range(clients))
+    )
+    total = sum(frames for frames, _ in results)
+    sizes = [size for _, batch in results for size in batch] or [1]
+    return total / duration, float(np.mean(sizes))
+
+
+def _bench_postprocess(faces, repeats=200):
+    rng = np.random.default_rng(0)
+    points = rng.normal(0.5, 0.03, size=(faces, len(server.FACE_GUIDE_INDICES), 2))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for face in points:
+            server._estimate_emotion(face)
+    per_face = (time.perf_counter() - start) / repeats * 1000.0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        features = server._emotion_features(points)
+        server._classify_emotions(features)
+    batched = (time.perf_counter() - start) / repeats * 1000.0
+    print(f"post-process {faces:>3} faces: per-face={per_face:6.3f}ms batched={batched:6.3f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", default="1,4,16")
+    parser.add_argument("--image", default="")
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8769)
+    args = parser.parse_args()
+
+    app_server = uvicorn.Server(
+        uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(app_server.serve())
+    while not app_server.started:
+        await asyncio.sleep(0.05)
+
+    url = f"ws://127.0.0.1:{args.port}/ws/emotion"
+    jpg = _jpeg(args.image, args.width, args.height)
+    print(f"window={server.EMOTION_BATCH_WINDOW * 1000:.0f}ms max={server.EMOTION_BATCH_MAX}")
+    for clients in [int(c) for c in args.clients.split(",") if c]:
+        server.EMOTION_BATCH_ENABLED = False
+        single, _ = await _run(url, clients, jpg, args.width, args.height, args.duration)
+        server.EMOTION_BATCH_ENABLED = True
+        batched, mean_batch = await _run(url, clients, jpg, args.width, args.height, args.duration)
+        print(
+            f"clients={clients:>3} per-socket={single:7.1f} fps "
+            f"batched={batched:7.1f} fps (mean batch {mean_batch:4.1f})"
+        )
+
+    app_server.should_exit = True
+    await serve_task
+
+    for faces in (1, 16, 64):
+        _bench_postprocess(faces)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
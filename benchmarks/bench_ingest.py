@@ -0,0 +1,93 @@
+"""Ingestion throughput (pages/s, chunks/s) for a local corpus.
+
+Runs the staged /api/rag/index pipeline (process-pool PDF extraction,
+bounded chunk queue, batched embedding thread) and the previous
+file-by-file path on the same files, with the embedding cache disabled.
+
+Usage: python benchmarks/bench_ingest.py CORPUS_DIR [--chunk-size 1200]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _load_corpus(root: Path):
+    uploads = []
+    for path in sorted(root.rglob("*")):
+        if path.suffix.lower() in {".pdf", ".txt", ".md"}:
+            uploads.append((path.name, path.read_bytes()))
+    return uploads
+
+
+def _count_pages(uploads):
+    try:
+        import fitz
+    except Exception:
+        return 0
+    pages = 0
+    for name, data in uploads:
+        if name.lower().endswith(".pdf"):
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                pages += doc.page_count
+    return pages
+
+
+def _sequential(uploads, chunk_size, overlap):
+    chunks_total = 0
+    for name, data in uploads:
+        text, err = server._text_from_bytes(name, data)
+        if err:
+            continue
+        chunks = server._chunk_text(text, chunk_size, overlap)
+        if chunks:
+            server._embed_texts(chunks)
+        chunks_total += len(chunks)
+    return chunks_total
+
+
+def _report(name, pages, chunks, elapsed):
+    print(
+        f"{name:>10} {elapsed:8.2f}s {pages / elapsed:10.1f} pages/s "
+        f"{chunks / elapsed:10.1f} chunks/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=server.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=server.DEFAULT_CHUNK_OVERLAP)
+    args = parser.parse_args()
+
+    server.EMBED_CACHE_PERSIST = False
+    server.EMBED_CACHE_MAX_ENTRIES = 0
+    server.RAG_INDEX_DIR = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    server.RAG_INDEX_MANIFEST = server.RAG_INDEX_DIR / "index.json"
+
+    uploads = _load_corpus(args.corpus)
+    pages = _count_pages(uploads)
+    print(f"{len(uploads)} files, {pages} PDF pages, {server.RAG_INGEST_PROCESSES} processes")
+    server._get_embedding_model()  # keep model loading out of both timings
+
+    start = time.perf_counter()
+    chunks = _sequential(uploads, args.chunk_size, args.overlap)
+    _report("sequential", pages, chunks, time.perf_counter() - start)
+
+    server._reset_rag_store()
+    job = server._new_ingest_job([name for name, _ in uploads])
+    start = time.perf_counter()
+    server._run_ingest_job(job, uploads, args.chunk_size, args.overlap)
+    _report("pipeline", job["pages_done"], job["chunks_embedded"], time.perf_counter() - start)
+    if job["errors"]:
+        print("errors:", *job["errors"], sep="\n  ")
+
+
+if __name__ == "__main__":
+    main()
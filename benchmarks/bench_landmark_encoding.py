@@ -0,0 +1,103 @@
+"""Encode time and bytes per frame for each result wire format.
+
+Compares the historical per-point dict + json.dumps path against
+_encode_result in its three modes ("json", "f32", "i16") for a gesture
+result with one and two hands and for an emotion result with face guides.
+Landmarks are synthetic; only encoding cost is measured.
+
+Usage: python benchmarks/bench_landmark_encoding.py [--repeats 5000]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _fake_hands(count, rng):
+    return SimpleNamespace(
+        hand_landmarks=[
+            [
+                SimpleNamespace(x=float(x), y=float(y), z=float(z))
+                for x, y, z in rng.random((21, 3))
+            ]
+            for _ in range(count)
+        ]
+    )
+
+
+def _legacy_gesture(result):
+    out = []
+    for hand_lms in result.hand_landmarks:
+        out.append([{"x": lm.x, "y": lm.y, "z": lm.z} for lm in hand_lms])
+    return json.dumps(
+        {
+            "type": "result",
+            "landmarks": out,
+            "gesture": {"label": "Main ouverte", "score": 0.9, "raw": "Open_Palm"},
+            "metrics": {"inference_ms": 12.3},
+            "frame": {"id": 1, "capture_ts": 0.0},
+        }
+    )
+
+
+def _gesture_payload(result):
+    return {
+        "type": "result",
+        "landmarks": server._hand_landmark_array(result),
+        "gesture": {"label": "Main ouverte", "score": 0.9, "raw": "Open_Palm"},
+        "metrics": {"inference_ms": 12.3},
+        "frame": {"id": 1, "capture_ts": 0.0},
+    }
+
+
+def _time(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        message = fn()
+    return (time.perf_counter() - start) / repeats * 1e6, len(message)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    for hands in (1, 2):
+        result = _fake_hands(hands, rng)
+        print(f"gesture, {hands} hand(s)")
+        us, size = _time(lambda: _legacy_gesture(result), args.repeats)
+        print(f"  {'legacy dicts':>14} {us:8.1f}us {size:6d}B")
+        for encoding in ("json", "f32", "i16"):
+            # Extraction is included: it is part of the per-frame cost.
+            us, size = _time(
+                lambda: server._encode_result(_gesture_payload(result), encoding), args.repeats
+            )
+            print(f"  {encoding:>14} {us:8.1f}us {size:6d}B")
+
+    landmarks = [SimpleNamespace(x=float(x), y=float(y)) for x, y in rng.random((478, 2))]
+    points = server._face_guide_points(landmarks)
+    label, metrics = server._estimate_emotion(points)
+    print("emotion guides")
+    for encoding in ("json", "f32", "i16"):
+        us, size = _time(
+            lambda: server._encode_result(
+                server._face_payload(points, label, dict(metrics), None), encoding
+            ),
+            args.repeats,
+        )
+        print(f"  {encoding:>14} {us:8.1f}us {size:6d}B")
+
+
+if __name__ == "__main__":
+    main()
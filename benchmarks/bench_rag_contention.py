@@ -0,0 +1,143 @@
+"""RAG query latency with and without concurrent indexing.
+
+Chunks a corpus (a directory of .txt/.md/.pdf files) the way /api/rag/index
+does and embeds it once. The store is then filled to --base chunks by
+committing the corpus repeatedly (each copy gets a distinct suffix so the
+dedup does not drop it). Two phases of --duration seconds follow:
+
+1. idle: --readers threads run _retrieve_chunks back to back;
+2. indexing: the same readers, while --writers threads keep committing
+   batches of RAG_INGEST_BATCH fresh chunks through _commit_rag_chunks.
+
+Query embeddings are computed up front, so the timed queries hit the
+embedding cache and measure the store itself. Reports query latency
+percentiles and queries/s for each phase, plus the indexing rate.
+
+Usage: python benchmarks/bench_rag_contention.py corpus/ [--base 50000] [--writers 2] [--readers 4]
+"""
+
+import argparse
+import itertools
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _load_chunks(directory):
+    chunks = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.suffix.lower() not in {".txt", ".md", ".pdf"}:
+            continue
+        text, err = server._text_from_bytes(path.name, path.read_bytes())
+        if err:
+            print(f"skip {path.name}: {err}")
+            continue
+        chunks.extend(
+            server._chunk_text(text, server.DEFAULT_CHUNK_SIZE, server.DEFAULT_CHUNK_OVERLAP)
+        )
+    return chunks
+
+
+def _commit_copy(chunks, embeds, copy):
+    # The suffix is a short token, ignored by the keyword index.
+    tagged = [f"{chunk} [{copy}]" for chunk in chunks]
+    return server._commit_rag_chunks(tagged, ["bench.txt"] * len(tagged), embeds)
+
+
+def _reader(queries, args, stop, latencies):
+    for query in itertools.cycle(queries):
+        if stop.is_set():
+            return
+        started = time.perf_counter()
+        server._retrieve_chunks(query, args.top_k, 0.0)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+
+
+def _writer(chunks, embeds, copies, stop, added):
+    batch = server.RAG_INGEST_BATCH
+    while not stop.is_set():
+        copy = next(copies)
+        for start in range(0, len(chunks), batch):
+            if stop.is_set():
+                return
+            stop_at = start + batch
+            added.append(_commit_copy(chunks[start:stop_at], embeds[start:stop_at], copy))
+
+
+def _phase(label, chunks, embeds, queries, copies, writers, args):
+    stop = threading.Event()
+    per_reader = [[] for _ in range(args.readers)]
+    added = []
+    threads = [
+        threading.Thread(target=_reader, args=(queries, args, stop, latencies))
+        for latencies in per_reader
+    ]
+    threads += [
+        threading.Thread(target=_writer, args=(chunks, embeds, copies, stop, added))
+        for _ in range(writers)
+    ]
+    count = server.RAG_STORE["count"]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies = np.asarray([v for r in per_reader for v in r] or [0.0])
+    print(
+        f"{label:<9} queries={len(latencies):>6} {len(latencies) / wall:8.1f} q/s "
+        f"p50={np.percentile(latencies, 50):7.2f}ms p95={np.percentile(latencies, 95):7.2f}ms "
+        f"p99={np.percentile(latencies, 99):7.2f}ms max={latencies.max():7.2f}ms "
+        f"indexed={sum(added) / wall:8.1f} chunks/s store {count} -> {server.RAG_STORE['count']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus")
+    parser.add_argument("--base", type=int, default=50000, help="chunks in the store before timing")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=server.DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    server.EMBED_CACHE_PERSIST = False
+    chunks = _load_chunks(args.corpus)
+    if not chunks:
+        raise SystemExit(f"no text found in {args.corpus}")
+    embeds = server._embed_texts(chunks)
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(chunks), min(args.num_queries, len(chunks)), replace=False)
+    queries = [re.split(r"(?<=[.!?])\s", chunks[i].strip(), maxsplit=1)[0][:200] for i in picked]
+    server._embed_texts(queries)
+
+    server._reset_rag_store()
+    copies = itertools.count()
+    while server.RAG_STORE["count"] < args.base:
+        _commit_copy(chunks, embeds, next(copies))
+    server._maybe_build_ann()
+    print(
+        f"{len(chunks)} corpus chunks, store {server.RAG_STORE['count']} rows "
+        f"({server.RAG_STORE_DTYPE}, ann={'on' if server.RAG_STORE['ann'] else 'off'}), "
+        f"readers={args.readers} writers={args.writers}"
+    )
+
+    _phase("idle", chunks, embeds, queries, copies, 0, args)
+    _phase("indexing", chunks, embeds, queries, copies, args.writers, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compare RAG scoring latency: legacy Python loop vs NumPy matrix scoring.
+
+Usage: python benchmarks/bench_retrieval.py [--dim 384] [--top-k 6]
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _legacy_scores(query, embeds, norms, top_k):
+    qn = math.sqrt(sum(x * x for x in query))
+    scored = []
+    for idx, emb in enumerate(embeds):
+        denom = qn * norms[idx]
+        cosine = sum(l * r for l, r in zip(query, emb)) / denom if denom else 0.0
+        scored.append((cosine, idx))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [idx for _, idx in scored[:top_k]]
+
+
+def _numpy_scores(query, matrix, top_k):
+    scores = matrix @ query
+    return server._top_k_indices(scores, top_k)
+
+
+def _timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=server.DEFAULT_TOP_K)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8} {'legacy_ms':>10} {'numpy_ms':>10} {'speedup':>8}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        matrix = rng.standard_normal((n, args.dim)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        query = matrix[rng.integers(n)].copy()
+
+        embeds_list = matrix.tolist()
+        norms = [1.0] * n
+        query_list = query.tolist()
+
+        legacy_ms = _timed(lambda: _legacy_scores(query_list, embeds_list, norms, args.top_k), 1)
+        numpy_ms = _timed(lambda: _numpy_scores(query, matrix, args.top_k), 20)
+        print(f"{n:>8} {legacy_ms:>10.2f} {numpy_ms:>10.3f} {legacy_ms / numpy_ms:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Region-of-interest cropping on a recorded clip: cost and accuracy.
+
+Replays every frame of a video file through the /ws (or /ws/emotion)
+frame pipeline twice, with the ROI tracker off and on, the same way a
+socket would: JPEG-encoded binary frames in, landmarks out. Reports
+inference_ms, total per-frame time (decode + crop + inference) and, for
+accuracy, detection agreement and mean landmark distance between the two
+runs in pixels.
+
+Usage: python benchmarks/bench_roi.py clip.mp4 [--endpoint /ws/emotion] [--width 640]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _load_frames(path, width, limit):
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    height = 0
+    while len(frames) < limit:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        height = round(frame.shape[0] * width / frame.shape[1])
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ok, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
+        header = server.FRAME_HEADER.pack(
+            server.FRAME_VERSION,
+            server.FRAME_FORMAT_JPEG,
+            width,
+            height,
+            0,
+            len(frames),
+            len(frames) * 1000.0 / fps,
+        )
+        frames.append(header + jpg.tobytes())
+    capture.release()
+    return frames, height
+
+
+def _session(endpoint, roi):
+    session = {"id": f"bench-{roi}", "roi": server._new_roi_state() if roi else None}
+    if endpoint == "/ws":
+        model_path = server._ensure_model_file()
+        server._gesture_session_graph(session, model_path, server.DEFAULT_MP_CONFIG.copy())
+    else:
+        session["key"] = server._graph_pool_key("face_mesh")
+    return session
+
+
+def _replay(endpoint, frames, roi):
+    process = server._process_gesture_frame if endpoint == "/ws" else server._process_emotion_frame
+    key = "landmarks" if endpoint == "/ws" else "guides"
+    session = _session(endpoint, roi)
+    points, inference, total, cropped = [], [], [], 0
+    for data in frames:
+        start = time.perf_counter()
+        payload = process(session, None, data)
+        total.append((time.perf_counter() - start) * 1000.0)
+        metrics = payload.get("metrics") or {}
+        inference.append(metrics.get("inference_ms", 0.0))
+        cropped += 1 if metrics.get("roi") else 0
+        points.append(payload.get(key))
+    return points, np.asarray(inference), np.asarray(total), cropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("clip")
+    parser.add_argument("--endpoint", default="/ws", choices=["/ws", "/ws/emotion"])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--limit", type=int, default=900)
+    args = parser.parse_args()
+
+    frames, height = _load_frames(args.clip, args.width, args.limit)
+    if not frames:
+        raise SystemExit(f"no frames read from {args.clip}")
+    print(f"{args.endpoint}: {len(frames)} frames at {args.width}px")
+
+    runs = {}
+    for roi in (False, True):
+        points, inference, total, cropped = _replay(args.endpoint, frames, roi)
+        runs[roi] = points
+        print(
+            f"  roi={'on ' if roi else 'off'} inference mean={inference.mean():6.2f}ms "
+            f"p95={np.percentile(inference, 95):6.2f}ms total mean={total.mean():6.2f}ms "
+            f"cropped={cropped}/{len(frames)}"
+        )
+
+    agree = 0
+    errors = []
+    for full, crop in zip(runs[False], runs[True]):
+        if (full is None) == (crop is None):
+            agree += 1
+        if full is not None and crop is not None and full.shape == crop.shape:
+            delta = (full[..., :2] - crop[..., :2]) * [args.width, height]
+            errors.append(float(np.linalg.norm(delta, axis=-1).mean()))
+    print(f"  detection agreement {agree}/{len(frames)}")
+    if errors:
+        print(
+            f"  landmark distance mean={np.mean(errors):.2f}px "
+            f"p95={np.percentile(errors, 95):.2f}px"
+        )
+
+
+if __name__ == "__main__":
+    main()
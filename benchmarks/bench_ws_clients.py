@@ -0,0 +1,133 @@
+"""Per-client frame rate and latency on /ws with 1, 4 and 16 concurrent clients.
+
+Runs the app in-process with uvicorn. Each client sends binary JPEG frames
+in lock-step (next frame once the previous result arrived, like the
+browser) and records round-trip latency. With inference off the event loop,
+per-client FPS should degrade with available cores instead of collapsing
+as soon as a second client connects.
+
+The rate level each client ended on (see RATE_LEVELS in server.py) shows
+how far the adaptive controller had to degrade it. The benchmark sends at
+full speed regardless, so the level is informative only.
+
+Usage: python benchmarks/bench_ws_clients.py [--clients 1,4,16] [--image hand.jpg]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import uvicorn
+import websockets
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def _jpeg(image_path, width, height):
+    if image_path:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise SystemExit(f"cannot read {image_path}")
+        image = cv2.resize(image, (width, height))
+    else:
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    ok, jpg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    return jpg.tobytes()
+
+
+def _frame(jpg, width, height, frame_id):
+    header = server.FRAME_HEADER.pack(
+        server.FRAME_VERSION,
+        server.FRAME_FORMAT_JPEG,
+        width,
+        height,
+        0,
+        frame_id,
+        time.time() * 1000.0,
+    )
+    return header + jpg
+
+
+async def _client(url, jpg, width, height, duration, skip_hello):
+    latencies = []
+    server_ms = []
+    level = 0
+    async with websockets.connect(url, max_size=None) as ws:
+        if skip_hello:
+            await ws.recv()  # initial config message
+        deadline = time.perf_counter() + duration
+        frame_id = 0
+        while time.perf_counter() < deadline:
+            frame_id += 1
+            start = time.perf_counter()
+            await ws.send(_frame(jpg, width, height, frame_id))
+            reply = json.loads(await ws.recv())
+            while reply.get("type") == "rate":
+                reply = json.loads(await ws.recv())
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            metrics = reply.get("metrics") or {}
+            if "server_ms" in metrics:
+                server_ms.append(metrics["server_ms"])
+            level = (reply.get("rate") or {}).get("level", level)
+    return latencies, server_ms, level
+
+
+async def _run(url, clients, jpg, width, height, duration, skip_hello):
+    results = await asyncio.gather(
+        *(
+            _client(url, jpg, width, height, duration, skip_hello)
+            for _ in range(clients)
+        )
+    )
+    fps = [len(lat) / duration for lat, _, _ in results]
+    lat = np.concatenate([np.asarray(lat) for lat, _, _ in results if lat] or [np.zeros(1)])
+    srv = np.concatenate([np.asarray(s) for _, s, _ in results if s] or [np.zeros(1)])
+    levels = [level for _, _, level in results]
+    print(
+        f"clients={clients:>3} fps/client min={min(fps):5.1f} "
+        f"mean={np.mean(fps):5.1f} total={sum(fps):6.1f} "
+        f"p50={np.percentile(lat, 50):7.1f}ms p95={np.percentile(lat, 95):7.1f}ms "
+        f"server p95={np.percentile(srv, 95):7.1f}ms rate levels={min(levels)}-{max(levels)}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", default="1,4,16")
+    parser.add_argument("--endpoint", default="/ws", choices=["/ws", "/ws/emotion"])
+    parser.add_argument("--image", default="")
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    app_server = uvicorn.Server(
+        uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(app_server.serve())
+    while not app_server.started:
+        await asyncio.sleep(0.05)
+
+    url = f"ws://127.0.0.1:{args.port}{args.endpoint}"
+    jpg = _jpeg(args.image, args.width, args.height)
+    print(f"{args.endpoint} frame={len(jpg)}B vision_workers={server.VISION_WORKERS}")
+    for clients in [int(c) for c in args.clients.split(",") if c]:
+        await _run(
+            url, clients, jpg, args.width, args.height, args.duration, args.endpoint == "/ws"
+        )
+
+    app_server.should_exit = True
+    await serve_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Connect latency and resident memory as /ws sockets pile up.
+
+Runs the app in-process with uvicorn, opens --sockets connections one after
+the other (keeping them open, like a classroom joining), and records the
+time from connect to the first config message. Resident memory and graph
+pool counters come from /api/vision/stats before and after. Each socket
+then flips its config once to show the cost of config changes.
+
+Run it on a tree without the graph pool to get the "before" numbers.
+
+Usage: python benchmarks/bench_ws_connect.py [--sockets 30]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import uvicorn
+import websockets
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+async def _stats(base_url):
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{base_url}/api/vision/stats")
+        return response.json() if response.status_code == 200 else {}
+
+
+def _report(name, latencies):
+    lat = np.asarray(latencies)
+    print(
+        f"{name:>14} first={lat[0]:7.1f}ms p50={np.percentile(lat, 50):7.1f}ms "
+        f"p95={np.percentile(lat, 95):7.1f}ms max={lat.max():7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=30)
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    app_server = uvicorn.Server(
+        uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(app_server.serve())
+    while not app_server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    before = await _stats(base_url)
+
+    sockets = []
+    connect_ms = []
+    for _ in range(args.sockets):
+        start = time.perf_counter()
+        ws = await websockets.connect(url, max_size=None)
+        await ws.recv()  # config message, sent once a graph is ready
+        connect_ms.append((time.perf_counter() - start) * 1000.0)
+        sockets.append(ws)
+    _report("connect", connect_ms)
+
+    config_ms = []
+    for ws in sockets:
+        start = time.perf_counter()
+        await ws.send(json.dumps({"type": "config", "config": {"num_hands": 2}}))
+        await ws.recv()
+        config_ms.append((time.perf_counter() - start) * 1000.0)
+    _report("config change", config_ms)
+
+    after = await _stats(base_url)
+    for ws in sockets:
+        await ws.close()
+
+    rss_before = before.get("rss_mb")
+    rss_after = after.get("rss_mb")
+    if rss_before is not None and rss_after is not None:
+        print(f"rss: {rss_before:.0f}MB -> {rss_after:.0f}MB (+{rss_after - rss_before:.0f}MB)")
+    print(f"pool: {json.dumps(after.get('pool'))}")
+
+    app_server.should_exit = True
+    await serve_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""Check that /ws video frames keep flowing while many chats are in flight.
+
+Starts a stub OpenAI-compatible server that answers after a fixed delay,
+runs the app in-process with uvicorn, then measures /ws frame round trips
+alone and again while N concurrent /api/chat requests wait on the stub.
+
+Usage: python benchmarks/load_llm_ws.py [--chats 20] [--llm-delay 5]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import httpx
+import numpy as np
+import uvicorn
+import websockets
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+async def _serve_stub(reader, writer, delay):
+    # Minimal HTTP/1.1 keep-alive server, enough for the pooled client.
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.decode("latin-1").split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            await reader.readexactly(length)
+            if not head.startswith(b"GET"):
+                # Health checks (GET /models) answer at once.
+                await asyncio.sleep(delay)
+            body = json.dumps(
+                {
+                    "model": "stub",
+                    "choices": [{"message": {"role": "assistant", "content": "ok"}}],
+                    "usage": {"completion_tokens": 1},
+                }
+            ).encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _frame_payload(width=480, height=360):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    ok, jpg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    return "data:image/jpeg;base64," + base64.b64encode(jpg.tobytes()).decode("ascii")
+
+
+async def _stream_frames(url, payload, duration):
+    latencies = []
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.recv()  # initial config message
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await ws.send(payload)
+            await ws.recv()
+            latencies.append((time.perf_counter() - start) * 1000.0)
+    return latencies
+
+
+def _report(name, latencies, duration):
+    lat = np.asarray(latencies) if latencies else np.zeros(1)
+    print(
+        f"{name:>10} fps={len(latencies) / duration:6.1f} "
+        f"p50={np.percentile(lat, 50):7.1f}ms p95={np.percentile(lat, 95):7.1f}ms "
+        f"max={lat.max():7.1f}ms"
+    )
+
+
+async def _chat(client, base_url):
+    start = time.perf_counter()
+    response = await client.post(
+        f"{base_url}/api/chat",
+        json={"messages": [{"role": "user", "content": "Bonjour"}]},
+        timeout=120,
+    )
+    return response.status_code, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--llm-delay", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=4.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stub-port", type=int, default=8766)
+    args = parser.parse_args()
+
+    stub = await asyncio.start_server(
+        lambda r, w: _serve_stub(r, w, args.llm_delay), "127.0.0.1", args.stub_port
+    )
+    server.LLM_BACKENDS = [f"http://127.0.0.1:{args.stub_port}/v1"]
+
+    app_server = uvicorn.Server(
+        uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(app_server.serve())
+    while not app_server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/ws"
+    payload = _frame_payload()
+
+    idle = await _stream_frames(ws_url, payload, args.duration)
+    _report("idle", idle, args.duration)
+
+    async with httpx.AsyncClient() as client:
+        chats = [asyncio.create_task(_chat(client, base_url)) for _ in range(args.chats)]
+        await asyncio.sleep(0.2)
+        loaded = await _stream_frames(ws_url, payload, args.duration)
+        _report(f"{args.chats} chats", loaded, args.duration)
+        outcomes = await asyncio.gather(*chats)
+
+    statuses = sorted({status for status, _ in outcomes})
+    slowest = max(elapsed for _, elapsed in outcomes)
+    print(f"chats: statuses={statuses} slowest={slowest:.1f}s")
+    async with httpx.AsyncClient() as client:
+        stats = (await client.get(f"{base_url}/api/llm/stats")).json()
+    print(f"llm stats: {json.dumps(stats)}")
+
+    app_server.should_exit = True
+    await serve_task
+    stub.close()
+    await stub.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
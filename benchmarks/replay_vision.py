@@ -0,0 +1,364 @@
+"""Replay a recorded /ws or /ws/emotion session and report hot-path latency.
+
+Input is a .vrec capture (set server.VISION_RECORD_DIR and use the page
+normally) or any video file, which is turned into binary JPEG frames at
+the clip's frame rate.
+
+Two modes:
+  ws      runs the app in-process with uvicorn and replays through the real
+          WebSocket endpoint, each client behaving like the browser (one
+          frame in flight, frames due while waiting are dropped).
+  direct  calls the frame processors, temporal filter and result encoder
+          directly from worker threads, with no network or event loop.
+
+--speed scales recorded timing (2 = twice as fast, 0 = as fast as the
+pipeline allows, lock-step). --clients replays the same capture on that
+many concurrent sessions. Results are printed and, with --out, written as
+JSON (with the git commit) so runs can be diffed; --baseline prints the
+change against an earlier JSON report.
+
+Usage:
+  python benchmarks/replay_vision.py session.vrec --mode ws --clients 4 --out run.json
+  python benchmarks/replay_vision.py clip.mp4 --endpoint /ws/emotion --mode direct
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import uvicorn
+import websockets
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+METRICS = ("round_trip_ms", "queue_ms", "decode_ms", "inference_ms", "server_ms", "serialize_ms")
+
+
+def _entries_from_video(path, width):
+    capture = cv2.VideoCapture(str(path))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    entries = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        height = round(frame.shape[0] * width / frame.shape[1])
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ok, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
+        elapsed = len(entries) / fps
+        header = server.FRAME_HEADER.pack(
+            server.FRAME_VERSION,
+            server.FRAME_FORMAT_JPEG,
+            width,
+            height,
+            0,
+            len(entries),
+            elapsed * 1000.0,
+        )
+        entries.append((elapsed, None, header + jpg.tobytes()))
+    capture.release()
+    return entries
+
+
+def _is_control(text):
+    return text is not None and text.lstrip().startswith("{")
+
+
+def _new_stats():
+    stats = {key: [] for key in METRICS}
+    stats.update(sent=0, results=0, client_dropped=0, server_dropped=0, elapsed=0.0)
+    return stats
+
+
+def _parse_message(message):
+    if isinstance(message, bytes):
+        if len(message) < server.RESULT_HEADER.size:
+            return None
+        json_len = server.RESULT_HEADER.unpack_from(message)[-1]
+        return json.loads(message[len(message) - json_len :])
+    return json.loads(message)
+
+
+async def _ws_client(url, entries, speed, wait_hello):
+    stats = _new_stats()
+    async with websockets.connect(url, max_size=None) as ws:
+        if wait_hello:
+            await ws.recv()  # initial config message
+        idle = asyncio.Event()
+        idle.set()
+        sent_at = [None]
+
+        async def receive():
+            async for message in ws:
+                msg = _parse_message(message)
+                if msg is None or msg.get("type") in ("config", "rate", "error"):
+                    continue
+                if sent_at[0] is not None:
+                    stats["round_trip_ms"].append((time.perf_counter() - sent_at[0]) * 1000.0)
+                metrics = msg.get("metrics") or {}
+                for key in METRICS:
+                    if key in metrics:
+                        stats[key].append(metrics[key])
+                stats["server_dropped"] = metrics.get("dropped", stats["server_dropped"])
+                stats["results"] += 1
+                sent_at[0] = None
+                idle.set()
+
+        receiver = asyncio.create_task(receive())
+        start = time.perf_counter()
+        for elapsed, text, data in entries:
+            if speed > 0:
+                delay = start + elapsed / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if _is_control(text):
+                await ws.send(text)
+                continue
+            if speed <= 0:
+                await idle.wait()
+            elif not idle.is_set():
+                stats["client_dropped"] += 1
+                continue
+            idle.clear()
+            sent_at[0] = time.perf_counter()
+            await ws.send(data if data is not None else text)
+            stats["sent"] += 1
+        try:
+            await asyncio.wait_for(idle.wait(), 5.0)
+        except asyncio.TimeoutError:
+            pass
+        stats["elapsed"] = time.perf_counter() - start
+        receiver.cancel()
+    return stats
+
+
+async def _run_ws(endpoint, entries, args):
+    app_server = uvicorn.Server(
+        uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(app_server.serve())
+    while not app_server.started:
+        await asyncio.sleep(0.05)
+    url = f"ws://127.0.0.1:{args.port}{endpoint}?landmarks={args.landmarks}"
+    try:
+        return await asyncio.gather(
+            *(
+                _ws_client(url, entries, args.speed, endpoint == "/ws")
+                for _ in range(args.clients)
+            )
+        )
+    finally:
+        app_server.should_exit = True
+        await serve_task
+
+
+def _direct_session(endpoint, index):
+    session = {
+        "id": f"replay-{index}",
+        "filter": server._new_temporal_filter(),
+        "roi": server._new_roi_state() if server.ROI_ENABLED else None,
+    }
+    if endpoint == "/ws":
+        model_path = server._ensure_model_file()
+        server._gesture_session_graph(session, model_path, server.DEFAULT_MP_CONFIG.copy())
+    else:
+        session["key"] = server._graph_pool_key("face_mesh")
+    return session
+
+
+def _direct_client(endpoint, entries, speed, encoding, index):
+    stats = _new_stats()
+    session = _direct_session(endpoint, index)
+    process = server._process_gesture_frame if endpoint == "/ws" else server._process_emotion_frame
+    frames = [entry for entry in entries if not _is_control(entry[1])]
+    start = time.perf_counter()
+    for i, (elapsed, text, data) in enumerate(frames):
+        if speed > 0:
+            now = time.perf_counter()
+            due = start + elapsed / speed
+            if now < due:
+                time.sleep(due - now)
+            elif i + 1 < len(frames) and now > start + frames[i + 1][0] / speed:
+                # The next frame is already due: latest frame wins.
+                stats["client_dropped"] += 1
+                continue
+        started = time.perf_counter()
+        payload = process(session, text, data)
+        processed = time.perf_counter()
+        server._apply_temporal_filter(session["filter"], payload)
+        server._encode_result(payload, encoding)
+        finished = time.perf_counter()
+        stats["sent"] += 1
+        stats["results"] += 1
+        stats["round_trip_ms"].append((finished - started) * 1000.0)
+        stats["server_ms"].append((finished - started) * 1000.0)
+        stats["serialize_ms"].append((finished - processed) * 1000.0)
+        metrics = payload.get("metrics") or {}
+        for key in ("decode_ms", "inference_ms"):
+            if key in metrics:
+                stats[key].append(metrics[key])
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def _run_direct(endpoint, entries, args):
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        futures = [
+            pool.submit(_direct_client, endpoint, entries, args.speed, args.landmarks, i)
+            for i in range(args.clients)
+        ]
+        return [future.result() for future in futures]
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summarize(clients):
+    fps = [s["results"] / s["elapsed"] if s["elapsed"] else 0.0 for s in clients]
+    return {
+        "frames_sent": sum(s["sent"] for s in clients),
+        "results": sum(s["results"] for s in clients),
+        "dropped": {
+            "client": sum(s["client_dropped"] for s in clients),
+            "server": sum(s["server_dropped"] for s in clients),
+        },
+        "fps": {
+            "per_client_min": round(min(fps), 2),
+            "per_client_mean": round(float(np.mean(fps)), 2),
+            "aggregate": round(sum(fps), 2),
+        },
+        "latency_ms": {
+            key: _percentiles([v for s in clients for v in s[key]]) for key in METRICS
+        },
+    }
+
+
+def _print_report(report):
+    results = report["results"]
+    print(
+        f"{report['mode']} {report['endpoint']} clients={report['clients']} "
+        f"speed={report['speed']} commit={report['commit']}"
+    )
+    print(
+        f"  fps aggregate={results['fps']['aggregate']} "
+        f"per-client min={results['fps']['per_client_min']} "
+        f"sent={results['frames_sent']} dropped={results['dropped']} "
+        f"peak_rss={report['peak_rss_mb']}MB"
+    )
+    for key, stats in results["latency_ms"].items():
+        if stats:
+            print(
+                f"  {key:>14} p50={stats['p50']:8.2f} p95={stats['p95']:8.2f} "
+                f"p99={stats['p99']:8.2f} max={stats['max']:8.2f}"
+            )
+
+
+def _print_comparison(report, baseline):
+    print(f"  vs {baseline.get('commit')}:")
+    old_fps = baseline["results"]["fps"]["aggregate"]
+    new_fps = report["results"]["fps"]["aggregate"]
+    if old_fps:
+        print(f"  {'fps':>14} {old_fps:8.2f} -> {new_fps:8.2f} ({new_fps / old_fps - 1:+.1%})")
+    for key, stats in report["results"]["latency_ms"].items():
+        old = baseline["results"]["latency_ms"].get(key)
+        if not stats or not old or not old["p95"]:
+            continue
+        change = stats["p95"] / old["p95"] - 1
+        print(f"  {key:>14} p95 {old['p95']:8.2f} -> {stats['p95']:8.2f} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording", help=".vrec capture or video file")
+    parser.add_argument("--mode", default="ws", choices=["ws", "direct"])
+    parser.add_argument("--endpoint", choices=["/ws", "/ws/emotion"])
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--landmarks", choices=sorted(server.LANDMARK_ENCODINGS))
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--out")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    path = Path(args.recording)
+    meta = {}
+    if path.suffix == ".vrec":
+        meta, entries = server._read_recording(path)
+    else:
+        entries = _entries_from_video(path, args.width)
+    if not entries:
+        raise SystemExit(f"nothing to replay in {path}")
+    endpoint = args.endpoint or meta.get("endpoint") or "/ws"
+    args.landmarks = args.landmarks or meta.get("encoding") or "json"
+
+    if args.mode == "ws":
+        clients = asyncio.run(_run_ws(endpoint, entries, args))
+    else:
+        clients = _run_direct(endpoint, entries, args)
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "recording": str(path),
+        "mode": args.mode,
+        "endpoint": endpoint,
+        "clients": args.clients,
+        "speed": args.speed,
+        "landmarks": args.landmarks,
+        "roi": server.ROI_ENABLED,
+        "results": _summarize(clients),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    _print_report(report)
+    if args.baseline:
+        _print_comparison(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
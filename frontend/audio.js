@@ -1,3 +1,4 @@
+import { AUDIO_CHUNK_MS } from "./constants.js";
 import { dom } from "./dom.js";
 import { currentPage, state } from "./state.js";
 import { updateBadges } from "./ui.js";
@@ -5,6 +6,7 @@ import { updateBadges } from "./ui.js";
 let recorder = null;
 let chunks = [];
 let streamRef = null;
+let live = null;
 
 const STOPWORDS = new Set([
   "je", "tu", "il", "elle", "nous", "vous", "ils", "elles",
@@ -169,6 +171,83 @@ async function transcribeAudio(blob) {
   return data?.text || "";
 }
 
+function liveText() {
+  return [...live.segments, live.partial].filter(Boolean).join(" ");
+}
+
+function flushLiveChunks() {
+  if (!live || live.socket.readyState !== WebSocket.OPEN) return;
+  // The first chunk carries the container header: nothing may be skipped.
+  while (live.sent < chunks.length) {
+    live.socket.send(chunks[live.sent]);
+    live.sent += 1;
+  }
+}
+
+function openLiveTranscription(language) {
+  const endpoint = currentPage.audioStreamEndpoint;
+  if (!endpoint || typeof WebSocket === "undefined") return null;
+  const protocol = location.protocol === "https:" ? "wss" : "ws";
+  const socket = new WebSocket(
+    `${protocol}://${location.host}${endpoint}?language=${encodeURIComponent(language)}`
+  );
+  const session = { socket, sent: 0, segments: [], partial: "", failed: false };
+  session.done = new Promise((resolve, reject) => {
+    socket.onopen = () => flushLiveChunks();
+    socket.onmessage = (event) => {
+      let msg = {};
+      try {
+        msg = JSON.parse(event.data);
+      } catch (err) {
+        return;
+      }
+      if (msg.type === "queue") {
+        setAudioStatus(`Transcription en file d'attente (position ${msg.position})...`);
+        return;
+      }
+      if (msg.type === "partial") {
+        session.partial = msg.text || "";
+      } else if (msg.type === "segment") {
+        session.segments[msg.segment] = msg.text || "";
+        session.partial = "";
+      } else if (msg.type === "final") {
+        resolve(msg.text || "");
+        return;
+      } else if (msg.type === "error") {
+        session.failed = true;
+        reject(new Error(msg.message || "Erreur serveur."));
+        return;
+      }
+      if (recorder) setAudioStatus(`En direct : ${liveText()}`);
+    };
+    socket.onerror = () => {
+      session.failed = true;
+      reject(new Error("Connexion audio interrompue."));
+    };
+    socket.onclose = () => {
+      session.failed = true;
+      reject(new Error("Connexion audio fermee."));
+    };
+  });
+  // Failures are handled in onstop, where the upload path takes over.
+  session.done.catch(() => {});
+  return session;
+}
+
+async function finishLiveTranscription(session) {
+  flushLiveChunks();
+  if (session.failed || session.socket.readyState !== WebSocket.OPEN) {
+    session.socket.close();
+    throw new Error("Flux audio indisponible.");
+  }
+  session.socket.send(JSON.stringify({ type: "stop" }));
+  try {
+    return await session.done;
+  } finally {
+    session.socket.close();
+  }
+}
+
 async function handleRecord() {
   if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
     setAudioStatus("Microphone non disponible.");
@@ -179,15 +258,17 @@ async function handleRecord() {
     streamRef = await navigator.mediaDevices.getUserMedia({ audio: true });
     recorder = new MediaRecorder(streamRef);
     chunks = [];
+    live = openLiveTranscription(dom.audioLanguage ? dom.audioLanguage.value : "fr");
     recorder.ondataavailable = (event) => {
       if (event.data && event.data.size > 0) {
         chunks.push(event.data);
+        flushLiveChunks();
       }
     };
     recorder.onstop = async () => {
       setAudioButtons(false);
       const blob = new Blob(chunks, { type: recorder.mimeType || "audio/webm" });
-      chunks = [];
+      const session = live;
       recorder = null;
       if (streamRef) {
         streamRef.getTracks().forEach((track) => track.stop());
@@ -199,14 +280,26 @@ async function handleRecord() {
       }
       try {
         setAudioStatus("Transcription en cours...");
-        const text = await transcribeAudio(blob);
+        let text = null;
+        if (session) {
+          try {
+            text = await finishLiveTranscription(session);
+          } catch (err) {
+            text = null;
+          }
+        }
+        if (text === null) text = await transcribeAudio(blob);
         setAudioStatus(null);
         addAttempt(text);
       } catch (err) {
         setAudioStatus(err.message || "Erreur inconnue.");
+      } finally {
+        chunks = [];
+        live = null;
       }
     };
-    recorder.start();
+    // With a live session, chunks stream out while the user is still speaking.
+    recorder.start(live ? AUDIO_CHUNK_MS : undefined);
     setAudioButtons(true);
     setAudioStatus("Enregistrement en cours...");
   } catch (err) {
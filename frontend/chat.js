@@ -2,6 +2,8 @@ import { dom } from "./dom.js";
 import { currentPage, state } from "./state.js";
 import { updateBadges } from "./ui.js";
 
+const INDEX_POLL_MS = 500;
+
 function isRagMode() {
   return currentPage.chatMode === "rag";
 }
@@ -43,6 +45,56 @@ function addMessage(role, content) {
   renderMessages();
 }
 
+function updateLastMessage(content) {
+  const last = state.chatMessages[state.chatMessages.length - 1];
+  if (!last) return;
+  last.content = content;
+  if (!dom.chatLog) return;
+  const bubbles = dom.chatLog.querySelectorAll(".chat-bubble");
+  const bubble = bubbles[bubbles.length - 1];
+  if (!bubble) return;
+  bubble.textContent = content;
+  dom.chatLog.scrollTop = dom.chatLog.scrollHeight;
+}
+
+async function readChatStream(response, onEvent) {
+  // The server streams newline-delimited JSON events.
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let newline = buffer.indexOf("\n");
+    while (newline >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      newline = buffer.indexOf("\n");
+      if (!line) continue;
+      let event = null;
+      try {
+        event = JSON.parse(line);
+      } catch (err) {
+        continue;
+      }
+      onEvent(event);
+    }
+  }
+}
+
+function markChatBadge() {
+  if (isRagMode()) {
+    if (!state.badgeState.mission4) {
+      state.badgeState.mission4 = true;
+      updateBadges();
+    }
+  } else if (!state.badgeState.mission3) {
+    state.badgeState.mission3 = true;
+    updateBadges();
+  }
+}
+
 function updateRagCounts(counts) {
   if (!dom.ragCounts) return;
   const chunks = counts?.chunks ?? 0;
@@ -108,6 +160,29 @@ async function resetRagStore() {
   }
 }
 
+function describeIndexProgress(job) {
+  const files = `${job.files_done ?? 0}/${job.files?.length ?? 0} fichiers`;
+  const pages = job.pages_total ? ` \u00b7 ${job.pages_done}/${job.pages_total} pages` : "";
+  const chunks = ` \u00b7 ${job.chunks_embedded ?? 0} chunks`;
+  return `Indexation en cours... ${files}${pages}${chunks}`;
+}
+
+async function waitForIndexJob(endpoint, job) {
+  let current = job;
+  while (current.status === "queued" || current.status === "running") {
+    setChatStatus(describeIndexProgress(current));
+    updateRagCounts({ chunks: current.chunks, sources: current.sources });
+    await new Promise((resolve) => setTimeout(resolve, INDEX_POLL_MS));
+    const response = await fetch(`${endpoint}/${encodeURIComponent(current.job_id)}`);
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      throw new Error(data?.detail || "Erreur serveur.");
+    }
+    current = data;
+  }
+  return current;
+}
+
 async function indexRagDocuments() {
   if (!dom.ragFiles || !dom.ragFiles.files || dom.ragFiles.files.length === 0) {
     setChatStatus("Ajoutez des fichiers avant d'indexer.");
@@ -123,11 +198,14 @@ async function indexRagDocuments() {
   setChatBusy(true);
   try {
     const response = await fetch(endpoint, { method: "POST", body: formData });
-    const data = await response.json().catch(() => ({}));
+    let data = await response.json().catch(() => ({}));
     if (!response.ok) {
       const detail = data?.detail || "Erreur serveur.";
       throw new Error(detail);
     }
+    if (data?.job_id) {
+      data = await waitForIndexJob(endpoint, data);
+    }
     updateRagCounts({ chunks: data?.chunks, sources: data?.sources });
     if (data?.errors && data.errors.length) {
       setChatStatus(data.errors.join(" | "));
@@ -155,7 +233,8 @@ async function sendChatMessage(text) {
   try {
     const payload = {
       system_prompt: systemPrompt,
-      messages: state.chatMessages
+      messages: state.chatMessages,
+      stream: true
     };
     if (isRagMode()) {
       const topK = dom.ragTopK ? Number(dom.ragTopK.value) : 6;
@@ -169,6 +248,32 @@ async function sendChatMessage(text) {
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify(payload)
     });
+    const contentType = response.headers.get("content-type") || "";
+    if (response.ok && response.body && contentType.includes("ndjson")) {
+      let reply = "";
+      addMessage("assistant", "");
+      try {
+        await readChatStream(response, (event) => {
+          if (event.type === "sources") {
+            renderSources(event.sources || []);
+          } else if (event.type === "token") {
+            reply += event.content || "";
+            updateLastMessage(reply);
+          } else if (event.type === "error") {
+            throw new Error(event.message || "Erreur serveur.");
+          }
+        });
+      } catch (streamErr) {
+        if (!reply) {
+          state.chatMessages.pop();
+          renderMessages();
+        }
+        throw streamErr;
+      }
+      if (!reply) updateLastMessage("Aucune reponse.");
+      markChatBadge();
+      return;
+    }
     let data = {};
     try {
       data = await response.json();
@@ -184,14 +289,8 @@ async function sendChatMessage(text) {
 
     if (isRagMode()) {
       renderSources(data?.sources || []);
-      if (!state.badgeState.mission4) {
-        state.badgeState.mission4 = true;
-        updateBadges();
-      }
-    } else if (!state.badgeState.mission3) {
-      state.badgeState.mission3 = true;
-      updateBadges();
     }
+    markChatBadge();
   } catch (err) {
     setChatStatus(err.message || "Erreur inconnue.");
   } finally {
@@ -7,3 +7,10 @@ export const DEFAULT_MP_CONFIG = {
   min_hand_presence_confidence: 0.5,
   min_tracking_confidence: 0.5
 };
+// "jpeg" | "webp" | "rgba" send binary frames, "dataurl" keeps the legacy text protocol.
+export const FRAME_ENCODING = "jpeg";
+export const FRAME_RGBA_SCALE = 0.5;
+// Result landmarks: "json" (objects), "f32" or "i16" (packed binary messages).
+export const LANDMARK_ENCODING = "i16";
+// MediaRecorder timeslice for live transcription over /ws/audio.
+export const AUDIO_CHUNK_MS = 250;
@@ -2,6 +2,7 @@ import { dom } from "./dom.js";
 import { currentPage, state } from "./state.js";
 import { updateBadges } from "./ui.js";
 import { updateGestureBar } from "./gesture.js";
+import { groupSize, landmarkCoord } from "./landmarks.js";
 
 function updateFps() {
   const now = performance.now();
@@ -96,14 +97,15 @@ export function drawFaceGuides(guides) {
   dom.ctx.strokeStyle = "#6fe2c7";
   dom.ctx.fillStyle = "#ffd166";
 
-  Object.values(guides).forEach((segment) => {
-    if (!Array.isArray(segment) || segment.length < 2) return;
-    const [start, end] = segment;
-    if (!start || !end) return;
-    const sx = start.x * dom.canvas.width;
-    const sy = start.y * dom.canvas.height;
-    const ex = end.x * dom.canvas.width;
-    const ey = end.y * dom.canvas.height;
+  // Packed guides are (segment, endpoint, xy); JSON guides are named segments.
+  const segments = guides.coords ? guides : Object.values(guides);
+  for (let segment = 0; segment < segments.length; segment += 1) {
+    if (groupSize(segments, segment) < 2) continue;
+    const sx = landmarkCoord(segments, segment, 0, 0) * dom.canvas.width;
+    const sy = landmarkCoord(segments, segment, 0, 1) * dom.canvas.height;
+    const ex = landmarkCoord(segments, segment, 1, 0) * dom.canvas.width;
+    const ey = landmarkCoord(segments, segment, 1, 1) * dom.canvas.height;
+    if ([sx, sy, ex, ey].some(Number.isNaN)) continue;
     dom.ctx.beginPath();
     dom.ctx.moveTo(sx, sy);
     dom.ctx.lineTo(ex, ey);
@@ -113,7 +115,7 @@ export function drawFaceGuides(guides) {
     dom.ctx.arc(sx, sy, 5, 0, Math.PI * 2);
     dom.ctx.arc(ex, ey, 5, 0, Math.PI * 2);
     dom.ctx.fill();
-  });
+  }
 }
 
 export function updateEmotionMetrics(payload) {
@@ -2,6 +2,7 @@ import { dom } from "./dom.js";
 import { currentPage, state } from "./state.js";
 import { HOLD_FRAMES } from "./constants.js";
 import { updateBadges } from "./ui.js";
+import { groupSize, landmarkCoord, unpackGroup } from "./landmarks.js";
 
 export function drawLandmarks(landmarks) {
   if (!dom.ctx || !dom.canvas) return;
@@ -35,28 +36,29 @@ export function drawLandmarks(landmarks) {
   dom.ctx.strokeStyle = "#ff4d4d";
   dom.ctx.fillStyle = "#64f3a1";
 
-  for (const hand of landmarks) {
+  const width = dom.canvas.width;
+  const height = dom.canvas.height;
+  for (let hand = 0; hand < landmarks.length; hand += 1) {
+    const size = groupSize(landmarks, hand);
     for (const [start, end] of HAND_CONNECTIONS) {
-      const a = hand[start];
-      const b = hand[end];
-      if (!a || !b) continue;
-      const ax = a.x * dom.canvas.width;
-      const ay = a.y * dom.canvas.height;
-      const bx = b.x * dom.canvas.width;
-      const by = b.y * dom.canvas.height;
+      if (start >= size || end >= size) continue;
+      const ax = landmarkCoord(landmarks, hand, start, 0) * width;
+      const ay = landmarkCoord(landmarks, hand, start, 1) * height;
+      const bx = landmarkCoord(landmarks, hand, end, 0) * width;
+      const by = landmarkCoord(landmarks, hand, end, 1) * height;
       dom.ctx.beginPath();
       dom.ctx.moveTo(ax, ay);
       dom.ctx.lineTo(bx, by);
       dom.ctx.stroke();
     }
 
-    hand.forEach((point) => {
-      const x = point.x * dom.canvas.width;
-      const y = point.y * dom.canvas.height;
+    for (let i = 0; i < size; i += 1) {
+      const x = landmarkCoord(landmarks, hand, i, 0) * width;
+      const y = landmarkCoord(landmarks, hand, i, 1) * height;
       dom.ctx.beginPath();
       dom.ctx.arc(x, y, 5, 0, Math.PI * 2);
       dom.ctx.fill();
-    });
+    }
   }
 }
 
@@ -233,7 +235,7 @@ export function updateGestureMetrics(landmarks, gesture) {
     label = gesture.label;
     score = Number(gesture.score || 0);
   } else {
-    const fallback = scoreThumbUp(landmarks[0]);
+    const fallback = scoreThumbUp(unpackGroup(landmarks, 0));
     label = fallback.label;
     score = fallback.score;
   }
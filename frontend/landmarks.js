@@ -0,0 +1,66 @@
+// Compact result messages: must match RESULT_HEADER in server.py,
+// "<BBBBII" little-endian, then packed coordinates, then JSON metadata.
+const RESULT_HEADER_BYTES = 12;
+const RESULT_VERSION = 1;
+const RESULT_FORMAT_I16 = 2;
+const LANDMARK_I16_SCALE = 16384;
+
+const textDecoder = new TextDecoder();
+
+export function decodeResultMessage(buffer) {
+  if (buffer.byteLength < RESULT_HEADER_BYTES) return null;
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== RESULT_VERSION) return null;
+  const isI16 = view.getUint8(1) === RESULT_FORMAT_I16;
+  const groups = view.getUint8(2);
+  const dims = view.getUint8(3);
+  const points = view.getUint32(4, true);
+  const jsonBytes = view.getUint32(8, true);
+  const count = groups * points * dims;
+  const coords = isI16
+    ? new Int16Array(buffer, RESULT_HEADER_BYTES, count)
+    : new Float32Array(buffer, RESULT_HEADER_BYTES, count);
+  const jsonStart = RESULT_HEADER_BYTES + coords.byteLength;
+  const msg = JSON.parse(textDecoder.decode(new Uint8Array(buffer, jsonStart, jsonBytes)));
+  if (msg.packed) {
+    // Same shape as the JSON form for `.length`, read through landmarkCoord.
+    msg[msg.packed] = {
+      coords,
+      points,
+      dims,
+      length: groups,
+      scale: isI16 ? LANDMARK_I16_SCALE : 1
+    };
+  }
+  return msg;
+}
+
+export function groupSize(landmarks, group) {
+  if (landmarks.coords) return landmarks.points;
+  const points = landmarks[group];
+  return Array.isArray(points) ? points.length : 0;
+}
+
+// dim: 0 = x, 1 = y, 2 = z. Works on packed results and on JSON point lists.
+export function landmarkCoord(landmarks, group, index, dim) {
+  if (landmarks.coords) {
+    const base = (group * landmarks.points + index) * landmarks.dims;
+    return landmarks.coords[base + dim] / landmarks.scale;
+  }
+  const point = landmarks[group][index];
+  if (!point) return NaN;
+  return dim === 0 ? point.x : dim === 1 ? point.y : point.z;
+}
+
+export function unpackGroup(landmarks, group) {
+  if (!landmarks.coords) return landmarks[group];
+  const points = [];
+  for (let i = 0; i < landmarks.points; i += 1) {
+    points.push({
+      x: landmarkCoord(landmarks, group, i, 0),
+      y: landmarkCoord(landmarks, group, i, 1),
+      z: landmarks.dims > 2 ? landmarkCoord(landmarks, group, i, 2) : 0
+    });
+  }
+  return points;
+}
@@ -302,7 +302,7 @@ export const PAGE_CONFIG = {
     id: "mission5",
     heroTitle: "Mission 5 - Audio sobre",
     heroBody:
-      "Reconnaissance vocale locale, sans streaming. On accepte un peu d erreur pour baisser l empreinte.",
+      "Reconnaissance vocale locale, transcrite pendant que tu parles. On accepte un peu d erreur pour baisser l empreinte.",
     stageTitle: "Atelier audio",
     stageDesc: "Micro local + Whisper Tiny pour jouer la concision.",
     missionTitle: "Briefing audio",
@@ -317,6 +317,7 @@ export const PAGE_CONFIG = {
     usesCamera: false,
     showAudio: true,
     audioEndpoint: "/api/audio/transcribe",
+    audioStreamEndpoint: "/ws/audio",
     defaultThreshold: 0.6,
     steps: [
       {
@@ -4,15 +4,23 @@ import { setStatus } from "./ui.js";
 import { applyConfigToUI, sendConfig, showConfigWarning } from "./config.js";
 import { drawLandmarks, updateGestureMetrics, updateInferenceTime } from "./gesture.js";
 import { drawFaceGuides, updateEmotionMetrics } from "./emotion.js";
+import { FRAME_ENCODING, FRAME_RGBA_SCALE, LANDMARK_ENCODING } from "./constants.js";
+import { decodeResultMessage } from "./landmarks.js";
 
 const RECONNECT_BASE_MS = 1000;
 const RECONNECT_MAX_MS = 8000;
+const FRAME_HEADER_BYTES = 20;
+const FRAME_VERSION = 1;
+const FRAME_FORMATS = { jpeg: 1, webp: 2, rgba: 3 };
+// Level 0 of RATE_LEVELS in server.py; "rate" messages override it.
+const DEFAULT_RATE = { fps: 15, scale: 1, quality: 0.6 };
 
 let reconnectTimerId = null;
 let reconnectAttempts = 0;
 let lifecycleBound = false;
 let allowReconnect = true;
 let frameInFlight = false;
+let frameId = 0;
 
 function clearReconnectTimer() {
   if (!reconnectTimerId) return;
@@ -41,6 +49,45 @@ function scheduleReconnect(closeEvent) {
   }, delayMs);
 }
 
+function frameHeader(format, width, height, id, captureTs) {
+  // Must match FRAME_HEADER in server.py: "<BBHHHId", little-endian.
+  const header = new ArrayBuffer(FRAME_HEADER_BYTES);
+  const view = new DataView(header);
+  view.setUint8(0, FRAME_VERSION);
+  view.setUint8(1, format);
+  view.setUint16(2, width, true);
+  view.setUint16(4, height, true);
+  view.setUint16(6, 0, true);
+  view.setUint32(8, id, true);
+  view.setFloat64(12, captureTs, true);
+  return header;
+}
+
+function canvasToBlob(canvas, type, quality) {
+  return new Promise((resolve) => canvas.toBlob(resolve, type, quality));
+}
+
+async function sendFrame(ws, canvas, ctx, encoding, quality) {
+  if (encoding === "dataurl") {
+    ws.send(canvas.toDataURL("image/jpeg", quality));
+    return;
+  }
+  frameId = (frameId + 1) >>> 0;
+  const captureTs = Date.now();
+  const format = FRAME_FORMATS[encoding] || FRAME_FORMATS.jpeg;
+  let body = null;
+  if (format === FRAME_FORMATS.rgba) {
+    body = ctx.getImageData(0, 0, canvas.width, canvas.height).data;
+  } else {
+    const type = format === FRAME_FORMATS.webp ? "image/webp" : "image/jpeg";
+    body = await canvasToBlob(canvas, type, quality);
+    if (!body) throw new Error("Frame encoding failed");
+  }
+  if (ws.readyState !== WebSocket.OPEN) return;
+  const header = frameHeader(format, canvas.width, canvas.height, frameId, captureTs);
+  ws.send(new Blob([header, body]));
+}
+
 function bindWsLifecycle() {
   if (lifecycleBound) return;
   lifecycleBound = true;
@@ -80,24 +127,74 @@ export function connectWebSocket() {
 
   const protocol = location.protocol === "https:" ? "wss" : "ws";
   const endpoint = currentPage.wsEndpoint || "/ws";
-  const ws = new WebSocket(`${protocol}://${location.host}${endpoint}`);
+  const landmarkEncoding = currentPage.landmarkEncoding || LANDMARK_ENCODING;
+  const ws = new WebSocket(
+    `${protocol}://${location.host}${endpoint}?landmarks=${encodeURIComponent(landmarkEncoding)}`
+  );
+  ws.binaryType = "arraybuffer";
   state.wsRef = ws;
   clearReconnectTimer();
 
   const off = document.createElement("canvas");
   const offCtx = off.getContext("2d");
 
-  const sendWidth = currentPage.id === "mission2" ? 640 : 480;
-  const sourceWidth = dom.video && dom.video.videoWidth ? dom.video.videoWidth : sendWidth;
-  const sourceHeight =
-    dom.video && dom.video.videoHeight ? dom.video.videoHeight : Math.round(sendWidth * 0.75);
-  const sendHeight = Math.max(1, Math.round((sendWidth * sourceHeight) / Math.max(sourceWidth, 1)));
-  off.width = sendWidth;
-  off.height = sendHeight;
+  const encoding = currentPage.frameEncoding || FRAME_ENCODING;
+  const baseWidth = currentPage.id === "mission2" ? 640 : 480;
+  const rate = { ...DEFAULT_RATE };
+  let sendWidth = 0;
+  let sendHeight = 0;
+
+  function resizeSendCanvas() {
+    const scaled = Math.round(baseWidth * rate.scale);
+    sendWidth = encoding === "rgba" ? Math.round(scaled * FRAME_RGBA_SCALE) : scaled;
+    const sourceWidth = dom.video && dom.video.videoWidth ? dom.video.videoWidth : sendWidth;
+    const sourceHeight =
+      dom.video && dom.video.videoHeight ? dom.video.videoHeight : Math.round(sendWidth * 0.75);
+    sendHeight = Math.max(1, Math.round((sendWidth * sourceHeight) / Math.max(sourceWidth, 1)));
+    off.width = sendWidth;
+    off.height = sendHeight;
+  }
+  resizeSendCanvas();
 
-  const fpsTarget = 15;
   let timerId = null;
 
+  function tick() {
+    if (ws.readyState !== WebSocket.OPEN) return;
+    if (!dom.video) return;
+    if (frameInFlight) return;
+    if (ws.bufferedAmount > 1_000_000) return;
+    frameInFlight = true;
+    try {
+      offCtx.drawImage(dom.video, 0, 0, sendWidth, sendHeight);
+    } catch (err) {
+      frameInFlight = false;
+      return;
+    }
+    sendFrame(ws, off, offCtx, encoding, rate.quality).catch(() => {
+      // Skip invalid frames without dropping the socket.
+      frameInFlight = false;
+    });
+  }
+
+  function startTimer() {
+    if (timerId) clearInterval(timerId);
+    timerId = setInterval(tick, 1000 / rate.fps);
+  }
+
+  function applyRate(msg) {
+    const fps = Number(msg.fps);
+    const scale = Number(msg.scale);
+    const quality = Number(msg.quality);
+    const fpsChanged = fps > 0 && fps !== rate.fps;
+    if (fps > 0) rate.fps = fps;
+    if (scale > 0 && scale <= 1 && scale !== rate.scale) {
+      rate.scale = scale;
+      resizeSendCanvas();
+    }
+    if (quality > 0 && quality <= 1) rate.quality = quality;
+    if (fpsChanged && timerId) startTimer();
+  }
+
   ws.addEventListener("open", () => {
     reconnectAttempts = 0;
     frameInFlight = false;
@@ -105,30 +202,29 @@ export function connectWebSocket() {
     if (currentPage.showMpControls) {
       sendConfig();
     }
-    timerId = setInterval(() => {
-      if (ws.readyState !== WebSocket.OPEN) return;
-      if (!dom.video) return;
-      if (frameInFlight) return;
-      if (ws.bufferedAmount > 1_000_000) return;
-      try {
-        offCtx.drawImage(dom.video, 0, 0, sendWidth, sendHeight);
-        const jpg = off.toDataURL("image/jpeg", 0.6);
-        ws.send(jpg);
-        frameInFlight = true;
-      } catch (err) {
-        // Skip invalid frames without dropping the socket.
-      }
-    }, 1000 / fpsTarget);
+    startTimer();
   });
 
   ws.addEventListener("message", (event) => {
-    frameInFlight = false;
     let msg = null;
     try {
-      msg = JSON.parse(event.data);
+      msg =
+        event.data instanceof ArrayBuffer
+          ? decodeResultMessage(event.data)
+          : JSON.parse(event.data);
     } catch (err) {
+      msg = null;
+    }
+    if (!msg) {
+      frameInFlight = false;
       return;
     }
+    if (msg.type === "rate") {
+      // Control message: the frame in flight is still being processed.
+      applyRate(msg);
+      return;
+    }
+    frameInFlight = false;
     if (msg.type === "config") {
       if (msg.applied || msg.config) {
         applyConfigToUI(msg.applied || msg.config);
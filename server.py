@@ -1,15 +1,32 @@
-﻿import base64
+﻿import asyncio
+import base64
+import bisect
+import hashlib
+import io
 import json
 import math
+import multiprocessing
 import os
 import platform
+import queue
+import re
+import sqlite3
+import struct
+import subprocess
 import tempfile
 import threading
 import time
 import urllib.request
+import uuid
+import wave
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 import cv2
+import httpx
 import mediapipe as mp
 import numpy as np
 from fastapi import (
@@ -22,12 +39,25 @@ from fastapi import (
     File,
     Form,
 )
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from mediapipe.tasks import python as mp_python
 from mediapipe.tasks.python import vision
 
-app = FastAPI()
+
+@asynccontextmanager
+async def _lifespan(app):
+    _start_preload()
+    yield
+    await _close_llm_client()
+    _close_asr_pool()
+    _close_ingest_pool()
+    _close_vision_executor()
+    _flush_embed_cache()
+
+
+app = FastAPI(lifespan=_lifespan)
 
 FRONTEND_DIR = Path(__file__).resolve().parent / "frontend"
 TEMPLATES_DIR = Path(__file__).resolve().parent / "templates"
@@ -67,11 +97,129 @@ EMOTION_SMILE_RATIO_BASE = 0.34
 EMOTION_MOUTH_OPEN_SURPRISE = 0.08
 EMOTION_CORNER_SMILE = -0.005
 EMOTION_CORNER_SAD = 0.012
+_FACE_GUIDE_ROWS = {key: row for row, key in enumerate(FACE_GUIDE_INDICES)}
+# Guide segments drawn by the client; the first four also feed the ratios.
+_FACE_GUIDE_SPANS = (
+    ("face_width", "left_cheek", "right_cheek"),
+    ("face_height", "forehead", "chin"),
+    ("mouth_width", "mouth_left", "mouth_right"),
+    ("mouth_height", "upper_lip", "lower_lip"),
+)
+_FACE_SPAN_ROWS = np.array(
+    [[_FACE_GUIDE_ROWS[a], _FACE_GUIDE_ROWS[b]] for _, a, b in _FACE_GUIDE_SPANS]
+)
+# Optional IMAGE-mode batching for /ws/emotion: frames from all sockets that
+# arrive within the window share one job and one vectorized post-process.
+EMOTION_BATCH_ENABLED = False
+EMOTION_BATCH_WINDOW = 0.010
+EMOTION_BATCH_MAX = 16
+_EMOTION_BATCH = {"items": [], "ready": None, "full": None, "task": None, "running": set()}
+# Per-session temporal filter. Labels are voted over a ring of the last
+# FILTER_LABEL_WINDOW frames and only switch with FILTER_LABEL_SWITCH votes;
+# landmarks go through a One-Euro filter (coordinates are normalized, so
+# beta is much larger than the usual pixel-space value).
+FILTER_LABEL_WINDOW = 7
+FILTER_LABEL_SWITCH = 4
+FILTER_MIN_CUTOFF = 1.5
+FILTER_BETA = 5.0
+FILTER_D_CUTOFF = 1.0
+FILTER_RESET_SECONDS = 0.5
+# Frames answered from the filter's prediction between two inferences while
+# landmarks move slower than FILTER_SKIP_SPEED (units/s). 0 disables it.
+FILTER_SKIP_FRAMES = 0
+FILTER_SKIP_SPEED = 0.05
+# Region of interest: once a hand or face is found, the next frames are
+# cropped to a square around it (plus ROI_MARGIN of its size on each side)
+# and downscaled to ROI_INPUT_SIZE. The box only moves when the subject
+# nears its edge, so MediaPipe's own VIDEO-mode tracking stays valid.
+ROI_ENABLED = True
+ROI_MARGIN = 0.5
+ROI_MIN_SIZE = 0.25
+ROI_MAX_AREA = 0.6
+ROI_EDGE = 0.1
+ROI_INPUT_SIZE = 320
+ROI_KEYFRAME_INTERVAL = 30
+# Session capture for benchmarks/replay_vision.py: when set to a directory,
+# every /ws and /ws/emotion socket writes its incoming messages to a .vrec
+# file there. Layout: magic, version, JSON header, then one entry per
+# message (seconds since connect, 1 if binary, byte length) and its bytes.
+VISION_RECORD_DIR = None
+RECORD_MAGIC = b"VREC"
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct("<BI")
+RECORD_ENTRY = struct.Struct("<dBI")
+
+# Binary frame messages: header then JPEG/WebP bytes or raw RGBA pixels.
+# version, format, width, height, reserved, frame id, capture timestamp (ms).
+FRAME_HEADER = struct.Struct("<BBHHHId")
+FRAME_VERSION = 1
+FRAME_FORMAT_JPEG = 1
+FRAME_FORMAT_WEBP = 2
+FRAME_FORMAT_RGBA = 3
+_IMREAD_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+# Compact result messages, opted into with ?landmarks=f32|i16 on the socket:
+# header, then landmarks as (groups, points, dims) little-endian float32 or
+# int16 (value * LANDMARK_I16_SCALE), then the rest of the result as JSON.
+# version, format, groups, dims, points, JSON byte length.
+RESULT_HEADER = struct.Struct("<BBBBII")
+RESULT_VERSION = 1
+RESULT_FORMAT_F32 = 1
+RESULT_FORMAT_I16 = 2
+LANDMARK_I16_SCALE = 16384
+LANDMARK_ENCODINGS = {"json", "f32", "i16"}
+# Decode and MediaPipe inference run here, never on the event loop. Each
+# socket has at most one job in flight, so this also bounds CPU contention.
+VISION_WORKERS = max(2, os.cpu_count() or 2)
+VISION_EXECUTOR = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="vision")
+# Warm MediaPipe graphs shared by all sockets, keyed by normalized config.
+# Frames lease a graph only while they are processed, so the pool never
+# needs more graphs than VISION_WORKERS to stay busy.
+GRAPH_POOL_MAX = max(4, VISION_WORKERS)
+GRAPH_IDLE_SECONDS = 300
+# VIDEO-mode timestamps jump this far when a graph changes session, so each
+# session's frames sit in their own range of the graph's timeline.
+GRAPH_SESSION_GAP_MS = 1000
+# Adaptive send rate: each level is what clients are asked to send.
+# Sessions step down when frames cost more than their budget or the vision
+# pool backs up, and step back up once there is clear headroom again.
+RATE_LEVELS = (
+    {"fps": 15, "scale": 1.0, "quality": 0.6},
+    {"fps": 12, "scale": 1.0, "quality": 0.5},
+    {"fps": 10, "scale": 0.75, "quality": 0.5},
+    {"fps": 8, "scale": 0.75, "quality": 0.4},
+    {"fps": 5, "scale": 0.5, "quality": 0.4},
+)
+RATE_EMA_ALPHA = 0.2
+RATE_DEGRADE_RATIO = 0.8
+RATE_RECOVER_RATIO = 0.4
+RATE_HOLD_SECONDS = 2.0
+_VISION_LOAD = {"in_flight": 0, "backlog": 0.0}
+_GRAPH_POOL = {
+    "entries": [],
+    "pending": 0,
+    "cond": threading.Condition(),
+    "created": 0,
+    "evicted": 0,
+    "leases": 0,
+    "affinity_hits": 0,
+}
 
 LLM_BASE_URL = "http://localhost:8033/v1"
-LLM_CHAT_ENDPOINT = f"{LLM_BASE_URL}/chat/completions"
+# One entry per llama.cpp instance; requests go to the least loaded one.
+LLM_BACKENDS = [LLM_BASE_URL]
 LLM_MODEL = "mistral"
 LLM_TIMEOUT = 30
+LLM_CONNECT_TIMEOUT = 5
+# In-flight requests per backend, match llama.cpp's --parallel slots so its
+# continuous batching stays full without queueing inside the server.
+LLM_MAX_CONCURRENCY = 4
+LLM_POOL_SIZE = 8
+LLM_DISCONNECT_POLL = 0.5
+LLM_ADMISSION_QUEUE = 16
+LLM_HEALTH_INTERVAL = 10
+LLM_EJECT_FAILURES = 3
+LLM_EJECT_SECONDS = 30
+LLM_LATENCY_ALPHA = 0.2
 LLM_SYSTEM_PROMPT = (
     "Tu es un assistant IA local. Reponds en francais, de maniere claire et "
     "structuree. Si l'utilisateur demande du code, donne un exemple minimal et "
@@ -85,8 +233,21 @@ LLM_DEFAULT_PARAMS = {
     "max_tokens": 768,
 }
 LLM_MAX_MESSAGES = 20
+LLM_CACHE_MAX_ENTRIES = 512
+LLM_CACHE_TTL = 3600
+# The semantic tier loads the embedding model even for the plain chat page.
+LLM_CACHE_SEMANTIC = False
+LLM_CACHE_SEMANTIC_THRESHOLD = 0.95
+LLM_CACHE = OrderedDict()
+LLM_CACHE_LOCK = threading.Lock()
+LLM_CACHE_STATS = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
 
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch": SentenceTransformer in fp32. "onnx-int8": ONNX Runtime on the model's
+# dynamically quantized int8 export; falls back to "torch" if it cannot load.
+EMBEDDING_BACKEND = "torch"
+# Intra-op threads for torch inference, 0 keeps torch's default (all cores).
+EMBEDDING_TORCH_THREADS = 0
 DEFAULT_CHUNK_SIZE = 1200
 DEFAULT_CHUNK_OVERLAP = 200
 DEFAULT_TOP_K = 6
@@ -99,22 +260,148 @@ RAG_SYSTEM_PROMPT = (
     "Si le contexte ne contient pas l'information, dis-le clairement et propose "
     "quoi chercher."
 )
+RAG_INITIAL_CAPACITY = 1024
+# Stored chunk embeddings: "float32", "float16" (half the memory) or "int8"
+# (a quarter, plus one float32 scale per row). Queries always stay float32.
+RAG_STORE_DTYPE = "float32"
+RAG_SCORE_BLOCK = 16384
+# Immutable snapshot: writers publish a new dict under RAG_LOCK, readers take
+# the reference once and never lock. docs, sources, postings and the embeds
+# matrix are append-only and shared between snapshots; a reader only looks at
+# ids below its own `count`.
 RAG_STORE = {
     "docs": [],
     "sources": [],
-    "embeds": [],
-    "norms": [],
+    # Contiguous RAG_STORE_DTYPE matrix, only the first `count` rows are valid.
+    "embeds": None,
+    # Per-row dequantization scales when the matrix is int8, else None.
+    "scales": None,
+    "count": 0,
     "hashes": set(),
+    # Generation of the on-disk index this store matches, None if never synced.
+    "generation": None,
+    # IVF index over the embeddings, built once the store is large enough.
+    "ann": None,
+    # Inverted index: keyword token -> ascending chunk ids containing it.
+    "postings": {},
+    # Trailing chunks committed since the last save or load.
+    "unsaved": 0,
+    # Embedding backend the stored vectors came from, "mixed" if several.
+    "embedding_backend": None,
 }
+RAG_KEYWORD_BONUS = 0.05
+RAG_KEYWORD_BONUS_MAX = 0.30
+RAG_TOKEN_RE = re.compile(r"\w+")
+# Serializes writers only; queries read RAG_STORE without it.
 RAG_LOCK = threading.Lock()
+RAG_ANN_MIN_CHUNKS = 20000
+RAG_ANN_NPROBE = 16
+RAG_ANN_KMEANS_ITERS = 10
+RAG_ANN_SAMPLE_PER_LIST = 64
+RAG_ANN_RETRAIN_GROWTH = 4
+RAG_ANN_LOCK = threading.Lock()
+RAG_INDEX_DIR = Path(__file__).resolve().parent / "rag_index"
+RAG_INDEX_MANIFEST = RAG_INDEX_DIR / "index.json"
+RAG_INDEX_FORMAT = 1
+RAG_SAVE_LOCK = threading.Lock()
+RAG_INDEX_LOCK = RAG_INDEX_DIR / "index.lock"
+RAG_INDEX_LOCK_STALE_SECONDS = 120.0
 _EMBEDDING_MODEL = None
+# Backend that actually loaded: "onnx-int8" may fall back to "torch".
+_EMBEDDING_BACKEND_LOADED = None
+
+RAG_INGEST_PROCESSES = max(1, min(4, (os.cpu_count() or 2) - 1))
+RAG_INGEST_PAGES_PER_TASK = 16
+RAG_INGEST_QUEUE_SIZE = 1024
+RAG_INGEST_BATCH = 256
+RAG_INGEST_FLUSH_SECONDS = 0.25
+RAG_INGEST_MAX_JOBS = 32
+RAG_INGEST_JOBS = OrderedDict()
+RAG_INGEST_LOCK = threading.Lock()
+# Jobs run one at a time so their embedding batches do not compete.
+RAG_INGEST_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-ingest")
+_RAG_INGEST_POOL = None
+
+EMBED_CACHE_MAX_ENTRIES = 50000
+# Optional SQLite copy of the cache: content-addressed, so it survives index
+# resets and restarts. Writes are batched and the oldest rows beyond
+# EMBED_CACHE_DISK_MAX_ENTRIES are dropped.
+EMBED_CACHE_PERSIST = False
+EMBED_CACHE_PATH = RAG_INDEX_DIR / "embed_cache.sqlite3"
+EMBED_CACHE_DISK_MAX_ENTRIES = 500000
+EMBED_CACHE_WRITE_BATCH = 256
+EMBED_CACHE_WRITE_SECONDS = 5.0
+EMBED_CACHE = OrderedDict()
+EMBED_CACHE_LOCK = threading.Lock()
+EMBED_CACHE_STATS = {"hits": 0, "disk_hits": 0, "misses": 0}
+# Disk I/O happens under its own lock, never under EMBED_CACHE_LOCK.
+EMBED_CACHE_DB_LOCK = threading.Lock()
+_EMBED_CACHE_DB = None
+_EMBED_CACHE_PENDING = {"rows": [], "since": 0.0}
 
 ASR_VARIANT = "tiny"
+# "auto" loads every installed engine in a single probe process, times each on a
+# probe clip and gives the lowest real-time factor to every ASR worker; or name
+# one of ASR_ENGINES to use only that.
+ASR_ENGINE = "auto"
+ASR_ENGINES = ("faster-whisper", "whisper", "transformers", "transformers-int8")
+ASR_COMPUTE_TYPE = "int8"
+ASR_PROBE_SECONDS = 5.0
 ASR_DEFAULT_LANGUAGE = "fr"
 ASR_SUPPORTED_LANGUAGES = {"fr", "en", "es", "de", "it"}
 ASR_TARGET_SAMPLE_RATE = 16000
 ASR_LOCK = threading.Lock()
 _ASR_BACKEND = None
+_ASR_PROBE_RTF = {}
+# Transcription runs in worker processes, each holding its own model. Jobs wait
+# in a bounded queue (429 beyond ASR_QUEUE_MAX); with the transformers backend,
+# clips queued while every worker was busy go out together when similar in length.
+ASR_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+ASR_QUEUE_MAX = 32
+ASR_BATCH_MAX = 8
+ASR_BATCH_MAX_SECONDS = 30.0
+ASR_BATCH_LENGTH_RATIO = 1.5
+_ASR_POOL = None
+ASR_POOL_LOCK = threading.Lock()
+_ASR_DISPATCH = {
+    "queue": [],
+    "busy": 0,
+    "backend": None,
+    "ready": None,
+    "task": None,
+    "running": set(),
+    "rejected": 0,
+    "completed": 0,
+    "batches": 0,
+    "audio_s": 0.0,
+    "busy_s": 0.0,
+    "probe_rtf": {},
+    # Error of an "auto" probe that found no engine: later jobs fail fast with it.
+    "unavailable": None,
+}
+# Streaming transcription (/ws/audio): MediaRecorder chunks are piped into one
+# decoder per stream, then cut into speech segments by an energy VAD.
+AUDIO_STREAM_DECODE_SECONDS = 0.5
+AUDIO_STREAM_FINAL_WAIT_SECONDS = 10.0
+AUDIO_STREAM_MAX_BYTES = 16 * 1024 * 1024
+AUDIO_VAD_FRAME_MS = 30
+AUDIO_VAD_MIN_RMS = 0.01
+AUDIO_VAD_NOISE_RATIO = 3.0
+AUDIO_VAD_SILENCE_MS = 600
+AUDIO_VAD_MIN_SPEECH_MS = 250
+AUDIO_VAD_PAD_MS = 200
+AUDIO_SEGMENT_MAX_SECONDS = 15.0
+AUDIO_PARTIAL_SECONDS = 2.0
+EMBEDDING_LOAD_LOCK = threading.Lock()
+
+# Loaded in a background thread at startup; anything not listed loads on first use.
+# Choices: "asr", "embedding", "rag", "gesture", "emotion". ASR is opt-in: preloading it
+# spawns the whole worker pool, each process loading its own model.
+PRELOAD_SUBSYSTEMS = ("embedding",)
+PRELOAD_WARMUP = True
+_PRELOAD = {"started": time.time(), "subsystems": {}, "first_request": {}}
+_LLM_CLIENT = None
+_LLM_DISPATCH = None
 _MODEL_BYTES_CACHE = {}
 
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
@@ -211,6 +498,462 @@ def _create_video_recognizer(model_path: str, config: dict):
     return recognizer, applied, warning
 
 
+def _create_face_mesh(static_image_mode: bool = False):
+    face_mesh = mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=static_image_mode,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
+    return face_mesh, None, None
+
+
+def _create_image_face_mesh():
+    return _create_face_mesh(static_image_mode=True)
+
+
+def _graph_pool_key(kind: str, config: dict | None = None) -> tuple:
+    return (kind,) + tuple(sorted((config or {}).items()))
+
+
+def _evict_idle_graphs(now: float):
+    # Caller holds the pool condition.
+    pool = _GRAPH_POOL
+    for entry in list(pool["entries"]):
+        if entry["pinned"] or entry["busy"]:
+            continue
+        if now - entry["last_used"] > GRAPH_IDLE_SECONDS:
+            pool["entries"].remove(entry)
+            pool["evicted"] += 1
+            _close_graph(entry)
+
+
+def _close_graph(entry: dict):
+    try:
+        entry["graph"].close()
+    except Exception:
+        pass
+
+
+def _take_graph(entry: dict, owner: str, now: float) -> dict:
+    if entry["owner"] != owner:
+        entry["clock"] += GRAPH_SESSION_GAP_MS
+        entry["owner"] = owner
+    entry["busy"] = True
+    entry["last_used"] = now
+    _GRAPH_POOL["leases"] += 1
+    return entry
+
+
+def _lease_graph(key: tuple, owner: str, factory) -> dict:
+    # Blocking: call from a VISION_EXECUTOR thread, never on the event loop.
+    pool = _GRAPH_POOL
+    with pool["cond"]:
+        while True:
+            now = time.monotonic()
+            _evict_idle_graphs(now)
+            idle = [e for e in pool["entries"] if e["key"] == key and not e["busy"]]
+            for entry in idle:
+                if entry["owner"] == owner:
+                    pool["affinity_hits"] += 1
+                    return _take_graph(entry, owner, now)
+            if len(pool["entries"]) + pool["pending"] < GRAPH_POOL_MAX:
+                pool["pending"] += 1
+                break
+            if idle:
+                return _take_graph(min(idle, key=lambda e: e["last_used"]), owner, now)
+            spare = [e for e in pool["entries"] if not e["busy"] and not e["pinned"]]
+            if spare:
+                victim = min(spare, key=lambda e: e["last_used"])
+                pool["entries"].remove(victim)
+                pool["evicted"] += 1
+                _close_graph(victim)
+                pool["pending"] += 1
+                break
+            pool["cond"].wait()
+
+    try:
+        graph, applied, warning = factory()
+    except Exception:
+        with pool["cond"]:
+            pool["pending"] -= 1
+            pool["cond"].notify_all()
+        raise
+    entry = {
+        "key": key,
+        "graph": graph,
+        "applied": applied,
+        "warning": warning,
+        "owner": None,
+        "clock": 0,
+        "busy": False,
+        "pinned": False,
+        "last_used": 0.0,
+    }
+    with pool["cond"]:
+        pool["pending"] -= 1
+        pool["entries"].append(entry)
+        pool["created"] += 1
+        return _take_graph(entry, owner, time.monotonic())
+
+
+def _release_graph(entry: dict):
+    with _GRAPH_POOL["cond"]:
+        entry["busy"] = False
+        entry["last_used"] = time.monotonic()
+        _GRAPH_POOL["cond"].notify_all()
+
+
+def _graph_timestamp(entry: dict) -> int:
+    # VIDEO mode needs strictly increasing timestamps per graph.
+    timestamp_ms = max(int(time.time() * 1000), entry["clock"] + 1)
+    entry["clock"] = timestamp_ms
+    return timestamp_ms
+
+
+def _warm_graph(key: tuple, owner: str, factory, pin: bool = False):
+    entry = _lease_graph(key, owner, factory)
+    # Pinned graphs are never evicted, so preloaded configs stay warm.
+    entry["pinned"] = entry["pinned"] or pin
+    _release_graph(entry)
+    return entry["applied"], entry["warning"]
+
+
+def _resident_memory_mb() -> float | None:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _graph_pool_stats() -> dict:
+    pool = _GRAPH_POOL
+    with pool["cond"]:
+        entries = pool["entries"]
+        return {
+            "graphs": len(entries),
+            "busy": sum(1 for e in entries if e["busy"]),
+            "pinned": sum(1 for e in entries if e["pinned"]),
+            "max": GRAPH_POOL_MAX,
+            "kinds": sorted({e["key"][0] for e in entries}),
+            "created": pool["created"],
+            "evicted": pool["evicted"],
+            "leases": pool["leases"],
+            "affinity_hits": pool["affinity_hits"],
+        }
+
+
+def _decode_image_bytes(buffer: np.ndarray):
+    # OpenCV >= 4.10 decodes straight to RGB and skips the cvtColor copy.
+    if _IMREAD_RGB is not None:
+        return cv2.imdecode(buffer, _IMREAD_RGB)
+    frame = cv2.imdecode(buffer, cv2.IMREAD_COLOR)  # BGR
+    if frame is None:
+        return None
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def _decode_text_frame(payload: str):
+    # Legacy clients: payload = "data:image/jpeg;base64,...."
+    comma = payload.find(",")
+    if comma < 0:
+        return None
+    jpg_bytes = base64.b64decode(payload[comma + 1 :])
+    return _decode_image_bytes(np.frombuffer(jpg_bytes, dtype=np.uint8))
+
+
+def _decode_binary_frame(data: bytes):
+    if len(data) <= FRAME_HEADER.size:
+        return None, None
+    version, fmt, width, height, _, frame_id, capture_ts = FRAME_HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        return None, None
+    meta = {"id": frame_id, "capture_ts": capture_ts}
+    pixels = np.frombuffer(data, dtype=np.uint8, offset=FRAME_HEADER.size)
+    if fmt == FRAME_FORMAT_RGBA:
+        if pixels.size != width * height * 4:
+            return None, meta
+        return cv2.cvtColor(pixels.reshape(height, width, 4), cv2.COLOR_RGBA2RGB), meta
+    return _decode_image_bytes(pixels), meta
+
+
+async def _receive_frame_message(ws: WebSocket):
+    # Returns (text, bytes): JSON control messages and legacy data URLs
+    # arrive as text, binary frames as bytes.
+    message = await ws.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code") or 1000)
+    return message.get("text"), message.get("bytes")
+
+
+def _frame_meta(data) -> dict | None:
+    if data is None or len(data) <= FRAME_HEADER.size:
+        return None
+    _, _, _, _, _, frame_id, capture_ts = FRAME_HEADER.unpack_from(data)
+    return {"id": frame_id, "capture_ts": capture_ts}
+
+
+def _new_temporal_filter() -> dict:
+    return {
+        "labels": np.full(FILTER_LABEL_WINDOW, -1, dtype=np.int16),
+        "pos": 0,
+        "codes": {},
+        "names": [],
+        "stable": None,
+        "score": 0.0,
+        "points": None,
+        "velocity": None,
+        "t": None,
+        "last": None,
+        "skipped": 0,
+    }
+
+
+def _vote_label(state: dict, label: str) -> tuple[str, bool]:
+    code = state["codes"].get(label)
+    if code is None:
+        code = state["codes"][label] = len(state["names"])
+        state["names"].append(label)
+    state["labels"][state["pos"]] = code
+    state["pos"] = (state["pos"] + 1) % FILTER_LABEL_WINDOW
+    votes = state["labels"]
+    counts = np.bincount(votes[votes >= 0], minlength=len(state["names"]))
+    best = int(counts.argmax())
+    stable = state["stable"]
+    if stable is None or (best != stable and counts[best] >= FILTER_LABEL_SWITCH):
+        state["stable"] = best
+        return state["names"][best], stable is not None
+    return state["names"][stable], False
+
+
+def _one_euro_alpha(cutoff, dt: float):
+    return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+
+
+def _smooth_points(state: dict, points: np.ndarray | None, t: float) -> np.ndarray | None:
+    prev = state["points"]
+    if points is None:
+        state["points"] = state["velocity"] = None
+        return None
+    dt = t - state["t"] if state["t"] is not None else 0.0
+    state["t"] = t
+    if prev is None or prev.shape != points.shape or not 0.0 < dt < FILTER_RESET_SECONDS:
+        state["points"] = points.astype(np.float32)
+        state["velocity"] = np.zeros_like(state["points"])
+        return state["points"].copy()
+    velocity = (points - prev) / dt
+    state["velocity"] += _one_euro_alpha(FILTER_D_CUTOFF, dt) * (velocity - state["velocity"])
+    cutoff = FILTER_MIN_CUTOFF + FILTER_BETA * np.abs(state["velocity"])
+    prev += _one_euro_alpha(cutoff, dt) * (points - prev)
+    return prev.copy()
+
+
+def _filter_time(payload: dict) -> float:
+    frame = payload.get("frame")
+    if frame and frame.get("capture_ts"):
+        return frame["capture_ts"] / 1000.0
+    return time.monotonic()
+
+
+def _apply_temporal_filter(state: dict, payload: dict):
+    if "gesture" in payload:
+        key, block = "landmarks", payload["gesture"]
+    elif "emotion" in payload:
+        key, block = "guides", payload["emotion"]
+    else:
+        return
+    payload[key] = _smooth_points(state, payload.get(key), _filter_time(payload))
+    frame_label = block["label"]
+    label, changed = _vote_label(state, frame_label)
+    block["frame_label"] = frame_label
+    block["label"] = label
+    if "score" in block:
+        # Keep the score of the last frame that agreed with the stable label.
+        if frame_label == label:
+            state["score"] = block["score"]
+        block["score"] = state["score"]
+    if changed:
+        payload["event"] = {"type": "label", "label": label}
+    state["last"] = payload
+    state["skipped"] = 0
+
+
+def _predict_filtered_result(state: dict, data) -> dict | None:
+    # Answer a frame without inference while landmarks are steady.
+    last = state["last"]
+    if (
+        FILTER_SKIP_FRAMES <= 0
+        or last is None
+        or state["skipped"] >= FILTER_SKIP_FRAMES
+        or state["points"] is None
+        or float(np.abs(state["velocity"]).max()) > FILTER_SKIP_SPEED
+    ):
+        return None
+    frame_meta = _frame_meta(data)
+    payload = {**last, "frame": frame_meta, "metrics": {"inference_ms": 0.0, "skipped": True}}
+    payload.pop("event", None)
+    dt = _filter_time(payload) - state["t"]
+    key = "landmarks" if "gesture" in payload else "guides"
+    payload[key] = state["points"] + state["velocity"] * max(0.0, min(dt, FILTER_RESET_SECONDS))
+    state["skipped"] += 1
+    return payload
+
+
+def _open_recording(endpoint: str, session: dict) -> dict | None:
+    if VISION_RECORD_DIR is None:
+        return None
+    directory = Path(VISION_RECORD_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = directory / f"{stamp}-{endpoint.strip('/').replace('/', '-')}-{session['id'][:8]}.vrec"
+    meta = json.dumps(
+        {"endpoint": endpoint, "started": time.time(), "encoding": session["encoding"]}
+    ).encode("utf-8")
+    handle = open(path, "wb")
+    handle.write(RECORD_MAGIC + RECORD_HEADER.pack(RECORD_VERSION, len(meta)) + meta)
+    return {"handle": handle, "path": path, "start": time.perf_counter(), "messages": 0}
+
+
+def _record_message(recording: dict | None, text, data):
+    if recording is None:
+        return
+    body = data if data is not None else (text or "").encode("utf-8")
+    elapsed = time.perf_counter() - recording["start"]
+    recording["handle"].write(RECORD_ENTRY.pack(elapsed, data is not None, len(body)))
+    recording["handle"].write(body)
+    recording["messages"] += 1
+
+
+def _close_recording(recording: dict | None, tag: str):
+    if recording is None:
+        return
+    recording["handle"].close()
+    print(f"[{tag}] recorded {recording['messages']} messages to {recording['path']}")
+
+
+def _read_recording(path) -> tuple[dict, list]:
+    # Returns (header, [(seconds, text, data), ...]) with text or data set.
+    blob = Path(path).read_bytes()
+    if blob[: len(RECORD_MAGIC)] != RECORD_MAGIC:
+        raise ValueError(f"{path}: not a vision recording")
+    offset = len(RECORD_MAGIC)
+    version, meta_len = RECORD_HEADER.unpack_from(blob, offset)
+    if version != RECORD_VERSION:
+        raise ValueError(f"{path}: unsupported recording version {version}")
+    offset += RECORD_HEADER.size
+    meta = json.loads(blob[offset : offset + meta_len])
+    offset += meta_len
+    entries = []
+    while offset + RECORD_ENTRY.size <= len(blob):
+        elapsed, binary, length = RECORD_ENTRY.unpack_from(blob, offset)
+        offset += RECORD_ENTRY.size
+        body = blob[offset : offset + length]
+        offset += length
+        if binary:
+            entries.append((elapsed, None, body))
+        else:
+            entries.append((elapsed, body.decode("utf-8"), None))
+    return meta, entries
+
+
+def _new_mailbox() -> dict:
+    # Single-slot mailbox: a newer frame replaces one that was not processed yet.
+    return {"item": None, "ready": asyncio.Event(), "dropped": 0}
+
+
+def _mailbox_put(mailbox: dict, item):
+    if mailbox["item"] is not None:
+        mailbox["dropped"] += 1
+    mailbox["item"] = item
+    mailbox["ready"].set()
+
+
+async def _mailbox_take(mailbox: dict):
+    await mailbox["ready"].wait()
+    mailbox["ready"].clear()
+    item, mailbox["item"] = mailbox["item"], None
+    return item
+
+
+async def _run_vision_job(fn, *args):
+    load = _VISION_LOAD
+    load["in_flight"] += 1
+    backlog = max(0, load["in_flight"] - VISION_WORKERS)
+    load["backlog"] += RATE_EMA_ALPHA * (backlog - load["backlog"])
+    try:
+        return await asyncio.wrap_future(VISION_EXECUTOR.submit(fn, *args))
+    finally:
+        load["in_flight"] -= 1
+
+
+def _new_rate_state() -> dict:
+    return {
+        "level": 0,
+        "ema_ms": None,
+        "dropped": 0,
+        "changed_at": time.monotonic(),
+        "reason": "initial",
+    }
+
+
+def _rate_view(rate: dict) -> dict:
+    return {"level": rate["level"], **RATE_LEVELS[rate["level"]], "reason": rate["reason"]}
+
+
+def _update_rate(rate: dict, server_ms: float, dropped: int) -> bool:
+    if rate["ema_ms"] is None:
+        rate["ema_ms"] = server_ms
+    else:
+        rate["ema_ms"] += RATE_EMA_ALPHA * (server_ms - rate["ema_ms"])
+    now = time.monotonic()
+    if now - rate["changed_at"] < RATE_HOLD_SECONDS:
+        return False
+    new_drops = dropped - rate["dropped"]
+    rate["dropped"] = dropped
+    backlog = _VISION_LOAD["backlog"]
+    level = rate["level"]
+    budget_ms = 1000.0 / RATE_LEVELS[level]["fps"]
+    if level + 1 < len(RATE_LEVELS) and (
+        backlog >= 1.0 or new_drops > 0 or rate["ema_ms"] > budget_ms * RATE_DEGRADE_RATIO
+    ):
+        rate["level"] = level + 1
+        if backlog >= 1.0:
+            rate["reason"] = "backlog"
+        elif new_drops > 0:
+            rate["reason"] = "dropped"
+        else:
+            rate["reason"] = "slow"
+    elif (
+        level > 0
+        and backlog < 0.5
+        and new_drops == 0
+        and rate["ema_ms"] < 1000.0 / RATE_LEVELS[level - 1]["fps"] * RATE_RECOVER_RATIO
+    ):
+        rate["level"] = level - 1
+        rate["reason"] = "recovered"
+    else:
+        return False
+    rate["changed_at"] = now
+    return True
+
+
+def _close_vision_executor():
+    VISION_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    with _GRAPH_POOL["cond"]:
+        for entry in _GRAPH_POOL["entries"]:
+            _close_graph(entry)
+        _GRAPH_POOL["entries"].clear()
+
+
+def _decode_frame_message(text, data):
+    if data is not None:
+        return _decode_binary_frame(data)
+    return _decode_text_frame(text or ""), None
+
+
 def _extract_gesture(result):
     if not result.hand_landmarks:
         return "Aucune main detectee", 0.0, None
@@ -227,55 +970,176 @@ def _extract_gesture(result):
     return "Geste non reconnu", 0.0, None
 
 
-def _dist(a, b) -> float:
-    dx = a.x - b.x
-    dy = a.y - b.y
-    return float((dx * dx + dy * dy) ** 0.5)
+def _face_guide_points(landmarks) -> np.ndarray:
+    return np.array(
+        [(landmarks[idx].x, landmarks[idx].y) for idx in FACE_GUIDE_INDICES.values()],
+        dtype=np.float64,
+    )
+
+
+def _extract_face_guides(points: np.ndarray) -> np.ndarray:
+    # (segments, 2 endpoints, xy), in _FACE_GUIDE_SPANS order.
+    return points[_FACE_SPAN_ROWS].astype(np.float32)
+
 
+def _hand_landmark_array(result) -> np.ndarray | None:
+    if not result.hand_landmarks:
+        return None
+    hands = result.hand_landmarks
+    points = len(hands[0])
+    coords = np.fromiter(
+        (c for hand in hands for lm in hand for c in (lm.x, lm.y, lm.z)),
+        dtype=np.float32,
+        count=len(hands) * points * 3,
+    )
+    return coords.reshape(len(hands), points, 3)
+
+
+def _new_roi_state() -> dict:
+    return {"box": None, "frames": 0}
+
+
+def _roi_crop(roi: dict, rgb: np.ndarray):
+    # Returns (image, box); box is None when the full frame is used.
+    box = roi["box"]
+    roi["frames"] += 1
+    if box is None or roi["frames"] >= ROI_KEYFRAME_INTERVAL:
+        roi["frames"] = 0
+        return rgb, None
+    h, w = rgb.shape[:2]
+    x0, y0 = int(box[0] * w), int(box[1] * h)
+    x1, y1 = max(x0 + 1, int(math.ceil(box[2] * w))), max(y0 + 1, int(math.ceil(box[3] * h)))
+    crop = rgb[y0:y1, x0:x1]
+    longest = max(crop.shape[:2])
+    if longest > ROI_INPUT_SIZE:
+        scale = ROI_INPUT_SIZE / longest
+        size = (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale)))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(crop), (x0 / w, y0 / h, x1 / w, y1 / h)
+
+
+def _roi_to_frame(points: np.ndarray, box) -> np.ndarray:
+    x0, y0, x1, y1 = box
+    out = points.copy()
+    out[..., 0] = x0 + points[..., 0] * (x1 - x0)
+    out[..., 1] = y0 + points[..., 1] * (y1 - y0)
+    if points.shape[-1] > 2:
+        # MediaPipe z is relative to the image width.
+        out[..., 2] *= x1 - x0
+    return out
+
+
+def _roi_update(roi: dict, points: np.ndarray | None, width: int, height: int, complete: bool):
+    # points are full-frame normalized; complete is False while subjects may
+    # be missing (e.g. one hand found for num_hands=2) so the frame stays whole.
+    if points is None or not complete:
+        roi["box"] = None
+        return
+    xs = points[..., 0] * width
+    ys = points[..., 1] * height
+    left, right, top, bottom = float(xs.min()), float(xs.max()), float(ys.min()), float(ys.max())
+    side = max(right - left, bottom - top) * (1.0 + 2.0 * ROI_MARGIN)
+    side = max(side, ROI_MIN_SIZE * min(width, height))
+    if side * side >= ROI_MAX_AREA * width * height:
+        roi["box"] = None
+        return
+    box = roi["box"]
+    if box is not None:
+        bx0, by0, bx1, by1 = box[0] * width, box[1] * height, box[2] * width, box[3] * height
+        edge = ROI_EDGE * (bx1 - bx0)
+        inside = (
+            left >= bx0 + edge
+            and right <= bx1 - edge
+            and top >= by0 + edge
+            and bottom <= by1 - edge
+        )
+        if inside and side >= 0.6 * (bx1 - bx0):
+            return
+    side_x, side_y = min(side, width), min(side, height)
+    cx, cy = (left + right) / 2, (top + bottom) / 2
+    x0 = _clamp(cx - side_x / 2, 0.0, width - side_x)
+    y0 = _clamp(cy - side_y / 2, 0.0, height - side_y)
+    roi["box"] = (x0 / width, y0 / height, (x0 + side_x) / width, (y0 + side_y) / height)
 
-def _point(lm) -> dict:
-    return {"x": float(lm.x), "y": float(lm.y)}
 
+def _landmarks_json(coords: np.ndarray) -> list:
+    return [[{"x": x, "y": y, "z": z} for x, y, z in hand] for hand in coords.tolist()]
 
-def _extract_face_guides(landmarks) -> dict:
-    points = {key: landmarks[idx] for key, idx in FACE_GUIDE_INDICES.items()}
+
+def _guides_json(guides: np.ndarray) -> dict:
     return {
-        "face_width": [_point(points["left_cheek"]), _point(points["right_cheek"])],
-        "face_height": [_point(points["forehead"]), _point(points["chin"])],
-        "mouth_width": [_point(points["mouth_left"]), _point(points["mouth_right"])],
-        "mouth_height": [_point(points["upper_lip"]), _point(points["lower_lip"])],
+        name: [{"x": x, "y": y} for x, y in segment]
+        for (name, _, _), segment in zip(_FACE_GUIDE_SPANS, guides.tolist())
     }
 
 
-def _estimate_emotion(landmarks) -> tuple[str, dict]:
-    points = {key: landmarks[idx] for key, idx in FACE_GUIDE_INDICES.items()}
+def _encode_result(payload: dict, encoding: str):
+    # Returns str for a JSON text message, bytes for a compact binary one.
+    key = "landmarks" if "landmarks" in payload else "guides"
+    coords = payload.get(key)
+    if coords is None:
+        return json.dumps(payload)
+    if encoding == "json":
+        to_json = _landmarks_json if key == "landmarks" else _guides_json
+        return json.dumps({**payload, key: to_json(coords)})
+    meta = {**payload, key: None, "packed": key}
+    body = json.dumps(meta).encode("utf-8")
+    if encoding == "i16":
+        fmt = RESULT_FORMAT_I16
+        packed = (coords * LANDMARK_I16_SCALE).clip(-32768, 32767).round().astype("<i2")
+    else:
+        fmt = RESULT_FORMAT_F32
+        packed = coords.astype("<f4", copy=False)
+    groups, points, dims = coords.shape
+    header = RESULT_HEADER.pack(RESULT_VERSION, fmt, groups, dims, points, len(body))
+    return header + packed.tobytes() + body
+
+
+def _emotion_features(points: np.ndarray) -> np.ndarray:
+    # points: (..., guides, 2) -> (..., 3) open ratio, smile ratio, corner delta.
+    rows = _FACE_GUIDE_ROWS
+    spans = np.linalg.norm(
+        points[..., _FACE_SPAN_ROWS[:, 0], :] - points[..., _FACE_SPAN_ROWS[:, 1], :], axis=-1
+    )
+    face_width, face_height, mouth_width, mouth_height = np.moveaxis(spans, -1, 0)
+    mouth_center_y = (points[..., rows["upper_lip"], 1] + points[..., rows["lower_lip"], 1]) / 2
+    corners_y = (points[..., rows["mouth_left"], 1] + points[..., rows["mouth_right"], 1]) / 2
+    return np.stack(
+        [
+            mouth_height / np.maximum(face_height, 1e-6),
+            mouth_width / np.maximum(face_width, 1e-6),
+            corners_y - mouth_center_y,
+        ],
+        axis=-1,
+    )
 
-    face_width = _dist(points["left_cheek"], points["right_cheek"])
-    face_height = _dist(points["forehead"], points["chin"])
-    mouth_width = _dist(points["mouth_left"], points["mouth_right"])
-    mouth_height = _dist(points["upper_lip"], points["lower_lip"])
-    mouth_center_y = (points["upper_lip"].y + points["lower_lip"].y) / 2
-    corners_y = (points["mouth_left"].y + points["mouth_right"].y) / 2
 
-    mouth_open_ratio = mouth_height / max(face_height, 1e-6)
-    smile_width_ratio = mouth_width / max(face_width, 1e-6)
-    corner_delta = corners_y - mouth_center_y
+def _classify_emotions(features: np.ndarray) -> np.ndarray:
+    mouth_open_ratio, smile_width_ratio, corner_delta = np.moveaxis(features, -1, 0)
+    return np.select(
+        [
+            mouth_open_ratio > EMOTION_MOUTH_OPEN_SURPRISE,
+            (corner_delta < EMOTION_CORNER_SMILE)
+            & (smile_width_ratio > EMOTION_SMILE_RATIO_BASE),
+            corner_delta > EMOTION_CORNER_SAD,
+        ],
+        ["Surpris", "Sourire", "Triste"],
+        default="Neutre",
+    )
 
-    if mouth_open_ratio > EMOTION_MOUTH_OPEN_SURPRISE:
-        label = "Surpris"
-    elif corner_delta < EMOTION_CORNER_SMILE and smile_width_ratio > EMOTION_SMILE_RATIO_BASE:
-        label = "Sourire"
-    elif corner_delta > EMOTION_CORNER_SAD:
-        label = "Triste"
-    else:
-        label = "Neutre"
 
-    metrics = {
-        "mouth_open_ratio": float(mouth_open_ratio),
-        "smile_width_ratio": float(smile_width_ratio),
-        "corner_delta": float(corner_delta),
+def _emotion_metrics(features) -> dict:
+    mouth_open_ratio, smile_width_ratio, corner_delta = features.tolist()
+    return {
+        "mouth_open_ratio": mouth_open_ratio,
+        "smile_width_ratio": smile_width_ratio,
+        "corner_delta": corner_delta,
     }
-    return label, metrics
+
+
+def _estimate_emotion(points: np.ndarray) -> tuple[str, dict]:
+    features = _emotion_features(points)
+    return str(_classify_emotions(features)), _emotion_metrics(features)
 
 
 def _normalize_chat_messages(messages) -> list[dict]:
@@ -295,244 +1159,2215 @@ def _normalize_chat_messages(messages) -> list[dict]:
     return normalized
 
 
-def _call_llm_chat(system_prompt: str, messages: list[dict]) -> dict:
+def _llm_payload(system_prompt: str, messages: list[dict], stream: bool) -> dict:
     payload = {
         "model": LLM_MODEL,
         "messages": [{"role": "system", "content": system_prompt}] + messages,
-        "stream": False,
+        "stream": stream,
     }
     payload.update(LLM_DEFAULT_PARAMS)
-    body = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        LLM_CHAT_ENDPOINT,
-        data=body,
-        headers={"Content-Type": "application/json"},
-    )
-    with urllib.request.urlopen(req, timeout=LLM_TIMEOUT) as response:
-        data = response.read()
-    return json.loads(data)
-
-
-def _get_embedding_model():
-    global _EMBEDDING_MODEL
-    if _EMBEDDING_MODEL is not None:
-        return _EMBEDDING_MODEL
-    with RAG_LOCK:
-        if _EMBEDDING_MODEL is not None:
-            return _EMBEDDING_MODEL
-        try:
-            from sentence_transformers import SentenceTransformer
-        except Exception as exc:
-            raise RuntimeError(
-                "Installez sentence-transformers pour activer la mission RAG."
-            ) from exc
-        _EMBEDDING_MODEL = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        return _EMBEDDING_MODEL
+    return payload
+
+
+def _get_llm_client():
+    # Created lazily so the client binds to the running event loop.
+    global _LLM_CLIENT
+    if _LLM_CLIENT is None:
+        pool_size = LLM_POOL_SIZE * max(1, len(LLM_BACKENDS))
+        _LLM_CLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+        )
+    return _LLM_CLIENT
+
+
+def _get_llm_dispatch() -> dict:
+    global _LLM_DISPATCH
+    if _LLM_DISPATCH is None:
+        _LLM_DISPATCH = {
+            "backends": [
+                {
+                    "url": url.rstrip("/"),
+                    "endpoint": f"{url.rstrip('/')}/chat/completions",
+                    "in_flight": 0,
+                    "latency_ms": 1000.0,
+                    "requests": 0,
+                    "errors": 0,
+                    "failures": 0,
+                    "ejected_until": 0.0,
+                }
+                for url in LLM_BACKENDS
+            ],
+            "waiting": 0,
+            "rejected": 0,
+            "changed": asyncio.Event(),
+            "health_task": None,
+        }
+    return _LLM_DISPATCH
 
 
-def _reset_rag_store():
-    with RAG_LOCK:
-        RAG_STORE["docs"].clear()
-        RAG_STORE["sources"].clear()
-        RAG_STORE["embeds"].clear()
-        RAG_STORE["norms"].clear()
-        RAG_STORE["hashes"].clear()
+def _llm_backend_up(backend: dict) -> bool:
+    return backend["ejected_until"] <= time.monotonic()
 
 
-def _rag_counts() -> dict:
-    with RAG_LOCK:
-        return {
-            "chunks": len(RAG_STORE["docs"]),
-            "sources": len(set(RAG_STORE["sources"])),
-        }
+def _pick_llm_backend(backends: list) -> dict | None:
+    # Least expected wait: queue depth weighted by the backend's recent latency.
+    best, best_cost = None, None
+    for backend in backends:
+        if not _llm_backend_up(backend) or backend["in_flight"] >= LLM_MAX_CONCURRENCY:
+            continue
+        cost = (backend["in_flight"] + 1) * backend["latency_ms"]
+        if best is None or cost < best_cost:
+            best, best_cost = backend, cost
+    return best
+
+
+def _llm_retry_after(dispatch: dict) -> int:
+    up = [b for b in dispatch["backends"] if _llm_backend_up(b)]
+    if not up:
+        return LLM_EJECT_SECONDS
+    latency_s = sum(b["latency_ms"] for b in up) / len(up) / 1000.0
+    capacity = len(up) * LLM_MAX_CONCURRENCY
+    return max(1, math.ceil(latency_s * (dispatch["waiting"] + 1) / capacity))
+
+
+def _llm_busy(dispatch: dict) -> HTTPException:
+    dispatch["rejected"] += 1
+    return HTTPException(
+        status_code=429,
+        detail="Serveur LLM sature, reessayez dans quelques secondes.",
+        headers={"Retry-After": str(_llm_retry_after(dispatch))},
+    )
 
 
-def _text_from_bytes(name: str, data: bytes):
-    name_lower = name.lower()
-    if name_lower.endswith(".pdf"):
-        try:
-            import fitz
-        except Exception:
-            return "", "Erreur : installez PyMuPDF via `pip install pymupdf`."
+async def _acquire_llm_backend() -> dict:
+    dispatch = _get_llm_dispatch()
+    _ensure_llm_health_task(dispatch)
+    backend = _pick_llm_backend(dispatch["backends"])
+    if backend is None:
+        if not any(_llm_backend_up(b) for b in dispatch["backends"]):
+            raise _llm_unavailable()
+        if dispatch["waiting"] >= LLM_ADMISSION_QUEUE:
+            raise _llm_busy(dispatch)
+        dispatch["waiting"] += 1
+        deadline = time.monotonic() + LLM_TIMEOUT
         try:
-            doc = fitz.open(stream=data, filetype="pdf")
-            pages = []
-            for page in doc:
-                pages.append(page.get_text())
-            return "\n".join(pages), None
-        except Exception as exc:
-            return "", f"Erreur de lecture PDF (PyMuPDF) : {exc}"
-    return data.decode("utf-8", errors="ignore"), None
-
-
-def _chunk_text(text: str, max_chars: int, overlap: int):
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks, current = [], ""
+            while True:
+                dispatch["changed"].clear()
+                backend = _pick_llm_backend(dispatch["backends"])
+                if backend is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise _llm_busy(dispatch)
+                try:
+                    await asyncio.wait_for(dispatch["changed"].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            dispatch["waiting"] -= 1
+    backend["in_flight"] += 1
+    backend["requests"] += 1
+    return backend
+
+
+def _mark_llm_failure(backend: dict):
+    backend["errors"] += 1
+    backend["failures"] += 1
+    if backend["failures"] >= LLM_EJECT_FAILURES and _llm_backend_up(backend):
+        backend["ejected_until"] = time.monotonic() + LLM_EJECT_SECONDS
+        print(f"[llm] ejecting {backend['url']} for {LLM_EJECT_SECONDS}s")
+
+
+def _release_llm_backend(backend: dict, started: float, ok: bool | None):
+    # ok=None means the caller gave up (disconnect): not the backend's fault.
+    backend["in_flight"] -= 1
+    if ok:
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        backend["latency_ms"] += LLM_LATENCY_ALPHA * (elapsed_ms - backend["latency_ms"])
+        backend["failures"] = 0
+    elif ok is False:
+        _mark_llm_failure(backend)
+    _get_llm_dispatch()["changed"].set()
+
+
+async def _check_llm_backend(backend: dict):
+    try:
+        response = await _get_llm_client().get(
+            f"{backend['url']}/models", timeout=LLM_CONNECT_TIMEOUT
+        )
+        healthy = response.status_code < 500
+    except httpx.HTTPError:
+        healthy = False
+    if not healthy:
+        _mark_llm_failure(backend)
+        return
+    if not _llm_backend_up(backend):
+        print(f"[llm] {backend['url']} is healthy again")
+    backend["failures"] = 0
+    backend["ejected_until"] = 0.0
+    _get_llm_dispatch()["changed"].set()
 
-    effective_overlap = min(overlap, max_chars - 1) if max_chars > 1 else 0
-    step = max(1, max_chars - effective_overlap)
 
-    for paragraph in paragraphs:
-        if len(current) + len(paragraph) + 2 <= max_chars:
-            current = f"{current}\n\n{paragraph}" if current else paragraph
-            continue
+async def _llm_health_loop():
+    dispatch = _get_llm_dispatch()
+    while True:
+        await asyncio.gather(*(_check_llm_backend(b) for b in dispatch["backends"]))
+        await asyncio.sleep(LLM_HEALTH_INTERVAL)
 
-        if current:
-            chunks.append(current)
 
-        if len(paragraph) <= max_chars:
-            current = paragraph
-        else:
-            for i in range(0, len(paragraph), step):
-                chunks.append(paragraph[i : i + max_chars])
-            current = ""
+def _ensure_llm_health_task(dispatch: dict):
+    task = dispatch["health_task"]
+    if task is None or task.done():
+        dispatch["health_task"] = asyncio.ensure_future(_llm_health_loop())
 
-    if current:
-        chunks.append(current)
 
-    return chunks
+async def _close_llm_client():
+    global _LLM_CLIENT
+    if _LLM_DISPATCH is not None and _LLM_DISPATCH["health_task"] is not None:
+        _LLM_DISPATCH["health_task"].cancel()
+    if _LLM_CLIENT is not None:
+        await _LLM_CLIENT.aclose()
+        _LLM_CLIENT = None
 
 
-def _dot_product(left, right):
-    return sum(l * r for l, r in zip(left, right))
+async def _call_llm_chat(system_prompt: str, messages: list[dict]) -> dict:
+    backend = await _acquire_llm_backend()
+    started = time.perf_counter()
+    ok = None
+    try:
+        response = await _get_llm_client().post(
+            backend["endpoint"], json=_llm_payload(system_prompt, messages, False)
+        )
+        ok = response.status_code < 500
+        response.raise_for_status()
+        return response.json()
+    except httpx.TransportError:
+        ok = False
+        raise
+    finally:
+        _release_llm_backend(backend, started, ok)
 
 
-def _vector_norm(vec):
-    return math.sqrt(sum(x * x for x in vec))
+async def _call_llm_until_disconnect(request: Request, system_prompt, messages) -> dict:
+    # Abandon the upstream generation as soon as the browser goes away.
+    task = asyncio.ensure_future(_call_llm_chat(system_prompt, messages))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=LLM_DISCONNECT_POLL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client deconnecte.")
+    finally:
+        if not task.done():
+            task.cancel()
 
 
-def _embed_texts(texts):
-    model = _get_embedding_model()
-    embeds = model.encode(texts, normalize_embeddings=True)
-    return embeds.tolist()
+async def _open_llm_stream(system_prompt: str, messages: list[dict]):
+    # Opened before the HTTP response starts so connection errors can still
+    # be reported with a proper status code. The backend is released by the
+    # event generator once the stream ends.
+    backend = await _acquire_llm_backend()
+    started = time.perf_counter()
+    try:
+        client = _get_llm_client()
+        request = client.build_request(
+            "POST",
+            backend["endpoint"],
+            json=_llm_payload(system_prompt, messages, True),
+        )
+        response = await client.send(request, stream=True)
+        if response.status_code >= 400:
+            await response.aclose()
+            response.raise_for_status()
+        return backend, started, response
+    except httpx.HTTPStatusError as exc:
+        _release_llm_backend(backend, started, exc.response.status_code < 500)
+        raise
+    except httpx.TransportError:
+        _release_llm_backend(backend, started, False)
+        raise
+    except BaseException:
+        _release_llm_backend(backend, started, None)
+        raise
+
+
+async def _iter_llm_stream(response):
+    # OpenAI-compatible servers stream SSE lines: "data: {...}" then "data: [DONE]".
+    async for line in response.aiter_lines():
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        yield json.loads(data)
 
 
-def _retrieve_chunks(query: str, top_k: int, min_score: float):
-    with RAG_LOCK:
-        docs = list(RAG_STORE["docs"])
-        sources = list(RAG_STORE["sources"])
-        embeds = list(RAG_STORE["embeds"])
-        norms = list(RAG_STORE["norms"])
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event) + "\n").encode("utf-8")
 
-    if not docs:
-        return []
 
-    query_emb = _embed_texts([query])[0]
-    qn = _vector_norm(query_emb)
-    if qn == 0:
-        return []
+async def _stream_chat_events(
+    upstream, started: float, tag: str, first_events=(), on_complete=None
+):
+    # Starlette cancels this generator when the browser disconnects; closing
+    # the upstream response then stops llama.cpp from generating further.
+    backend, backend_started, response = upstream
+    ok = None
+    try:
+        for event in first_events:
+            yield _ndjson(event)
+        model = None
+        usage = None
+        first_token_ms = None
+        parts = []
+        try:
+            async for chunk in _iter_llm_stream(response):
+                model = chunk.get("model") or model
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or []
+                content = (choices[0].get("delta") or {}).get("content") if choices else None
+                if not content:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000.0
+                    print(f"[{tag}] time to first token: {first_token_ms:.0f} ms")
+                parts.append(content)
+                yield _ndjson({"type": "token", "content": content})
+        except Exception as exc:
+            ok = False
+            print(f"[{tag}] stream interrupted: {exc}")
+            yield _ndjson({"type": "error", "message": "Flux LLM interrompu."})
+            return
+        ok = True
+        if on_complete is not None and parts:
+            on_complete({"reply": "".join(parts), "model": model, "usage": usage})
+        total_ms = (time.perf_counter() - started) * 1000.0
+        yield _ndjson(
+            {
+                "type": "done",
+                "model": model,
+                "usage": usage,
+                "metrics": {"first_token_ms": first_token_ms, "total_ms": total_ms},
+            }
+        )
+    finally:
+        await response.aclose()
+        _release_llm_backend(backend, backend_started, ok)
 
-    query_keywords = [w.lower() for w in query.split() if len(w) > 3]
 
-    scored = []
-    for idx, emb in enumerate(embeds):
-        denom = qn * norms[idx]
-        cosine = _dot_product(query_emb, emb) / denom if denom else 0.0
+def _llm_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=(
+            "Impossible de contacter le serveur llama.cpp. "
+            f"Verifiez {', '.join(LLM_BACKENDS)}."
+        ),
+    )
 
-        chunk_lower = docs[idx].lower()
-        bonus = 0.0
-        for kw in query_keywords:
-            if kw in chunk_lower:
-                bonus += 0.05
-        bonus = min(bonus, 0.30)
 
-        score = cosine + bonus
-        scored.append((score, idx))
+async def _chat_stream_response(
+    system_prompt, messages, started, tag, first_events=(), on_complete=None
+):
+    try:
+        upstream = await _open_llm_stream(system_prompt, messages)
+    except HTTPException:
+        raise
+    except Exception:
+        raise _llm_unavailable()
+    return StreamingResponse(
+        _stream_chat_events(upstream, started, tag, first_events, on_complete),
+        media_type="application/x-ndjson",
+    )
 
-    scored.sort(key=lambda x: x[0], reverse=True)
 
-    results = []
-    for score, idx in scored[:top_k]:
-        if score < min_score:
-            continue
-        results.append(
+def _cached_stream_response(cached: dict, first_events=()):
+    def events():
+        for event in first_events:
+            yield _ndjson(event)
+        yield _ndjson({"type": "token", "content": cached["reply"]})
+        yield _ndjson(
             {
-                "score": float(score),
-                "text": docs[idx],
-                "source": sources[idx],
+                "type": "done",
+                "model": cached.get("model"),
+                "usage": cached.get("usage"),
+                "cached": True,
             }
         )
-    return results
 
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
-def _build_context_block(results):
-    if not results:
-        return ""
-    lines = ["### CONTEXTE DOCUMENTAIRE"]
-    for i, r in enumerate(results, start=1):
-        src = r["source"]
-        chunk = r["text"].strip()
-        lines.append(f"[{i}] Source: {src}\n{chunk}\n")
-    return "\n".join(lines)
 
+def _normalize_cache_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
 
-def _get_asr_backend():
-    global _ASR_BACKEND
-    if _ASR_BACKEND is not None:
-        return _ASR_BACKEND
-    with ASR_LOCK:
-        if _ASR_BACKEND is not None:
-            return _ASR_BACKEND
-        try:
-            import whisper  # type: ignore
 
-            model = whisper.load_model(ASR_VARIANT)
-            _ASR_BACKEND = ("whisper", model)
-            return _ASR_BACKEND
-        except Exception:
-            pass
+def _llm_cache_keys(namespace: str, system_prompt: str, messages: list[dict], extra=None):
+    # Exact key covers the whole conversation; the semantic scope drops the
+    # last message so paraphrases of the final question can share an entry.
+    def digest(msgs):
+        material = json.dumps(
+            {
+                "ns": namespace,
+                "model": LLM_MODEL,
+                "params": LLM_DEFAULT_PARAMS,
+                "system": _normalize_cache_text(system_prompt),
+                "messages": [[m["role"], _normalize_cache_text(m["content"])] for m in msgs],
+                "extra": extra,
+            },
+            sort_keys=True,
+        )
+        return hashlib.blake2b(material.encode("utf-8"), digest_size=16).hexdigest()
 
-        try:
-            from transformers import pipeline  # type: ignore
+    return digest(messages), digest(messages[:-1])
 
-            asr = pipeline(
-                "automatic-speech-recognition",
-                model=f"openai/whisper-{ASR_VARIANT}",
-                device="cpu",
-            )
-            _ASR_BACKEND = ("transformers", asr)
-            return _ASR_BACKEND
-        except Exception as exc:
-            _ASR_BACKEND = ("none", str(exc))
-            return _ASR_BACKEND
 
+async def _llm_cache_vector(text: str):
+    if not LLM_CACHE_SEMANTIC:
+        return None
+    try:
+        # One-off prompts: keep them in memory only, not in the disk cache.
+        return (await asyncio.to_thread(_embed_texts, [text], False))[0]
+    except RuntimeError:
+        return None
+
+
+async def _llm_cache_lookup(key: str, scope: str, text: str):
+    # Exact key first: the prompt is only embedded when that misses.
+    cached = _llm_cache_get(key, scope, count_miss=False)
+    if cached is not None:
+        return cached, None
+    vector = await _llm_cache_vector(text)
+    return _llm_cache_get(key, scope, vector), vector
+
+
+def _llm_cache_get(key: str, scope: str, vector=None, count_miss: bool = True) -> dict | None:
+    now = time.monotonic()
+    with LLM_CACHE_LOCK:
+        entry = LLM_CACHE.get(key)
+        if entry is not None and entry["expires"] <= now:
+            del LLM_CACHE[key]
+            entry = None
+        if entry is None and vector is not None:
+            best_sim = LLM_CACHE_SEMANTIC_THRESHOLD
+            for candidate_key, candidate in LLM_CACHE.items():
+                if candidate["scope"] != scope or candidate["vector"] is None:
+                    continue
+                if candidate["expires"] <= now:
+                    continue
+                sim = float(candidate["vector"] @ vector)
+                if sim >= best_sim:
+                    best_sim, key, entry = sim, candidate_key, candidate
+            if entry is not None:
+                LLM_CACHE_STATS["semantic_hits"] += 1
+        elif entry is not None:
+            LLM_CACHE_STATS["hits"] += 1
+        if entry is None:
+            if count_miss:
+                LLM_CACHE_STATS["misses"] += 1
+            return None
+        LLM_CACHE.move_to_end(key)
+        return entry["value"]
+
+
+def _llm_cache_put(key: str, value: dict, namespace: str, scope: str, vector=None):
+    with LLM_CACHE_LOCK:
+        LLM_CACHE[key] = {
+            "value": value,
+            "namespace": namespace,
+            "scope": scope,
+            "vector": vector,
+            "expires": time.monotonic() + LLM_CACHE_TTL,
+        }
+        LLM_CACHE.move_to_end(key)
+        while len(LLM_CACHE) > LLM_CACHE_MAX_ENTRIES:
+            LLM_CACHE.popitem(last=False)
+            LLM_CACHE_STATS["evictions"] += 1
+
+
+def _llm_cache_invalidate(namespace: str):
+    with LLM_CACHE_LOCK:
+        stale = [k for k, e in LLM_CACHE.items() if e["namespace"] == namespace]
+        for key in stale:
+            del LLM_CACHE[key]
+
+
+def _get_embedding_model():
+    global _EMBEDDING_MODEL, _EMBEDDING_BACKEND_LOADED
+    if _EMBEDDING_MODEL is not None:
+        return _EMBEDDING_MODEL
+    with EMBEDDING_LOAD_LOCK:
+        if _EMBEDDING_MODEL is not None:
+            return _EMBEDDING_MODEL
+        try:
+            from sentence_transformers import SentenceTransformer
+        except Exception as exc:
+            raise RuntimeError(
+                "Installez sentence-transformers pour activer la mission RAG."
+            ) from exc
+        if EMBEDDING_BACKEND == "onnx-int8":
+            try:
+                _EMBEDDING_MODEL = SentenceTransformer(
+                    EMBEDDING_MODEL_NAME,
+                    backend="onnx",
+                    model_kwargs={"file_name": _embedding_onnx_file()},
+                )
+                _EMBEDDING_BACKEND_LOADED = "onnx-int8"
+                return _EMBEDDING_MODEL
+            except Exception as exc:
+                print(f"[rag] onnx-int8 embedding backend unavailable, using torch: {exc}")
+        if EMBEDDING_TORCH_THREADS > 0:
+            import torch
+
+            torch.set_num_threads(EMBEDDING_TORCH_THREADS)
+        _EMBEDDING_MODEL = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+        _EMBEDDING_BACKEND_LOADED = "torch"
+        return _EMBEDDING_MODEL
+
+
+def _embedding_backend() -> str:
+    # Only a backend that can fall back needs the model loaded to be known.
+    if EMBEDDING_BACKEND == "torch":
+        return "torch"
+    _get_embedding_model()
+    return _EMBEDDING_BACKEND_LOADED
+
+
+def _merge_embedding_backend(current: str | None, added: str) -> str:
+    return added if current in (None, added) else "mixed"
+
+
+def _embedding_onnx_file() -> str:
+    # Quantized exports shipped in the model repository, one per CPU family.
+    if platform.machine().lower() in {"arm64", "aarch64"}:
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_qint8_avx2.onnx"
+
+
+def _publish_rag_store(**fields):
+    # Caller must hold RAG_LOCK. A single reference assignment: queries see
+    # either the previous snapshot or this one, never a mix.
+    global RAG_STORE
+    RAG_STORE = {**RAG_STORE, **fields}
+
+
+def _reset_rag_store():
+    # Fresh containers instead of clear(): readers holding the previous
+    # snapshot keep a consistent view until they finish.
+    with RAG_LOCK:
+        _publish_rag_store(
+            docs=[],
+            sources=[],
+            embeds=None,
+            scales=None,
+            count=0,
+            hashes=set(),
+            ann=None,
+            postings={},
+            unsaved=0,
+            embedding_backend=None,
+        )
+    _llm_cache_invalidate("rag")
+
+
+def _chunk_hash(chunk: str) -> str:
+    # Stable across processes and restarts, unlike the salted builtin hash().
+    return hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _write_atomic(path: Path, write):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as handle:
+        write(handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_rag_manifest() -> dict | None:
+    try:
+        manifest = json.loads(RAG_INDEX_MANIFEST.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        print(f"[rag] unreadable index manifest: {exc}")
+        return None
+    if manifest.get("format") != RAG_INDEX_FORMAT:
+        print(f"[rag] ignoring index format {manifest.get('format')}")
+        return None
+    if manifest.get("model") != EMBEDDING_MODEL_NAME:
+        print(f"[rag] ignoring index built with {manifest.get('model')}")
+        return None
+    return manifest
+
+
+def _ensure_rag_loaded():
+    # Called on every /api/rag/* request: a stat-sized read of the manifest is
+    # enough to pick up an index written by another worker or a previous run.
+    manifest = _read_rag_manifest()
+    if manifest is None or RAG_STORE["generation"] == manifest["generation"]:
+        return
+    _load_rag_index(manifest)
+
+
+@contextmanager
+def _rag_index_lock():
+    # Several workers share RAG_INDEX_DIR: an O_EXCL lock file serializes their
+    # merge-and-write. The holder keeps its mtime fresh, so the lock is only broken
+    # once nobody has touched it for RAG_INDEX_LOCK_STALE_SECONDS (holder died).
+    RAG_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    while True:
+        try:
+            os.close(os.open(RAG_INDEX_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - RAG_INDEX_LOCK.stat().st_mtime > RAG_INDEX_LOCK_STALE_SECONDS:
+                    RAG_INDEX_LOCK.unlink()
+            except OSError:
+                pass
+            time.sleep(0.05)
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(RAG_INDEX_LOCK_STALE_SECONDS / 4):
+            try:
+                os.utime(RAG_INDEX_LOCK)
+            except OSError:
+                pass
+
+    beat = threading.Thread(target=heartbeat, name="rag-index-lock", daemon=True)
+    beat.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        beat.join()
+        try:
+            RAG_INDEX_LOCK.unlink()
+        except OSError:
+            pass
+
+
+def _load_rag_index(manifest: dict) -> bool:
+    # Replaces the store with the on-disk generation. Chunks committed here but
+    # not saved yet (the last `unsaved` rows) are appended back, not dropped.
+    try:
+        count = int(manifest["count"])
+        chunks_path = RAG_INDEX_DIR / manifest["chunks"]
+        chunks = json.loads(chunks_path.read_text(encoding="utf-8"))
+        embeds = scales = None
+        if count:
+            embeds = np.load(RAG_INDEX_DIR / manifest["embeds"], mmap_mode="r")
+            if manifest.get("scales"):
+                scales = np.load(RAG_INDEX_DIR / manifest["scales"], mmap_mode="r")
+    except Exception as exc:
+        # Most likely a concurrent save replaced the files; retry next call.
+        print(f"[rag] index load failed: {exc}")
+        return False
+    if embeds is not None and embeds.dtype != np.dtype(RAG_STORE_DTYPE):
+        print(f"[rag] converting stored embeddings {embeds.dtype} -> {RAG_STORE_DTYPE}")
+        embeds, scales = _quantize_store_rows(_dequantize_store_rows(embeds, scales))
+    docs, sources, hashes = chunks["docs"], chunks["sources"], set(chunks["hashes"])
+    postings = {}
+    for idx, doc in enumerate(docs):
+        _add_postings(postings, idx, doc)
+    with RAG_LOCK:
+        store = RAG_STORE
+        if store["generation"] == manifest["generation"]:
+            return True
+        # Manifests written before the backend was recorded were torch-only.
+        backend = manifest.get("embedding_backend", "torch") if count else None
+        keep = []
+        for idx in range(store["count"] - store["unsaved"], store["count"]):
+            h = _chunk_hash(store["docs"][idx])
+            if h not in hashes:
+                hashes.add(h)
+                keep.append(idx)
+        if keep:
+            for idx in keep:
+                _add_postings(postings, len(docs), store["docs"][idx])
+                docs.append(store["docs"][idx])
+                sources.append(store["sources"][idx])
+            rows = store["embeds"][keep]
+            embeds = rows if embeds is None else np.concatenate((embeds, rows))
+            if store["scales"] is not None:
+                rows = store["scales"][keep]
+                scales = rows if scales is None else np.concatenate((scales, rows))
+            backend = _merge_embedding_backend(backend, store["embedding_backend"])
+        _publish_rag_store(
+            docs=docs,
+            sources=sources,
+            hashes=hashes,
+            embeds=embeds,
+            scales=scales,
+            count=len(docs),
+            generation=manifest["generation"],
+            ann=None,
+            postings=postings,
+            unsaved=len(keep),
+            embedding_backend=backend,
+        )
+    _llm_cache_invalidate("rag")
+    print(
+        f"[rag] loaded index generation {manifest['generation']} "
+        f"({count} chunks, {len(keep)} unsaved kept)"
+    )
+    _schedule_ann_build()
+    return True
+
+
+def _save_rag_store(merge: bool = True):
+    with RAG_SAVE_LOCK, _rag_index_lock():
+        manifest = _read_rag_manifest() if merge else None
+        if manifest is not None and manifest["generation"] != RAG_STORE["generation"]:
+            # Another worker saved since our last load: fold its chunks in
+            # first instead of overwriting them with this process's view.
+            _load_rag_index(manifest)
+        with RAG_LOCK:
+            # The hash set is shared with the writers, so it is read under
+            # their lock to match exactly the `count` chunks being saved.
+            store = RAG_STORE
+            hashes = sorted(store["hashes"])
+        docs_ref = store["docs"]
+        count = store["count"]
+        docs = docs_ref[:count]
+        sources = store["sources"][:count]
+        embeds = store["embeds"][:count] if count else None
+        scales = store["scales"]
+        scales = scales[:count] if count and scales is not None else None
+
+        generation = f"{time.time_ns():x}-{os.getpid()}"
+        embeds_name = f"embeds-{generation}.npy"
+        scales_name = f"scales-{generation}.npy"
+        chunks_name = f"chunks-{generation}.json"
+        manifest = {
+            "format": RAG_INDEX_FORMAT,
+            "generation": generation,
+            "model": EMBEDDING_MODEL_NAME,
+            "count": count,
+            "dim": int(embeds.shape[1]) if embeds is not None else 0,
+            "dtype": str(embeds.dtype) if embeds is not None else RAG_STORE_DTYPE,
+            "embedding_backend": store["embedding_backend"],
+            "embeds": embeds_name if embeds is not None else None,
+            "scales": scales_name if scales is not None else None,
+            "chunks": chunks_name,
+        }
+        chunks = {"docs": docs, "sources": sources, "hashes": hashes}
+
+        RAG_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        if embeds is not None:
+            _write_atomic(
+                RAG_INDEX_DIR / embeds_name,
+                lambda handle: np.save(handle, np.ascontiguousarray(embeds)),
+            )
+        if scales is not None:
+            _write_atomic(
+                RAG_INDEX_DIR / scales_name,
+                lambda handle: np.save(handle, np.ascontiguousarray(scales)),
+            )
+        _write_atomic(
+            RAG_INDEX_DIR / chunks_name,
+            lambda handle: handle.write(json.dumps(chunks).encode("utf-8")),
+        )
+        # The manifest swap is the commit point of the new generation.
+        _write_atomic(
+            RAG_INDEX_MANIFEST,
+            lambda handle: handle.write(json.dumps(manifest).encode("utf-8")),
+        )
+
+        with RAG_LOCK:
+            # This process holds at least what was just written, never reload it.
+            fields = {"generation": generation}
+            if RAG_STORE["docs"] is docs_ref:
+                fields["unsaved"] = RAG_STORE["unsaved"] - store["unsaved"]
+            if (
+                embeds is not None
+                and RAG_STORE["docs"] is docs_ref
+                and RAG_STORE["count"] == count
+            ):
+                # Release the heap copy, the file now backs the store.
+                fields["embeds"] = np.load(RAG_INDEX_DIR / embeds_name, mmap_mode="r")
+                if scales is not None:
+                    fields["scales"] = np.load(RAG_INDEX_DIR / scales_name, mmap_mode="r")
+            _publish_rag_store(**fields)
+
+        keep = {embeds_name, scales_name, chunks_name}
+        for path in RAG_INDEX_DIR.glob("*-*.*"):
+            if path.name in keep or not path.name.startswith(("embeds-", "scales-", "chunks-")):
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                # Still mapped by a reader (Windows) or already removed.
+                pass
+
+
+def _rag_counts() -> dict:
+    store = RAG_STORE
+    count = store["count"]
+    return {
+        "chunks": count,
+        "sources": len(set(store["sources"][:count])),
+    }
+
+
+def _rag_store_memory() -> dict:
+    store = RAG_STORE
+    count = store["count"]
+    embeds = store["embeds"]
+    scales = store["scales"]
+    row_bytes = embeds.shape[1] * embeds.itemsize if embeds is not None else 0
+    if scales is not None:
+        row_bytes += scales.itemsize
+    return {
+        "dtype": str(embeds.dtype) if embeds is not None else RAG_STORE_DTYPE,
+        "embeds_mb": round(count * row_bytes / (1024 * 1024), 2),
+        "embedding_backend": store["embedding_backend"],
+    }
+
+
+def _quantize_store_rows(embeds: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+    if RAG_STORE_DTYPE == "int8":
+        # Symmetric per-row scale: the largest component maps to +-127.
+        scales = np.maximum(np.abs(embeds).max(axis=1), 1e-12) / 127.0
+        rows = np.rint(embeds / scales[:, None]).astype(np.int8)
+        return rows, scales.astype(np.float32)
+    return embeds.astype(RAG_STORE_DTYPE, copy=False), None
+
+
+def _dequantize_store_rows(rows, scales) -> np.ndarray:
+    out = np.asarray(rows, dtype=np.float32)
+    if scales is not None:
+        out = out * np.asarray(scales, dtype=np.float32)[:, None]
+    return out
+
+
+def _score_rows(embeds, scales, query_emb: np.ndarray, ids=None) -> np.ndarray:
+    if embeds.dtype == np.float32:
+        return (embeds if ids is None else embeds[ids]) @ query_emb
+    # float16/int8 rows are widened a block at a time so BLAS does the work
+    # without a full float32 copy of the store.
+    total = len(embeds) if ids is None else len(ids)
+    scores = np.empty(total, dtype=np.float32)
+    for start in range(0, total, RAG_SCORE_BLOCK):
+        block = slice(start, start + RAG_SCORE_BLOCK)
+        rows = embeds[block] if ids is None else embeds[ids[block]]
+        scores[block] = rows.astype(np.float32) @ query_emb
+    if scales is not None:
+        scores *= scales if ids is None else scales[ids]
+    return scores
+
+
+def _append_rag_embeddings(embeds: np.ndarray) -> dict:
+    # Caller must hold RAG_LOCK and publish the returned fields. Rows are
+    # written past the published `count` and rows below it are never
+    # rewritten, so readers of the current snapshot are unaffected.
+    rows, row_scales = _quantize_store_rows(embeds)
+    matrix = RAG_STORE["embeds"]
+    scales = RAG_STORE["scales"]
+    count = RAG_STORE["count"]
+    needed = count + len(rows)
+    if matrix is None or needed > matrix.shape[0]:
+        capacity = RAG_INITIAL_CAPACITY if matrix is None else matrix.shape[0]
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, rows.shape[1]), dtype=rows.dtype)
+        if matrix is not None:
+            grown[:count] = matrix[:count]
+        matrix = grown
+        if row_scales is not None:
+            grown_scales = np.empty(capacity, dtype=np.float32)
+            if scales is not None:
+                grown_scales[:count] = scales[:count]
+            scales = grown_scales
+    matrix[count:needed] = rows
+    if row_scales is not None:
+        scales[count:needed] = row_scales
+    return {"embeds": matrix, "scales": scales, "count": needed}
+
+
+def _text_from_bytes(name: str, data: bytes):
+    name_lower = name.lower()
+    if name_lower.endswith(".pdf"):
+        try:
+            import fitz
+        except Exception:
+            return "", "Erreur : installez PyMuPDF via `pip install pymupdf`."
+        try:
+            doc = fitz.open(stream=data, filetype="pdf")
+            pages = []
+            for page in doc:
+                pages.append(page.get_text())
+            return "\n".join(pages), None
+        except Exception as exc:
+            return "", f"Erreur de lecture PDF (PyMuPDF) : {exc}"
+    return data.decode("utf-8", errors="ignore"), None
+
+
+def _chunk_text(text: str, max_chars: int, overlap: int):
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    chunks, current = [], ""
+
+    effective_overlap = min(overlap, max_chars - 1) if max_chars > 1 else 0
+    step = max(1, max_chars - effective_overlap)
+
+    for paragraph in paragraphs:
+        if len(current) + len(paragraph) + 2 <= max_chars:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+            continue
+
+        if current:
+            chunks.append(current)
+
+        if len(paragraph) <= max_chars:
+            current = paragraph
+        else:
+            for i in range(0, len(paragraph), step):
+                chunks.append(paragraph[i : i + max_chars])
+            current = ""
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def _embed_cache_key(text: str, backend: str) -> str:
+    model_id = EMBEDDING_MODEL_NAME
+    if backend != "torch":
+        # Quantized backends give slightly different vectors: cache them apart.
+        model_id = f"{EMBEDDING_MODEL_NAME}+{backend}"
+    material = f"{model_id}\0{text}".encode("utf-8")
+    return hashlib.blake2b(material, digest_size=16).hexdigest()
+
+
+def _embed_cache_db():
+    # Caller must hold EMBED_CACHE_DB_LOCK. SQLite handles concurrent workers.
+    global _EMBED_CACHE_DB
+    if _EMBED_CACHE_DB is None:
+        EMBED_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(EMBED_CACHE_PATH), timeout=10, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        _EMBED_CACHE_DB = db
+    return _EMBED_CACHE_DB
+
+
+def _embed_cache_remember(key: str, vector: np.ndarray):
+    # Caller must hold EMBED_CACHE_LOCK.
+    EMBED_CACHE[key] = vector
+    EMBED_CACHE.move_to_end(key)
+    while len(EMBED_CACHE) > EMBED_CACHE_MAX_ENTRIES:
+        EMBED_CACHE.popitem(last=False)
+
+
+def _embed_cache_lookup(keys: list[str]) -> dict:
+    found = {}
+    with EMBED_CACHE_LOCK:
+        for key in keys:
+            vector = EMBED_CACHE.get(key)
+            if vector is not None:
+                EMBED_CACHE.move_to_end(key)
+                found[key] = vector
+        pending = [k for k in dict.fromkeys(keys) if k not in found]
+    if not pending or not EMBED_CACHE_PERSIST:
+        return found
+    loaded = {}
+    try:
+        with EMBED_CACHE_DB_LOCK:
+            db = _embed_cache_db()
+            for start in range(0, len(pending), 500):
+                batch = pending[start : start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch
+                )
+                for key, blob in rows:
+                    loaded[key] = np.frombuffer(blob, dtype=np.float32)
+    except sqlite3.Error as exc:
+        print(f"[rag] embedding cache read failed: {exc}")
+    if loaded:
+        with EMBED_CACHE_LOCK:
+            for key, vector in loaded.items():
+                _embed_cache_remember(key, vector)
+            EMBED_CACHE_STATS["disk_hits"] += len(loaded)
+        found.update(loaded)
+    return found
+
+
+def _embed_cache_store(entries: dict, persist: bool = True):
+    with EMBED_CACHE_LOCK:
+        for key, vector in entries.items():
+            _embed_cache_remember(key, vector)
+        if not (EMBED_CACHE_PERSIST and persist):
+            return
+        pending = _EMBED_CACHE_PENDING
+        if not pending["rows"]:
+            pending["since"] = time.monotonic()
+        pending["rows"].extend((key, vector.tobytes()) for key, vector in entries.items())
+        if (
+            len(pending["rows"]) < EMBED_CACHE_WRITE_BATCH
+            and time.monotonic() - pending["since"] < EMBED_CACHE_WRITE_SECONDS
+        ):
+            return
+        rows, pending["rows"] = pending["rows"], []
+    _embed_cache_flush(rows)
+
+
+def _embed_cache_flush(rows: list):
+    if not rows:
+        return
+    try:
+        with EMBED_CACHE_DB_LOCK:
+            db = _embed_cache_db()
+            with db:
+                db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)", rows
+                )
+                # rowids grow with inserts: keep only the newest rows.
+                db.execute(
+                    "DELETE FROM embeddings WHERE rowid <= "
+                    "(SELECT MAX(rowid) FROM embeddings) - ?",
+                    (EMBED_CACHE_DISK_MAX_ENTRIES,),
+                )
+    except sqlite3.Error as exc:
+        print(f"[rag] embedding cache write failed: {exc}")
+
+
+def _flush_embed_cache():
+    with EMBED_CACHE_LOCK:
+        rows, _EMBED_CACHE_PENDING["rows"] = _EMBED_CACHE_PENDING["rows"], []
+    _embed_cache_flush(rows)
+
+
+def _embed_texts(texts, persist: bool = True) -> np.ndarray:
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    backend = _embedding_backend()
+    keys = [_embed_cache_key(text, backend) for text in texts]
+    found = _embed_cache_lookup(keys)
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    with EMBED_CACHE_LOCK:
+        EMBED_CACHE_STATS["hits"] += len(keys) - len(missing)
+        EMBED_CACHE_STATS["misses"] += len(missing)
+    if missing:
+        started = time.perf_counter()
+        model = _get_embedding_model()
+        encoded = model.encode(list(missing.values()), normalize_embeddings=True)
+        _note_first_request("embedding", started)
+        encoded = np.asarray(encoded, dtype=np.float32)
+        fresh = dict(zip(missing.keys(), encoded))
+        _embed_cache_store(fresh, persist)
+        found.update(fresh)
+    return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+
+def _embed_cache_stats() -> dict:
+    with EMBED_CACHE_LOCK:
+        stats = dict(EMBED_CACHE_STATS)
+        stats["entries"] = len(EMBED_CACHE)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def _keyword_tokens(text: str) -> list[str]:
+    return [t for t in RAG_TOKEN_RE.findall(text.lower()) if len(t) > 3]
+
+
+def _add_postings(postings: dict, idx: int, doc: str):
+    for token in set(_keyword_tokens(doc)):
+        postings.setdefault(token, []).append(idx)
+
+
+def _visible_postings(ids: list, count: int) -> np.ndarray:
+    # Posting lists are shared with writers and only grow at the end; ids
+    # past the snapshot's `count` belong to chunks it does not hold yet.
+    return np.array(ids[: bisect.bisect_left(ids, count)], dtype=np.int64)
+
+
+def _keyword_bonus(postings: list) -> tuple[np.ndarray, np.ndarray]:
+    # One posting list per query keyword (repeats included, as each occurrence
+    # earns its own bonus); cost is proportional to the matching postings only.
+    postings = [p for p in postings if len(p)]
+    if not postings:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    ids, hits = np.unique(np.concatenate(postings), return_counts=True)
+    bonus = np.minimum(hits * RAG_KEYWORD_BONUS, RAG_KEYWORD_BONUS_MAX)
+    return ids, bonus.astype(np.float32)
+
+
+def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _ivf_assign(centroids: np.ndarray, rows, batch: int = 8192) -> np.ndarray:
+    assign = np.empty(len(rows), dtype=np.int64)
+    for start in range(0, len(rows), batch):
+        block = np.asarray(rows[start : start + batch], dtype=np.float32)
+        assign[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _ivf_train(matrix, nlist: int, seed: int = 0) -> np.ndarray:
+    # Spherical k-means on a sample: embeddings are unit vectors, so the
+    # coarse quantizer uses the same inner product as the exact scorer.
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), nlist * RAG_ANN_SAMPLE_PER_LIST)
+    picked = np.sort(rng.choice(len(matrix), sample_size, replace=False))
+    sample = np.asarray(matrix[picked], dtype=np.float32)
+    # int8 rows carry their own scale: normalize so each row weighs the same.
+    sample /= np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(RAG_ANN_KMEANS_ITERS):
+        assign = _ivf_assign(centroids, sample)
+        order = np.argsort(assign, kind="stable")
+        sizes = np.bincount(assign, minlength=nlist)
+        filled = np.flatnonzero(sizes)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[filled]
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        centroids[filled] = sums
+        empty = np.flatnonzero(sizes == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.maximum(norms, 1e-12)
+    return centroids
+
+
+def _ivf_lists(assign: np.ndarray, nlist: int, offset: int = 0) -> list:
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+    ids = order + offset
+    return [ids[bounds[c] : bounds[c + 1]] for c in range(nlist)]
+
+
+def _ivf_build(matrix) -> dict:
+    nlist = int(_clamp(round(len(matrix) ** 0.5), 16, 4096))
+    centroids = _ivf_train(matrix, nlist)
+    lists = _ivf_lists(_ivf_assign(centroids, matrix), nlist)
+    return {"centroids": centroids, "lists": lists, "trained_on": len(matrix)}
+
+
+def _ivf_insert(ivf: dict, rows, start: int) -> dict:
+    # Copy-on-write: readers keep using the previous lists untouched.
+    assign = _ivf_assign(ivf["centroids"], rows)
+    lists = list(ivf["lists"])
+    for c in np.unique(assign):
+        new_ids = np.flatnonzero(assign == c) + start
+        lists[c] = np.concatenate((lists[c], new_ids))
+    return {**ivf, "lists": lists}
+
+
+def _ivf_candidates(ivf: dict, query_emb: np.ndarray, nprobe: int) -> np.ndarray:
+    probe = _top_k_indices(ivf["centroids"] @ query_emb, nprobe)
+    return np.concatenate([ivf["lists"][c] for c in probe])
+
+
+def _maybe_build_ann():
+    store = RAG_STORE
+    count = store["count"]
+    docs_ref = store["docs"]
+    ann = store["ann"]
+    embeds = store["embeds"][:count] if count else None
+    if count < RAG_ANN_MIN_CHUNKS:
+        return
+    if ann is not None and count < ann["trained_on"] * RAG_ANN_RETRAIN_GROWTH:
+        return
+    # Another request is already training; it keeps using the exact scan.
+    if not RAG_ANN_LOCK.acquire(blocking=False):
+        return
+    try:
+        start_ts = time.perf_counter()
+        ivf = _ivf_build(embeds)
+        with RAG_LOCK:
+            if RAG_STORE["docs"] is not docs_ref:
+                return
+            current = RAG_STORE["count"]
+            if current > count:
+                ivf = _ivf_insert(ivf, RAG_STORE["embeds"][count:current], count)
+            _publish_rag_store(ann=ivf)
+        elapsed = time.perf_counter() - start_ts
+        print(
+            f"[rag] IVF index built: {len(ivf['lists'])} lists over "
+            f"{count} chunks in {elapsed:.1f}s"
+        )
+    finally:
+        RAG_ANN_LOCK.release()
+
+
+def _schedule_ann_build():
+    # Training takes seconds at 100k+ chunks: run it off the request path,
+    # queries use the exact scan until the new index is published.
+    if RAG_STORE["count"] >= RAG_ANN_MIN_CHUNKS:
+        threading.Thread(target=_maybe_build_ann, name="rag-ann", daemon=True).start()
+
+
+def _retrieve_chunks(
+    query: str, top_k: int, min_score: float, nprobe: int = RAG_ANN_NPROBE
+):
+    store = RAG_STORE
+    count = store["count"]
+    docs = store["docs"]
+    sources = store["sources"]
+    embeds = store["embeds"][:count] if count else None
+    scales = store["scales"]
+    scales = scales[:count] if count and scales is not None else None
+    ann = store["ann"]
+    keyword_postings = [
+        _visible_postings(store["postings"].get(kw, ()), count)
+        for kw in _keyword_tokens(query)
+    ]
+
+    if not count:
+        return []
+
+    query_emb = _embed_texts([query])[0]
+    if not np.any(query_emb):
+        return []
+
+    keyword_ids, keyword_bonus = _keyword_bonus(keyword_postings)
+
+    if ann is not None and nprobe < len(ann["lists"]):
+        # Hybrid candidates: ANN neighbours plus every lexical match, so a
+        # strong keyword hit cannot be lost by the coarse quantizer.
+        candidates = np.union1d(_ivf_candidates(ann, query_emb, nprobe), keyword_ids)
+        scores = _score_rows(embeds, scales, query_emb, candidates)
+        scores[np.searchsorted(candidates, keyword_ids)] += keyword_bonus
+    else:
+        candidates = None
+        scores = _score_rows(embeds, scales, query_emb)
+        scores[keyword_ids] += keyword_bonus
+
+    results = []
+    for pos in _top_k_indices(scores, top_k):
+        score = float(scores[pos])
+        if score < min_score:
+            continue
+        idx = int(candidates[pos]) if candidates is not None else int(pos)
+        results.append(
+            {
+                "score": score,
+                "text": docs[idx],
+                "source": sources[idx],
+            }
+        )
+    return results
+
+
+def _build_context_block(results):
+    if not results:
+        return ""
+    lines = ["### CONTEXTE DOCUMENTAIRE"]
+    for i, r in enumerate(results, start=1):
+        src = r["source"]
+        chunk = r["text"].strip()
+        lines.append(f"[{i}] Source: {src}\n{chunk}\n")
+    return "\n".join(lines)
+
+
+def _commit_rag_chunks(chunks: list[str], sources: list[str], embeds: np.ndarray) -> int:
+    hashes = [_chunk_hash(chunk) for chunk in chunks]
+    with RAG_LOCK:
+        store = RAG_STORE
+        keep, seen = [], set()
+        for idx, h in enumerate(hashes):
+            if h not in store["hashes"] and h not in seen:
+                seen.add(h)
+                keep.append(idx)
+        if not keep:
+            return 0
+        # Everything below lands past the published `count`: invisible to
+        # queries until the new snapshot is swapped in at the end.
+        start = store["count"]
+        fields = _append_rag_embeddings(embeds[keep])
+        if store["ann"] is not None:
+            fields["ann"] = _ivf_insert(store["ann"], embeds[keep], start)
+        fields["unsaved"] = store["unsaved"] + len(keep)
+        fields["embedding_backend"] = _merge_embedding_backend(
+            store["embedding_backend"] if store["count"] else None, _embedding_backend()
+        )
+        for offset, idx in enumerate(keep):
+            _add_postings(store["postings"], start + offset, chunks[idx])
+            store["docs"].append(chunks[idx])
+            store["sources"].append(sources[idx])
+        store["hashes"].update(seen)
+        _publish_rag_store(**fields)
+    return len(keep)
+
+
+def _get_ingest_pool():
+    global _RAG_INGEST_POOL
+    if _RAG_INGEST_POOL is None:
+        # spawn, not fork: the server already runs vision, preload and torch threads.
+        _RAG_INGEST_POOL = ProcessPoolExecutor(
+            max_workers=RAG_INGEST_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _RAG_INGEST_POOL
+
+
+def _close_ingest_pool():
+    RAG_INGEST_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    if _RAG_INGEST_POOL is not None:
+        _RAG_INGEST_POOL.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> list[str]:
+    # Runs in a worker process: top-level so it can be pickled.
+    import fitz
+
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def _ingest_progress(job: dict, **deltas):
+    with RAG_INGEST_LOCK:
+        for key, value in deltas.items():
+            job[key] += value
+
+
+def _ingest_extract(name: str, data: bytes, job: dict):
+    if not name.lower().endswith(".pdf"):
+        return _text_from_bytes(name, data)
+    try:
+        import fitz
+    except Exception:
+        return "", "Erreur : installez PyMuPDF via `pip install pymupdf`."
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            page_count = doc.page_count
+        _ingest_progress(job, pages_total=page_count)
+        # Tasks get a file path, not the bytes: pickling the whole PDF into
+        # every page range would copy it page_count / 16 times over IPC.
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            pool = _get_ingest_pool()
+            futures = [
+                pool.submit(
+                    _extract_pdf_pages,
+                    path,
+                    start,
+                    min(start + RAG_INGEST_PAGES_PER_TASK, page_count),
+                )
+                for start in range(0, page_count, RAG_INGEST_PAGES_PER_TASK)
+            ]
+            pages = []
+            for future in futures:
+                part = future.result()
+                pages.extend(part)
+                _ingest_progress(job, pages_done=len(part))
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                # Still open in a worker after a failed page range (Windows).
+                pass
+        return "\n".join(pages), None
+    except Exception as exc:
+        return "", f"Erreur de lecture PDF (PyMuPDF) : {exc}"
+
+
+def _ingest_embed_worker(work: queue.Queue, job: dict):
+    # Drains the chunk queue into large cross-file batches. On failure it keeps
+    # draining so the producer never blocks on a full queue.
+    batch = []
+    failed = False
+
+    def flush():
+        nonlocal failed
+        if not batch or failed:
+            batch.clear()
+            return
+        chunks = [chunk for chunk, _ in batch]
+        sources = [source for _, source in batch]
+        try:
+            embeds = _embed_texts(chunks)
+            added = _commit_rag_chunks(chunks, sources, embeds)
+        except Exception as exc:
+            # Model download failures surface as OSError, not RuntimeError.
+            failed = True
+            print(f"[rag] ingest {job['id']} embedding failed: {exc}")
+            with RAG_INGEST_LOCK:
+                job["errors"].append(f"Erreur d'embedding : {exc}")
+                job["status"] = "error"
+            batch.clear()
+            return
+        _ingest_progress(job, chunks_embedded=len(batch), chunks_added=added)
+        batch.clear()
+
+    while True:
+        try:
+            item = work.get(timeout=RAG_INGEST_FLUSH_SECONDS)
+        except queue.Empty:
+            flush()
+            continue
+        if item is None:
+            flush()
+            return
+        batch.append(item)
+        if len(batch) >= RAG_INGEST_BATCH:
+            flush()
+
+
+def _ingest_put(work: queue.Queue, item, embedder: threading.Thread) -> bool:
+    # Never block forever on a full queue: False once the embedder is gone.
+    while embedder.is_alive():
+        try:
+            work.put(item, timeout=RAG_INGEST_FLUSH_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _run_ingest_job(job: dict, uploads: list, chunk_size: int, overlap: int):
+    try:
+        _ingest_uploads(job, uploads, chunk_size, overlap)
+    except Exception as exc:
+        print(f"[rag] ingest {job['id']} failed: {exc}")
+        with RAG_INGEST_LOCK:
+            job["status"] = "error"
+            job["errors"].append(f"Erreur d'indexation : {exc}")
+            job["finished"] = time.time()
+
+
+def _ingest_uploads(job: dict, uploads: list, chunk_size: int, overlap: int):
+    with RAG_INGEST_LOCK:
+        job["status"] = "running"
+        job["started"] = time.time()
+    work = queue.Queue(maxsize=RAG_INGEST_QUEUE_SIZE)
+    embedder = threading.Thread(
+        target=_ingest_embed_worker, args=(work, job), name="rag-embed", daemon=True
+    )
+    embedder.start()
+    try:
+        with RAG_LOCK:
+            known_hashes = set(RAG_STORE["hashes"])
+        for name, data in uploads:
+            if job["status"] == "error":
+                # Embedding failed: the remaining files would be dropped anyway.
+                break
+            text, err = _ingest_extract(name, data, job)
+            _ingest_progress(job, files_done=1)
+            if err:
+                with RAG_INGEST_LOCK:
+                    job["errors"].append(f"{name} - {err}")
+                continue
+            for chunk in _chunk_text(text, chunk_size, overlap):
+                h = _chunk_hash(chunk)
+                if h in known_hashes:
+                    continue
+                known_hashes.add(h)
+                if not _ingest_put(work, (chunk, name), embedder):
+                    raise RuntimeError("le thread d'embedding s'est arrete")
+                _ingest_progress(job, chunks_queued=1)
+    finally:
+        ended = _ingest_put(work, None, embedder)
+        embedder.join()
+    if not ended:
+        raise RuntimeError("le thread d'embedding s'est arrete")
+
+    if job["chunks_added"]:
+        _llm_cache_invalidate("rag")
+        _save_rag_store()
+        _maybe_build_ann()
+
+    elapsed = max(time.time() - job["started"], 1e-6)
+    with RAG_INGEST_LOCK:
+        if job["status"] == "running":
+            job["status"] = "done"
+        job["finished"] = time.time()
+        job["pages_per_s"] = job["pages_done"] / elapsed
+        job["chunks_per_s"] = job["chunks_embedded"] / elapsed
+    print(
+        f"[rag] ingest {job['id']}: {job['pages_done']} pages, "
+        f"{job['chunks_embedded']} chunks in {elapsed:.1f}s "
+        f"({job['pages_per_s']:.1f} pages/s, {job['chunks_per_s']:.1f} chunks/s)"
+    )
+
+
+def _new_ingest_job(files: list[str]) -> dict:
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "files": files,
+        "files_done": 0,
+        "pages_total": 0,
+        "pages_done": 0,
+        "chunks_queued": 0,
+        "chunks_embedded": 0,
+        "chunks_added": 0,
+        "errors": [],
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+        "pages_per_s": None,
+        "chunks_per_s": None,
+    }
+    with RAG_INGEST_LOCK:
+        RAG_INGEST_JOBS[job["id"]] = job
+        while len(RAG_INGEST_JOBS) > RAG_INGEST_MAX_JOBS:
+            RAG_INGEST_JOBS.popitem(last=False)
+    return job
+
+
+def _ingest_job_view(job: dict) -> dict:
+    with RAG_INGEST_LOCK:
+        view = {**job, "errors": list(job["errors"])}
+    view["job_id"] = view.pop("id")
+    if view["started"] and not view["finished"]:
+        elapsed = max(time.time() - view["started"], 1e-6)
+        view["pages_per_s"] = view["pages_done"] / elapsed
+        view["chunks_per_s"] = view["chunks_embedded"] / elapsed
+    return view
+
+
+def _load_faster_whisper():
+    from faster_whisper import WhisperModel  # type: ignore
+
+    # CTranslate2 engine: int8 weights on CPU by default.
+    return WhisperModel(ASR_VARIANT, device="cpu", compute_type=ASR_COMPUTE_TYPE)
+
+
+def _load_openai_whisper():
+    import whisper  # type: ignore
+
+    return whisper.load_model(ASR_VARIANT, device="cpu")
+
+
+def _load_transformers_asr(quantize: bool = False):
+    from transformers import pipeline  # type: ignore
+
+    asr = pipeline(
+        "automatic-speech-recognition",
+        model=f"openai/whisper-{ASR_VARIANT}",
+        device="cpu",
+    )
+    if quantize:
+        import torch  # type: ignore
+
+        asr.model = torch.ao.quantization.quantize_dynamic(
+            asr.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return asr
+
+
+_ASR_LOADERS = {
+    "faster-whisper": _load_faster_whisper,
+    "whisper": _load_openai_whisper,
+    "transformers": _load_transformers_asr,
+    "transformers-int8": lambda: _load_transformers_asr(quantize=True),
+}
+
+
+def _asr_probe_clip(seconds: float) -> np.ndarray:
+    # Voiced-like bursts: silence would let the decoder stop right away.
+    rate = ASR_TARGET_SAMPLE_RATE
+    t = np.arange(int(seconds * rate), dtype=np.float32) / rate
+    bursts = (np.sin(2 * np.pi * 2.0 * t) > 0).astype(np.float32)
+    voice = np.sin(2 * np.pi * 140 * t) + 0.5 * np.sin(2 * np.pi * 280 * t)
+    return (0.2 * bursts * voice).astype(np.float32)
+
+
+def _asr_probe_rtf(name: str, backend) -> float:
+    clip = _asr_probe_clip(ASR_PROBE_SECONDS)
+    _transcribe_samples(name, backend, clip, ASR_DEFAULT_LANGUAGE)
+    started = time.perf_counter()
+    _transcribe_samples(name, backend, clip, ASR_DEFAULT_LANGUAGE)
+    return (time.perf_counter() - started) / ASR_PROBE_SECONDS
+
+
+def _get_asr_backend():
+    global _ASR_BACKEND
+    if _ASR_BACKEND is not None:
+        return _ASR_BACKEND
+    with ASR_LOCK:
+        if _ASR_BACKEND is not None:
+            return _ASR_BACKEND
+        names = ASR_ENGINES if ASR_ENGINE == "auto" else (ASR_ENGINE,)
+        best, best_rtf, errors = None, None, []
+        for name in names:
+            try:
+                backend = _ASR_LOADERS[name]()
+            except Exception as exc:
+                errors.append(f"{name}: {exc}")
+                continue
+            if len(names) == 1:
+                best = (name, backend)
+                break
+            try:
+                rtf = _asr_probe_rtf(name, backend)
+            except Exception as exc:
+                errors.append(f"{name}: {exc}")
+                continue
+            _ASR_PROBE_RTF[name] = round(rtf, 4)
+            print(f"[asr] {name} ({ASR_VARIANT}) real-time factor {rtf:.3f}")
+            if best is None or rtf < best_rtf:
+                # Dropping the slower engine here frees its weights.
+                best, best_rtf = (name, backend), rtf
+        _ASR_BACKEND = best or ("none", "; ".join(errors) or "aucun moteur configure")
+        return _ASR_BACKEND
+
+
+def _decode_wav_bytes(audio_bytes: bytes) -> np.ndarray:
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        if rate != ASR_TARGET_SAMPLE_RATE:
+            # Resampling needs a low-pass filter: leave it to PyAV/ffmpeg.
+            raise wave.Error(f"sample rate {rate}")
+        raw = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width in (2, 4):
+        dtype = np.int16 if width == 2 else np.int32
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32) / float(2 ** (8 * width - 1))
+    else:
+        raise wave.Error(f"unsupported sample width {width}")
+    return samples.reshape(-1, channels).mean(axis=1).astype(np.float32, copy=False)
+
+
+def _iter_audio_av(av, source):
+    # Mono float32 blocks at ASR_TARGET_SAMPLE_RATE from bytes or a file object
+    # (a pipe for /ws/audio, read as the recording arrives).
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=ASR_TARGET_SAMPLE_RATE)
+    with av.open(source, mode="r") as container:
+        try:
+            for frame in container.decode(audio=0):
+                for out in resampler.resample(frame):
+                    yield out.to_ndarray().reshape(-1)
+        except (av.error.FFmpegError, EOFError):
+            # Truncated stream (a recording cut short): keep what decoded.
+            pass
+    for out in resampler.resample(None):
+        yield out.to_ndarray().reshape(-1)
+
+
+def _decode_audio_av(av, audio_bytes: bytes) -> np.ndarray:
+    parts = list(_iter_audio_av(av, audio_bytes))
+    if not parts:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(parts).astype(np.float32, copy=False)
+
+
+def _ffmpeg_pcm_command() -> list[str]:
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(ASR_TARGET_SAMPLE_RATE), "pipe:1",
+    ]
+
+
+def _iter_audio_ffmpeg(source):
+    # Streaming counterpart of _decode_audio_ffmpeg: ffmpeg reads the pipe itself.
+    proc = subprocess.Popen(
+        _ffmpeg_pcm_command(), stdin=source, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    pending = b""
+    try:
+        while True:
+            block = proc.stdout.read1(65536)
+            if not block:
+                break
+            pending += block
+            usable = len(pending) - len(pending) % 4
+            if usable:
+                yield np.frombuffer(pending[:usable], dtype=np.float32)
+                pending = pending[usable:]
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def _decode_audio_ffmpeg(audio_bytes: bytes) -> np.ndarray:
+    # Without PyAV: still no temp file, ffmpeg reads stdin and writes raw PCM.
+    proc = subprocess.run(
+        _ffmpeg_pcm_command(),
+        input=audio_bytes,
+        capture_output=True,
+        check=False,
+    )
+    if proc.returncode != 0 and not proc.stdout:
+        raise RuntimeError(proc.stderr.decode("utf-8", "replace").strip() or "ffmpeg a echoue")
+    usable = len(proc.stdout) - len(proc.stdout) % 4
+    return np.frombuffer(proc.stdout[:usable], dtype=np.float32)
+
+
+def _decode_audio_bytes(audio_bytes: bytes) -> np.ndarray:
+    # Mono float32 at ASR_TARGET_SAMPLE_RATE, decoded in memory.
+    if audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE":
+        try:
+            return _decode_wav_bytes(audio_bytes)
+        except (wave.Error, EOFError):
+            pass
+    try:
+        import av  # type: ignore
+    except ImportError:
+        return _decode_audio_ffmpeg(audio_bytes)
+    return _decode_audio_av(av, audio_bytes)
+
+
+def _transcribe_samples(backend_name: str, backend, samples: np.ndarray, language: str) -> str:
+    if samples.size == 0:
+        return ""
+    if backend_name == "faster-whisper":
+        # Greedy, like openai-whisper's default, so engines compare on equal terms.
+        segments, _ = backend.transcribe(samples, language=language, beam_size=1)
+        return "".join(segment.text for segment in segments).strip()
+    if backend_name == "whisper":
+        result = backend.transcribe(samples, language=language, fp16=False)
+        return (result.get("text") or "").strip()
+    out = backend(
+        {"raw": samples, "sampling_rate": ASR_TARGET_SAMPLE_RATE},
+        generate_kwargs={"language": language},
+    )
+    return (out.get("text") if isinstance(out, dict) else str(out)).strip()
+
+
+def _asr_unavailable_message(detail: str) -> str:
+    return (
+        "Aucun backend Whisper local disponible.\n\n"
+        "Installez l'un des deux:\n"
+        "- `pip install -U faster-whisper` (int8, le plus rapide sur CPU)\n"
+        "ou\n"
+        "- `pip install -U openai-whisper`\n"
+        "ou\n"
+        "- `pip install -U transformers accelerate` (et torch)\n\n"
+        f"Detail: {detail}"
+    )
+
+
+def _asr_worker_init(warm: bool, engine: str):
+    # Runs once in each ASR process; failures surface per job, not here.
+    global ASR_ENGINE
+    ASR_ENGINE = engine
+    try:
+        backend_name, backend = _get_asr_backend()
+        if warm and backend_name != "none":
+            _warm_asr((backend_name, backend))
+    except Exception as exc:
+        print(f"[asr] worker warm-up failed: {exc}")
+
+
+def _asr_worker_ping() -> str:
+    return _get_asr_backend()[0]
+
+
+def _asr_worker_probe() -> tuple[str, dict, str]:
+    name, backend = _get_asr_backend()
+    return name, dict(_ASR_PROBE_RTF), backend if name == "none" else ""
+
+
+def _asr_worker_run(language: str, clips: list) -> tuple[str, list[str]]:
+    backend_name, backend = _get_asr_backend()
+    if backend_name == "none":
+        raise RuntimeError(_asr_unavailable_message(backend))
+    try:
+        if backend_name.startswith("transformers") and len(clips) > 1:
+            outputs = backend(
+                [{"raw": clip, "sampling_rate": ASR_TARGET_SAMPLE_RATE} for clip in clips],
+                batch_size=len(clips),
+                generate_kwargs={"language": language},
+            )
+            texts = [
+                (out.get("text") if isinstance(out, dict) else str(out)).strip()
+                for out in outputs
+            ]
+        else:
+            texts = [_transcribe_samples(backend_name, backend, clip, language) for clip in clips]
+    except Exception as exc:
+        raise RuntimeError(f"Erreur de transcription: {exc}") from exc
+    return backend_name, texts
+
+
+def _select_asr_engine() -> str:
+    # "auto" is resolved once, in one throwaway process: the timings are not
+    # taken while workers compete for the CPU, and every worker runs the winner.
+    if ASR_ENGINE != "auto":
+        return ASR_ENGINE
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as probe:
+        name, rtf, detail = probe.submit(_asr_worker_probe).result()
+    if name == "none":
+        # Installing an engine needs a restart anyway: do not probe per job.
+        _ASR_DISPATCH["unavailable"] = _asr_unavailable_message(detail)
+        raise RuntimeError(_ASR_DISPATCH["unavailable"])
+    _ASR_DISPATCH["probe_rtf"] = rtf
+    print(f"[asr] selected {name} ({ASR_VARIANT})")
+    return name
+
+
+def _get_asr_pool() -> ProcessPoolExecutor:
+    # Blocking (engine probe, process start): call it off the event loop.
+    global _ASR_POOL
+    with ASR_POOL_LOCK:
+        # Checked under the lock: batches waiting on a failed probe reuse its error.
+        if _ASR_DISPATCH["unavailable"]:
+            raise RuntimeError(_ASR_DISPATCH["unavailable"])
+        if _ASR_POOL is None:
+            if _ASR_DISPATCH["backend"] is None:
+                _ASR_DISPATCH["backend"] = _select_asr_engine()
+            # spawn, not fork: torch thread pools do not survive a fork.
+            _ASR_POOL = ProcessPoolExecutor(
+                max_workers=ASR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_asr_worker_init,
+                initargs=(PRELOAD_WARMUP, _ASR_DISPATCH["backend"]),
+            )
+        return _ASR_POOL
+
+
+def _reset_asr_pool(broken: ProcessPoolExecutor):
+    global _ASR_POOL
+    with ASR_POOL_LOCK:
+        if _ASR_POOL is not broken:
+            return
+        _ASR_POOL = None
+    print("[asr] worker pool broken, respawning on next job")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _close_asr_pool():
+    if _ASR_DISPATCH["task"] is not None:
+        _ASR_DISPATCH["task"].cancel()
+    if _ASR_POOL is not None:
+        _ASR_POOL.shutdown(wait=False, cancel_futures=True)
+
+
+def _take_asr_batch(queue: list, batching: bool) -> list:
+    # FIFO head first, then queued clips in the same language and length band.
+    head = queue.pop(0)
+    batch = [head]
+    if not batching or head["seconds"] > ASR_BATCH_MAX_SECONDS:
+        return batch
+    lo = hi = max(head["seconds"], 0.1)
+    rest = []
+    for item in queue:
+        seconds = max(item["seconds"], 0.1)
+        if (
+            len(batch) < ASR_BATCH_MAX
+            and item["language"] == head["language"]
+            and seconds <= ASR_BATCH_MAX_SECONDS
+            and max(hi, seconds) / min(lo, seconds) <= ASR_BATCH_LENGTH_RATIO
+        ):
+            lo, hi = min(lo, seconds), max(hi, seconds)
+            batch.append(item)
+        else:
+            rest.append(item)
+    queue[:] = rest
+    return batch
+
+
+def _asr_retry_after(dispatch: dict) -> int:
+    per_job = dispatch["busy_s"] / dispatch["completed"] if dispatch["completed"] else 2.0
+    return max(1, math.ceil(per_job * (len(dispatch["queue"]) + 1) / ASR_WORKERS))
+
+
+def _enqueue_asr(samples: np.ndarray, language: str) -> dict:
+    # Returns the queued job: "position" is how many jobs are ahead of it,
+    # await job["future"] for the result.
+    dispatch = _ASR_DISPATCH
+    if len(dispatch["queue"]) >= ASR_QUEUE_MAX:
+        dispatch["rejected"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Transcription saturee, reessayez dans quelques secondes.",
+            headers={"Retry-After": str(_asr_retry_after(dispatch))},
+        )
+    if dispatch["task"] is None or dispatch["task"].done():
+        dispatch["ready"] = asyncio.Event()
+        dispatch["task"] = asyncio.create_task(_asr_dispatch_loop())
+    job = {
+        "samples": samples,
+        "language": language,
+        "seconds": samples.size / ASR_TARGET_SAMPLE_RATE,
+        "position": len(dispatch["queue"]) + (1 if dispatch["busy"] >= ASR_WORKERS else 0),
+        "queued": time.perf_counter(),
+        "future": asyncio.get_running_loop().create_future(),
+    }
+    dispatch["queue"].append(job)
+    dispatch["ready"].set()
+    return job
+
+
+async def _asr_dispatch_loop():
+    dispatch = _ASR_DISPATCH
+    while True:
+        dispatch["ready"].clear()
+        while dispatch["queue"] and dispatch["busy"] < ASR_WORKERS:
+            batching = (dispatch["backend"] or "").startswith("transformers")
+            batch = _take_asr_batch(dispatch["queue"], batching)
+            dispatch["busy"] += 1
+            task = asyncio.create_task(_run_asr_batch(batch))
+            dispatch["running"].add(task)
+            task.add_done_callback(dispatch["running"].discard)
+        await dispatch["ready"].wait()
+
+
+async def _run_asr_batch(batch: list):
+    dispatch = _ASR_DISPATCH
+    started = time.perf_counter()
+    pool = None
+    try:
+        pool = _ASR_POOL or await asyncio.to_thread(_get_asr_pool)
+        future = pool.submit(
+            _asr_worker_run, batch[0]["language"], [job["samples"] for job in batch]
+        )
+        _, texts = await asyncio.wrap_future(future)
+    except Exception as exc:
+        if isinstance(exc, BrokenProcessPool):
+            # A worker died (OOM on a long clip...): drop the pool so the next
+            # batch spawns a fresh one instead of failing until restart. Without
+            # a pool, the engine probe process itself died.
+            if pool is not None:
+                _reset_asr_pool(pool)
+            exc = RuntimeError("Le processus de transcription s'est arrete, reessayez.")
+        for job in batch:
+            if not job["future"].done():
+                job["future"].set_exception(exc)
+        return
+    finally:
+        dispatch["busy"] -= 1
+        dispatch["ready"].set()
+    elapsed = time.perf_counter() - started
+    dispatch["completed"] += len(batch)
+    dispatch["batches"] += 1
+    dispatch["busy_s"] += elapsed
+    dispatch["audio_s"] += sum(job["seconds"] for job in batch)
+    for job, text in zip(batch, texts):
+        if not job["future"].done():
+            job["future"].set_result(
+                {
+                    "text": text,
+                    "queue_ms": (started - job["queued"]) * 1000.0,
+                    "asr_ms": elapsed * 1000.0,
+                    "batch_size": len(batch),
+                }
+            )
 
-def _transcribe_audio_bytes(audio_bytes: bytes, language: str, suffix: str = ".wav"):
-    backend_name, backend = _get_asr_backend()
-    if backend_name == "none":
-        return None, (
-            "Aucun backend Whisper local disponible.\n\n"
-            "Installez l'un des deux:\n"
-            "- `pip install -U openai-whisper`\n"
-            "ou\n"
-            "- `pip install -U transformers accelerate` (et torch)\n\n"
-            f"Detail: {backend}"
-        )
 
-    tmp_path = None
-    try:
-        fd, tmp_path = tempfile.mkstemp(suffix=suffix)
-        os.close(fd)
-        with open(tmp_path, "wb") as handle:
-            handle.write(audio_bytes)
+def _start_asr_pool():
+    pool = _get_asr_pool()
+    # One ping per worker so every process is spawned and its model loaded.
+    pings = [f.result() for f in [pool.submit(_asr_worker_ping) for _ in range(ASR_WORKERS)]]
+    if "none" in pings:
+        raise RuntimeError("Aucun backend Whisper local disponible.")
+    print(f"[asr] {ASR_WORKERS} workers on {_ASR_DISPATCH['backend']} ({ASR_VARIANT})")
+    return pings
+
+
+def _new_vad_state() -> dict:
+    return {
+        "audio": np.zeros(0, dtype=np.float32),
+        "offset": 0,
+        "pos": 0,
+        "noise": None,
+        "speech_start": None,
+        "last_voice": 0,
+        # End of the last segment handed out: the next one never starts before it.
+        "floor": 0,
+    }
+
+
+def _vad_segment(vad: dict, end: int, forced: bool = False) -> dict | None:
+    # Cut the open segment at `end` (absolute sample index) and reset it. A forced cut
+    # lands mid-speech, so it gets no trailing pad and the next segment starts there.
+    start = vad["speech_start"]
+    vad["speech_start"] = None
+    rate = ASR_TARGET_SAMPLE_RATE
+    if vad["last_voice"] - start < AUDIO_VAD_MIN_SPEECH_MS * rate // 1000:
+        return None
+    pad = AUDIO_VAD_PAD_MS * rate // 1000
+    lo = max(start - pad, vad["offset"], vad["floor"])
+    hi = end if forced else min(end + pad, vad["offset"] + len(vad["audio"]))
+    vad["floor"] = hi
+    audio = vad["audio"][lo - vad["offset"] : hi - vad["offset"]].copy()
+    return {"start": lo / rate, "end": hi / rate, "audio": audio}
+
+
+def _vad_feed(vad: dict, samples: np.ndarray) -> list[dict]:
+    rate = ASR_TARGET_SAMPLE_RATE
+    frame = AUDIO_VAD_FRAME_MS * rate // 1000
+    vad["audio"] = np.concatenate([vad["audio"], samples])
+    begin = vad["pos"] - vad["offset"]
+    count = (len(vad["audio"]) - begin) // frame
+    if count <= 0:
+        return []
+    frames = vad["audio"][begin : begin + count * frame].reshape(count, frame)
+    levels = np.sqrt(np.mean(frames * frames, axis=1))
+    silence = AUDIO_VAD_SILENCE_MS * rate // 1000
+    longest = int(AUDIO_SEGMENT_MAX_SECONDS * rate)
+    closed = []
+    for i, level in enumerate(levels.tolist()):
+        pos = vad["pos"] + i * frame
+        noise = vad["noise"]
+        if level > max(AUDIO_VAD_MIN_RMS, (noise or 0.0) * AUDIO_VAD_NOISE_RATIO):
+            if vad["speech_start"] is None:
+                vad["speech_start"] = pos
+            vad["last_voice"] = pos + frame
+        else:
+            vad["noise"] = level if noise is None else 0.95 * noise + 0.05 * level
+        start = vad["speech_start"]
+        if start is None:
+            continue
+        if pos + frame - vad["last_voice"] >= silence:
+            segment = _vad_segment(vad, vad["last_voice"])
+        elif pos + frame - start >= longest:
+            segment = _vad_segment(vad, pos + frame, forced=True)
+        else:
+            continue
+        if segment is not None:
+            closed.append(segment)
+    vad["pos"] += count * frame
+    # Keep only what an open segment (plus padding) can still need.
+    keep = vad["pos"] if vad["speech_start"] is None else vad["speech_start"]
+    drop = keep - AUDIO_VAD_PAD_MS * rate // 1000 - vad["offset"]
+    if drop > 0:
+        vad["audio"] = vad["audio"][drop:]
+        vad["offset"] += drop
+    return closed
+
+
+def _vad_open_segment(vad: dict) -> dict | None:
+    start = vad["speech_start"]
+    if start is None:
+        return None
+    rate = ASR_TARGET_SAMPLE_RATE
+    lo = max(start - AUDIO_VAD_PAD_MS * rate // 1000, vad["offset"], vad["floor"])
+    end = (vad["offset"] + len(vad["audio"])) / rate
+    return {"start": start / rate, "end": end, "audio": vad["audio"][lo - vad["offset"] :]}
+
+
+def _new_audio_stream(language: str) -> dict:
+    return {
+        "language": language,
+        # Received bytes not yet handed to the decoder, and the total received.
+        "pending": bytearray(),
+        "bytes": 0,
+        # Write end of the decoder's pipe, its thread, and the PCM blocks it produced.
+        "pipe": None,
+        "decoder": None,
+        "pcm": [],
+        "vad": _new_vad_state(),
+        "segments": [],
+        "partial_at": 0.0,
+        "ready": asyncio.Event(),
+        "stopped": False,
+    }
+
+
+def _audio_segment_event(stream: dict, kind: str, segment: dict, result: dict) -> dict:
+    event = {
+        "type": kind,
+        "segment": len(stream["segments"]),
+        "text": result["text"],
+        "start": round(segment["start"], 2),
+        "end": round(segment["end"], 2),
+        "metrics": {
+            "queue_ms": result["queue_ms"],
+            "asr_ms": result["asr_ms"],
+            "batch_size": result["batch_size"],
+        },
+    }
+    if kind == "segment":
+        stream["segments"].append(result["text"])
+        stream["partial_at"] = 0.0
+    return event
 
-        if backend_name == "whisper":
-            result = backend.transcribe(tmp_path, language=language, fp16=False)
-            text = (result.get("text") or "").strip()
-            return text, None
 
-        out = backend(tmp_path, generate_kwargs={"language": language})
-        text = (out.get("text") if isinstance(out, dict) else str(out)).strip()
-        return text, None
+def _audio_decode_loop(stream: dict, source):
+    # One thread per /ws/audio stream: demuxes and decodes the recording as its
+    # bytes come through the pipe, so every chunk is decoded exactly once.
+    try:
+        try:
+            import av  # type: ignore
+        except ImportError:
+            blocks = _iter_audio_ffmpeg(source)
+        else:
+            blocks = _iter_audio_av(av, source)
+        for block in blocks:
+            stream["pcm"].append(block)
     except Exception as exc:
-        return None, f"Erreur de transcription: {exc}"
+        # Not audio, or stopped before the container header was complete.
+        print(f"[ws/audio] decoder stopped: {exc}")
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+        source.close()
+
+
+def _close_audio_stream(stream: dict):
+    # End of input for the decoder: it drains what it has and exits.
+    if stream["pipe"] is not None:
+        try:
+            stream["pipe"].close()
+        except (OSError, ValueError):
+            pass
+
+
+def _advance_audio_stream(stream: dict, final: bool) -> tuple[list, float]:
+    # Blocking: feed new bytes to the decoder and cut the audio it produced
+    # into ("segment" | "partial", audio) jobs.
+    started = time.perf_counter()
+    if stream["decoder"] is None:
+        read_fd, write_fd = os.pipe()
+        stream["pipe"] = os.fdopen(write_fd, "wb")
+        stream["decoder"] = threading.Thread(
+            target=_audio_decode_loop,
+            args=(stream, os.fdopen(read_fd, "rb")),
+            name="audio-decode",
+            daemon=True,
+        )
+        stream["decoder"].start()
+    data = bytes(stream["pending"])
+    del stream["pending"][: len(data)]
+    try:
+        if data:
+            stream["pipe"].write(data)
+            stream["pipe"].flush()
+    except (OSError, ValueError):
+        # The decoder already gave up on this stream: drop the bytes.
+        pass
+    if final:
+        _close_audio_stream(stream)
+        stream["decoder"].join(AUDIO_STREAM_FINAL_WAIT_SECONDS)
+    # Blocks decoded from this write that are not out yet come next pass.
+    parts = stream["pcm"]
+    taken = len(parts)
+    fresh = np.concatenate(parts[:taken]) if taken else np.zeros(0, dtype=np.float32)
+    del parts[:taken]
+    decode_ms = (time.perf_counter() - started) * 1000.0
+    vad = stream["vad"]
+    jobs = [("segment", segment) for segment in _vad_feed(vad, fresh)]
+    open_segment = _vad_open_segment(vad)
+    if final:
+        if open_segment is not None:
+            segment = _vad_segment(vad, vad["last_voice"])
+            if segment is not None:
+                jobs.append(("segment", segment))
+    elif (
+        AUDIO_PARTIAL_SECONDS > 0
+        and open_segment is not None
+        and open_segment["end"] - max(open_segment["start"], stream["partial_at"])
+        >= AUDIO_PARTIAL_SECONDS
+    ):
+        stream["partial_at"] = open_segment["end"]
+        jobs.append(("partial", open_segment))
+    return jobs, decode_ms
+
+
+def _warm_asr(loaded):
+    silence = np.zeros(ASR_TARGET_SAMPLE_RATE, dtype=np.float32)
+    _transcribe_samples(*loaded, silence, ASR_DEFAULT_LANGUAGE)
+
+
+def _warm_embedding(model):
+    model.encode(["warm-up"], normalize_embeddings=True)
+
+
+def _load_gesture_graph():
+    model_path = _ensure_model_file()
+    if model_path is None:
+        raise RuntimeError("modele gesture_recognizer indisponible")
+    session = {"id": "preload", "roi": None}
+    _gesture_session_graph(session, model_path, DEFAULT_MP_CONFIG.copy())
+    _warm_graph(session["key"], session["id"], session["factory"], pin=True)
+    return session
+
+
+def _load_emotion_graph():
+    session = {"id": "preload", "roi": None, "key": _graph_pool_key("face_mesh")}
+    _warm_graph(session["key"], session["id"], _create_face_mesh, pin=True)
+    return session
+
+
+def _blank_frame(width: int = 320, height: int = 240) -> bytes:
+    header = FRAME_HEADER.pack(FRAME_VERSION, FRAME_FORMAT_RGBA, width, height, 0, 0, 0.0)
+    return header + bytes(width * height * 4)
+
+
+_PRELOADERS = {
+    # Workers warm their own model in _asr_worker_init.
+    "asr": (_start_asr_pool, None),
+    "embedding": (_get_embedding_model, _warm_embedding),
+    "rag": (_ensure_rag_loaded, None),
+    "gesture": (
+        _load_gesture_graph,
+        lambda session: _process_gesture_frame(session, None, _blank_frame()),
+    ),
+    "emotion": (
+        _load_emotion_graph,
+        lambda session: _process_emotion_frame(session, None, _blank_frame()),
+    ),
+}
+
+
+def _preload_models():
+    for name, state in _PRELOAD["subsystems"].items():
+        if state["state"] != "pending":
+            continue
+        load, warm = _PRELOADERS[name]
+        state["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            loaded = load()
+            state["load_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+            if PRELOAD_WARMUP and warm is not None:
+                warm_ts = time.perf_counter()
+                warm(loaded)
+                state["warmup_ms"] = round((time.perf_counter() - warm_ts) * 1000.0, 1)
+        except Exception as exc:
+            state["state"] = "error"
+            state["error"] = str(exc)
+            print(f"[preload] {name} failed: {exc}")
+            continue
+        state["state"] = "ready"
+        print(
+            f"[preload] {name} ready: load {state['load_ms']:.0f} ms, "
+            f"warm-up {state.get('warmup_ms', 0.0):.0f} ms"
+        )
+    print(f"[preload] cold start done in {time.time() - _PRELOAD['started']:.1f} s")
+
+
+def _note_first_request(name: str, started: float):
+    if name in _PRELOAD["first_request"]:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    _PRELOAD["first_request"][name] = round(elapsed_ms, 1)
+    state = _PRELOAD["subsystems"].get(name, {"state": "lazy"})["state"]
+    print(f"[{name}] first request took {elapsed_ms:.0f} ms (model {state})")
+
+
+def _start_preload():
+    for name in PRELOAD_SUBSYSTEMS:
+        if name not in _PRELOADERS:
+            print(f"[preload] unknown subsystem {name!r}, ignored")
+            continue
+        _PRELOAD["subsystems"][name] = {"state": "pending"}
+    if _PRELOAD["subsystems"]:
+        threading.Thread(target=_preload_models, name="preload", daemon=True).start()
 
 
 @app.get("/")
@@ -551,42 +3386,122 @@ def mission_page(request: Request, mission_id: int):
 
 
 @app.post("/api/chat")
-async def chat(payload: dict):
+async def chat(payload: dict, request: Request):
+    started = time.perf_counter()
     system_prompt = str(payload.get("system_prompt") or LLM_SYSTEM_PROMPT)
     messages = _normalize_chat_messages(payload.get("messages"))
     if len(messages) > LLM_MAX_MESSAGES:
         messages = messages[-LLM_MAX_MESSAGES:]
     if not messages:
         raise HTTPException(status_code=400, detail="Aucun message a traiter.")
+
+    cache_key, cache_scope = _llm_cache_keys("chat", system_prompt, messages)
+    cached, cache_vector = await _llm_cache_lookup(
+        cache_key, cache_scope, messages[-1]["content"]
+    )
+
+    def remember(value):
+        _llm_cache_put(cache_key, value, "chat", cache_scope, cache_vector)
+
+    if payload.get("stream"):
+        if cached is not None:
+            return _cached_stream_response(cached)
+        return await _chat_stream_response(
+            system_prompt, messages, started, "chat", on_complete=remember
+        )
+    if cached is not None:
+        return {**cached, "cached": True}
+
     try:
-        data = _call_llm_chat(system_prompt, messages)
+        data = await _call_llm_until_disconnect(request, system_prompt, messages)
+    except HTTPException:
+        raise
     except Exception:
-        raise HTTPException(
-            status_code=503,
-            detail=(
-                "Impossible de contacter le serveur llama.cpp. "
-                f"Verifiez {LLM_CHAT_ENDPOINT}."
-            ),
-        )
+        raise _llm_unavailable()
     try:
         reply = data["choices"][0]["message"]["content"]
     except Exception:
         raise HTTPException(status_code=502, detail="Reponse LLM invalide.")
-    return {
+    result = {
         "reply": reply,
         "model": data.get("model"),
         "usage": data.get("usage"),
     }
+    remember(result)
+    return result
+
+
+@app.get("/api/health")
+def health():
+    subsystems = {name: dict(state) for name, state in _PRELOAD["subsystems"].items()}
+    states = {state["state"] for state in subsystems.values()}
+    if states & {"pending", "loading"}:
+        status = "starting"
+    elif "error" in states:
+        status = "degraded"
+    else:
+        status = "ok"
+    body = {
+        "status": status,
+        "uptime_s": round(time.time() - _PRELOAD["started"], 1),
+        "subsystems": subsystems,
+        "first_request_ms": dict(_PRELOAD["first_request"]),
+    }
+    # 503 until preloading finishes so load balancers hold traffic back.
+    return JSONResponse(body, status_code=503 if status == "starting" else 200)
+
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    dispatch = _get_llm_dispatch()
+    now = time.monotonic()
+    return {
+        "backends": [
+            {
+                "url": b["url"],
+                "healthy": b["ejected_until"] <= now,
+                "in_flight": b["in_flight"],
+                "latency_ms": round(b["latency_ms"], 1),
+                "requests": b["requests"],
+                "errors": b["errors"],
+            }
+            for b in dispatch["backends"]
+        ],
+        "queue": {
+            "waiting": dispatch["waiting"],
+            "max": LLM_ADMISSION_QUEUE,
+            "rejected": dispatch["rejected"],
+        },
+        "cache": {**LLM_CACHE_STATS, "entries": len(LLM_CACHE)},
+    }
+
+
+@app.get("/api/vision/stats")
+def vision_stats():
+    return {
+        "workers": VISION_WORKERS,
+        "in_flight": _VISION_LOAD["in_flight"],
+        "backlog": round(_VISION_LOAD["backlog"], 2),
+        "pool": _graph_pool_stats(),
+        "rss_mb": _resident_memory_mb(),
+    }
 
 
 @app.get("/api/rag/state")
 def rag_state():
-    return _rag_counts()
+    _ensure_rag_loaded()
+    return {
+        **_rag_counts(),
+        "store": _rag_store_memory(),
+        "embedding_backend": _EMBEDDING_BACKEND_LOADED or EMBEDDING_BACKEND,
+        "embed_cache": _embed_cache_stats(),
+    }
 
 
 @app.post("/api/rag/reset")
 def rag_reset():
     _reset_rag_store()
+    _save_rag_store(merge=False)
     return _rag_counts()
 
 
@@ -601,69 +3516,32 @@ async def rag_index(
 
     chunk_size = max(200, min(int(chunk_size), 4000))
     overlap = max(0, min(int(overlap), chunk_size - 1))
+    # A generation change reads the whole index: keep it off the event loop.
+    await asyncio.to_thread(_ensure_rag_loaded)
 
-    added_chunks = 0
-    errors = []
-
+    uploads = []
     for up in files:
         if not up.filename:
             continue
-        data = await up.read()
-        text, err = _text_from_bytes(up.filename, data)
-        if err:
-            errors.append(f"{up.filename} - {err}")
-            continue
-
-        chunks = _chunk_text(text, chunk_size, overlap)
-        if not chunks:
-            continue
-
-        with RAG_LOCK:
-            known_hashes = set(RAG_STORE["hashes"])
-
-        new_chunks = []
-        new_sources = []
-        for chunk in chunks:
-            h = hash(chunk)
-            if h in known_hashes:
-                continue
-            known_hashes.add(h)
-            new_chunks.append(chunk)
-            new_sources.append(up.filename)
-
-        if not new_chunks:
-            continue
+        uploads.append((up.filename, await up.read()))
 
-        try:
-            embeds = _embed_texts(new_chunks)
-        except RuntimeError as exc:
-            raise HTTPException(status_code=503, detail=str(exc))
+    job = _new_ingest_job([name for name, _ in uploads])
+    RAG_INGEST_EXECUTOR.submit(_run_ingest_job, job, uploads, chunk_size, overlap)
+    return {**_ingest_job_view(job), **_rag_counts()}
 
-        norms = [_vector_norm(e) for e in embeds]
 
-        with RAG_LOCK:
-            for idx, chunk in enumerate(new_chunks):
-                h = hash(chunk)
-                if h in RAG_STORE["hashes"]:
-                    continue
-                RAG_STORE["hashes"].add(h)
-                RAG_STORE["docs"].append(chunk)
-                RAG_STORE["sources"].append(new_sources[idx])
-                RAG_STORE["embeds"].append(embeds[idx])
-                RAG_STORE["norms"].append(norms[idx])
-                added_chunks += 1
-
-    counts = _rag_counts()
-    return {
-        "added_chunks": added_chunks,
-        "chunks": counts["chunks"],
-        "sources": counts["sources"],
-        "errors": errors,
-    }
+@app.get("/api/rag/index/{job_id}")
+def rag_index_progress(job_id: str):
+    with RAG_INGEST_LOCK:
+        job = RAG_INGEST_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tache d'indexation inconnue.")
+    return {**_ingest_job_view(job), **_rag_counts()}
 
 
 @app.post("/api/rag/chat")
-async def rag_chat(payload: dict):
+async def rag_chat(payload: dict, request: Request):
+    started = time.perf_counter()
     system_prompt = str(payload.get("system_prompt") or RAG_SYSTEM_PROMPT)
     messages = _normalize_chat_messages(payload.get("messages"))
     query = str(payload.get("query") or "").strip()
@@ -689,11 +3567,35 @@ async def rag_chat(payload: dict):
         min_score = DEFAULT_MIN_SCORE
     min_score = max(0.0, min(min_score, 1.0))
 
+    await asyncio.to_thread(_ensure_rag_loaded)
+    generation = RAG_STORE["generation"]
+    # The retrieval query is the last cached message, so the semantic scope
+    # (everything but the last message) matches paraphrased questions.
+    cache_messages = list(messages)
+    if not cache_messages or cache_messages[-1]["content"] != query:
+        cache_messages.append({"role": "user", "content": query})
+    cache_key, cache_scope = _llm_cache_keys(
+        "rag",
+        system_prompt,
+        cache_messages,
+        extra={"top_k": top_k, "min_score": min_score, "generation": generation},
+    )
+    cached, cache_vector = await _llm_cache_lookup(cache_key, cache_scope, query)
+    if cached is not None:
+        if payload.get("stream"):
+            return _cached_stream_response(
+                cached, first_events=[{"type": "sources", "sources": cached["sources"]}]
+            )
+        return {**cached, "cached": True}
+
     try:
-        results = _retrieve_chunks(query, top_k, min_score)
+        results = await asyncio.to_thread(_retrieve_chunks, query, top_k, min_score)
     except RuntimeError as exc:
         raise HTTPException(status_code=503, detail=str(exc))
 
+    def remember(value):
+        _llm_cache_put(cache_key, {**value, "sources": results}, "rag", cache_scope, cache_vector)
+
     context_block = _build_context_block(results)
     llm_messages = []
     if context_block:
@@ -703,27 +3605,35 @@ async def rag_chat(payload: dict):
     else:
         llm_messages.append({"role": "user", "content": query})
 
+    if payload.get("stream"):
+        return await _chat_stream_response(
+            system_prompt,
+            llm_messages,
+            started,
+            "rag",
+            first_events=[{"type": "sources", "sources": results}],
+            on_complete=remember,
+        )
+
     try:
-        data = _call_llm_chat(system_prompt, llm_messages)
+        data = await _call_llm_until_disconnect(request, system_prompt, llm_messages)
+    except HTTPException:
+        raise
     except Exception:
-        raise HTTPException(
-            status_code=503,
-            detail=(
-                "Impossible de contacter le serveur llama.cpp. "
-                f"Verifiez {LLM_CHAT_ENDPOINT}."
-            ),
-        )
+        raise _llm_unavailable()
     try:
         reply = data["choices"][0]["message"]["content"]
     except Exception:
         raise HTTPException(status_code=502, detail="Reponse LLM invalide.")
 
-    return {
+    result = {
         "reply": reply,
         "sources": results,
         "model": data.get("model"),
         "usage": data.get("usage"),
     }
+    remember(result)
+    return result
 
 
 @app.post("/api/audio/transcribe")
@@ -741,28 +3651,331 @@ async def audio_transcribe(
     if lang not in ASR_SUPPORTED_LANGUAGES:
         lang = ASR_DEFAULT_LANGUAGE
 
-    suffix = Path(file.filename).suffix or ".wav"
-    text, err = _transcribe_audio_bytes(audio_bytes, lang, suffix=suffix)
-    if err:
-        raise HTTPException(status_code=503, detail=err)
-    return {"text": text or "", "language": lang}
+    started = time.perf_counter()
+    try:
+        samples = await asyncio.to_thread(_decode_audio_bytes, audio_bytes)
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"Erreur de transcription: {exc}")
+    job = _enqueue_asr(samples, lang)
+    try:
+        result = await job["future"]
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    _note_first_request("asr", started)
+    return {
+        "text": result["text"],
+        "language": lang,
+        "audio_s": round(job["seconds"], 2),
+        "queue": {"position": job["position"], "wait_ms": round(result["queue_ms"], 1)},
+        "metrics": {"asr_ms": result["asr_ms"], "batch_size": result["batch_size"]},
+    }
+
+
+@app.get("/api/audio/stats")
+def audio_stats():
+    dispatch = _ASR_DISPATCH
+    return {
+        "workers": ASR_WORKERS,
+        "busy": dispatch["busy"],
+        "backend": dispatch["backend"],
+        "queue": {
+            "waiting": len(dispatch["queue"]),
+            "max": ASR_QUEUE_MAX,
+            "rejected": dispatch["rejected"],
+        },
+        "completed": dispatch["completed"],
+        "mean_batch": dispatch["completed"] / dispatch["batches"] if dispatch["batches"] else 0.0,
+        "audio_s": round(dispatch["audio_s"], 1),
+        "busy_s": round(dispatch["busy_s"], 1),
+        "variant": ASR_VARIANT,
+        # Worker seconds per audio second, queue wait excluded; below 1 is faster than real time.
+        "rtf": dispatch["busy_s"] / dispatch["audio_s"] if dispatch["audio_s"] else None,
+        "probe_rtf": dispatch["probe_rtf"],
+    }
+
+
+def _process_gesture_frame(session: dict, text, data) -> dict:
+    decode_ts = time.perf_counter()
+    rgb, frame_meta = _decode_frame_message(text, data)
+    decode_ms = (time.perf_counter() - decode_ts) * 1000.0
+    if rgb is None:
+        return {"landmarks": None, "frame": frame_meta, "metrics": {"decode_ms": decode_ms}}
+
+    roi = session.get("roi")
+    image, box = _roi_crop(roi, rgb) if roi is not None else (rgb, None)
+
+    entry = _lease_graph(session["key"], session["id"], session["factory"])
+    try:
+        start_ts = time.perf_counter()
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+        result = entry["graph"].recognize_for_video(mp_image, _graph_timestamp(entry))
+        if box is not None and not result.hand_landmarks:
+            # Lost inside the crop: retry on the whole frame right away.
+            box = None
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+            result = entry["graph"].recognize_for_video(mp_image, _graph_timestamp(entry))
+        inference_ms = (time.perf_counter() - start_ts) * 1000.0
+    finally:
+        _release_graph(entry)
+
+    landmarks = _hand_landmark_array(result)
+    if landmarks is not None and box is not None:
+        landmarks = _roi_to_frame(landmarks, box)
+    if roi is not None:
+        complete = landmarks is not None and len(landmarks) >= session["subjects"]
+        _roi_update(roi, landmarks, rgb.shape[1], rgb.shape[0], complete)
+
+    label, score, raw_label = _extract_gesture(result)
+    return {
+        "type": "result",
+        "landmarks": landmarks,
+        "gesture": {
+            "label": label,
+            "score": score,
+            "raw": raw_label,
+        },
+        "metrics": {
+            "decode_ms": decode_ms,
+            "inference_ms": inference_ms,
+            "roi": list(box) if box else None,
+        },
+        "frame": frame_meta,
+    }
+
+
+def _no_face_payload(frame_meta, inference_ms=None) -> dict:
+    payload = {
+        "type": "emotion",
+        "face": False,
+        "emotion": {"label": "Aucun visage detecte"},
+        "frame": frame_meta,
+    }
+    if inference_ms is not None:
+        payload["metrics"] = {"inference_ms": inference_ms}
+    return payload
+
+
+def _face_payload(points, label, metrics, frame_meta) -> dict:
+    return {
+        "type": "emotion",
+        "face": True,
+        "emotion": {"label": label},
+        "metrics": metrics,
+        "guides": _extract_face_guides(points),
+        "frame": frame_meta,
+    }
+
+
+def _process_emotion_frame(session: dict, text, data) -> dict:
+    decode_ts = time.perf_counter()
+    rgb, frame_meta = _decode_frame_message(text, data)
+    decode_ms = (time.perf_counter() - decode_ts) * 1000.0
+    if rgb is None:
+        payload = _no_face_payload(frame_meta)
+        payload["metrics"] = {"decode_ms": decode_ms}
+        return payload
+
+    roi = session.get("roi")
+    image, box = _roi_crop(roi, rgb) if roi is not None else (rgb, None)
+
+    entry = _lease_graph(session["key"], session["id"], _create_face_mesh)
+    try:
+        start_ts = time.perf_counter()
+        results = entry["graph"].process(image)
+        if box is not None and not results.multi_face_landmarks:
+            box = None
+            results = entry["graph"].process(rgb)
+        inference_ms = (time.perf_counter() - start_ts) * 1000.0
+    finally:
+        _release_graph(entry)
+
+    points = None
+    if results.multi_face_landmarks:
+        points = _face_guide_points(results.multi_face_landmarks[0].landmark)
+        if box is not None:
+            points = _roi_to_frame(points, box)
+    if roi is not None:
+        _roi_update(roi, points, rgb.shape[1], rgb.shape[0], points is not None)
+    if points is None:
+        payload = _no_face_payload(frame_meta, inference_ms)
+        payload["metrics"]["decode_ms"] = decode_ms
+        return payload
+
+    label, metrics = _estimate_emotion(points)
+    metrics["decode_ms"] = decode_ms
+    metrics["inference_ms"] = float(inference_ms)
+    metrics["roi"] = list(box) if box else None
+    return _face_payload(points, label, metrics, frame_meta)
+
+
+def _process_emotion_batch(frames: list) -> list[dict]:
+    # IMAGE mode: frames are independent, so any socket's frame can go
+    # through the same graph, and the emotion math runs once per batch.
+    decoded = []
+    for text, data in frames:
+        decode_ts = time.perf_counter()
+        rgb, frame_meta = _decode_frame_message(text, data)
+        decoded.append((rgb, frame_meta, (time.perf_counter() - decode_ts) * 1000.0))
+    entry = _lease_graph(_graph_pool_key("face_mesh_image"), "batch", _create_image_face_mesh)
+    faces = []
+    payloads = []
+    try:
+        for rgb, frame_meta, decode_ms in decoded:
+            if rgb is None:
+                payloads.append(_no_face_payload(frame_meta))
+                continue
+            start_ts = time.perf_counter()
+            results = entry["graph"].process(rgb)
+            inference_ms = (time.perf_counter() - start_ts) * 1000.0
+            if not results.multi_face_landmarks:
+                payloads.append(_no_face_payload(frame_meta, inference_ms))
+                continue
+            faces.append(
+                (len(payloads), _face_guide_points(results.multi_face_landmarks[0].landmark))
+            )
+            payloads.append({"frame": frame_meta, "inference_ms": inference_ms})
+    finally:
+        _release_graph(entry)
+
+    if faces:
+        points = np.stack([p for _, p in faces])
+        features = _emotion_features(points)
+        labels = _classify_emotions(features)
+        for (slot, _), face_points, label, row in zip(faces, points, labels, features):
+            metrics = _emotion_metrics(row)
+            metrics["inference_ms"] = payloads[slot]["inference_ms"]
+            frame_meta = payloads[slot]["frame"]
+            payloads[slot] = _face_payload(face_points, str(label), metrics, frame_meta)
+    for payload, (_, _, decode_ms) in zip(payloads, decoded):
+        metrics = payload.setdefault("metrics", {})
+        metrics["decode_ms"] = decode_ms
+        metrics["batch_size"] = len(frames)
+    return payloads
+
+
+async def _submit_emotion_batch(text, data) -> dict:
+    batch = _EMOTION_BATCH
+    if batch["task"] is None or batch["task"].done():
+        batch["ready"] = asyncio.Event()
+        batch["full"] = asyncio.Event()
+        batch["task"] = asyncio.create_task(_emotion_batch_loop())
+    future = asyncio.get_running_loop().create_future()
+    batch["items"].append((text, data, future))
+    batch["ready"].set()
+    if len(batch["items"]) >= EMOTION_BATCH_MAX:
+        batch["full"].set()
+    return await future
+
+
+async def _emotion_batch_loop():
+    batch = _EMOTION_BATCH
+    while True:
+        await batch["ready"].wait()
+        try:
+            await asyncio.wait_for(batch["full"].wait(), EMOTION_BATCH_WINDOW)
+        except asyncio.TimeoutError:
+            pass
+        items = batch["items"][:EMOTION_BATCH_MAX]
+        batch["items"] = batch["items"][EMOTION_BATCH_MAX:]
+        batch["full"].clear()
+        if not batch["items"]:
+            batch["ready"].clear()
+        # Batches run concurrently on the vision pool; the loop keeps collecting.
+        task = asyncio.create_task(_run_emotion_batch(items))
+        batch["running"].add(task)
+        task.add_done_callback(batch["running"].discard)
+
+
+async def _run_emotion_batch(items: list):
+    try:
+        payloads = await _run_vision_job(
+            _process_emotion_batch, [(text, data) for text, data, _ in items]
+        )
+    except Exception as exc:
+        for _, _, future in items:
+            if not future.done():
+                future.set_exception(exc)
+        return
+    for (_, _, future), payload in zip(items, payloads):
+        if not future.done():
+            future.set_result(payload)
+
+
+async def _infer_gesture(session: dict, text, data) -> dict:
+    return await _run_vision_job(_process_gesture_frame, session, text, data)
+
+
+async def _infer_emotion(session: dict, text, data) -> dict:
+    if EMOTION_BATCH_ENABLED:
+        return await _submit_emotion_batch(text, data)
+    return await _run_vision_job(_process_emotion_frame, session, text, data)
+
+
+async def _vision_worker(ws: WebSocket, session: dict, mailbox: dict, infer):
+    while True:
+        text, data, received_ts = await _mailbox_take(mailbox)
+        started_ts = time.perf_counter()
+        payload = _predict_filtered_result(session["filter"], data)
+        if payload is None:
+            try:
+                payload = await infer(session, text, data)
+            except Exception:
+                # Keep the socket alive on occasional malformed frames or decode errors.
+                continue
+            _apply_temporal_filter(session["filter"], payload)
+        metrics = payload.setdefault("metrics", {})
+        metrics["queue_ms"] = (started_ts - received_ts) * 1000.0
+        metrics["server_ms"] = (time.perf_counter() - received_ts) * 1000.0
+        metrics["dropped"] = mailbox["dropped"]
+        rate = session["rate"]
+        changed = _update_rate(rate, metrics["server_ms"], mailbox["dropped"])
+        payload["rate"] = _rate_view(rate)
+        try:
+            if changed:
+                await ws.send_text(json.dumps({"type": "rate", **payload["rate"]}))
+            message = _encode_result(payload, session["encoding"])
+            if isinstance(message, bytes):
+                await ws.send_bytes(message)
+            else:
+                await ws.send_text(message)
+        except Exception:
+            return
+
+
+def _landmark_encoding(ws: WebSocket) -> str:
+    encoding = str(ws.query_params.get("landmarks", "json")).lower()
+    return encoding if encoding in LANDMARK_ENCODINGS else "json"
+
+
+def _gesture_session_graph(session: dict, model_path: Path, config: dict):
+    active_model_path = str(MODEL_CHOICES.get(config["model"], model_path))
+    session["key"] = _graph_pool_key("gesture", config)
+    session["subjects"] = config["num_hands"]
+    session["factory"] = lambda: _create_video_recognizer(active_model_path, config)
 
 
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws.accept()
-    model_path = _ensure_model_file()
+    model_path = await asyncio.to_thread(_ensure_model_file)
     if not model_path:
         print("[ws] model unavailable")
         await ws.send_text(json.dumps({"error": "Modele MediaPipe indisponible."}))
         await ws.close()
         return
 
+    session = {
+        "id": uuid.uuid4().hex,
+        "rate": _new_rate_state(),
+        "encoding": _landmark_encoding(ws),
+        "filter": _new_temporal_filter(),
+        "roi": _new_roi_state() if ROI_ENABLED else None,
+    }
     current_config = DEFAULT_MP_CONFIG.copy()
-    active_model_path = MODEL_CHOICES.get(current_config["model"], model_path)
+    _gesture_session_graph(session, model_path, current_config)
     try:
-        recognizer, applied_config, warning = _create_video_recognizer(
-            str(active_model_path), current_config
+        applied_config, warning = await _run_vision_job(
+            _warm_graph, session["key"], session["id"], session["factory"]
         )
     except Exception as exc:
         print(f"[ws] recognizer init failed: {exc}")
@@ -776,204 +3989,170 @@ async def ws_endpoint(ws: WebSocket):
     await ws.send_text(
         json.dumps({"type": "config", "applied": applied_config, "warning": warning})
     )
-    last_ts = 0
+    mailbox = _new_mailbox()
+    worker = asyncio.create_task(
+        _vision_worker(ws, session, mailbox, _infer_gesture)
+    )
+    recording = _open_recording("/ws", session)
     try:
         while True:
-            payload = await ws.receive_text()
+            text, data = await _receive_frame_message(ws)
+            _record_message(recording, text, data)
+            if text is None or not text.lstrip().startswith("{"):
+                _mailbox_put(mailbox, (text, data, time.perf_counter()))
+                continue
             try:
-                if payload.lstrip().startswith("{"):
-                    try:
-                        msg = json.loads(payload)
-                    except json.JSONDecodeError:
-                        continue
-                    if msg.get("type") == "config":
-                        new_config = _normalize_config(msg.get("config") or {})
-                        if new_config != current_config:
-                            active_model_path = MODEL_CHOICES.get(
-                                new_config["model"], model_path
-                            )
-                            try:
-                                new_recognizer, applied_config, warning = (
-                                    _create_video_recognizer(
-                                        str(active_model_path), new_config
-                                    )
-                                )
-                            except Exception as exc:
-                                print(f"[ws] config apply failed: {exc}")
-                                await ws.send_text(
-                                    json.dumps(
-                                        {
-                                            "type": "error",
-                                            "message": "Config invalide ou modele indisponible.",
-                                        }
-                                    )
-                                )
-                                continue
-                            recognizer.close()
-                            recognizer = new_recognizer
-                            current_config = new_config
-                            last_ts = 0
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "type": "config",
-                                    "applied": applied_config,
-                                    "warning": warning,
-                                }
-                            )
-                        )
-                    continue
-
-                data_url = payload
-
-                # data_url = "data:image/jpeg;base64,...."
-                if "," not in data_url:
-                    await ws.send_text(json.dumps({"landmarks": None}))
+                msg = json.loads(text)
+                if msg.get("type") != "config":
                     continue
-                b64 = data_url.split(",", 1)[1]
-                jpg_bytes = base64.b64decode(b64)
-
-                arr = np.frombuffer(jpg_bytes, dtype=np.uint8)
-                frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)  # BGR
-                if frame is None:
-                    await ws.send_text(json.dumps({"landmarks": None}))
-                    continue
-
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
-
-                timestamp_ms = int(time.time() * 1000)
-                if timestamp_ms <= last_ts:
-                    timestamp_ms = last_ts + 1
-                last_ts = timestamp_ms
-
-                start_ts = time.perf_counter()
-                result = recognizer.recognize_for_video(mp_image, timestamp_ms)
-                inference_ms = (time.perf_counter() - start_ts) * 1000.0
-
-                out = []
-                if result.hand_landmarks:
-                    for hand_lms in result.hand_landmarks:
-                        pts = [{"x": lm.x, "y": lm.y, "z": lm.z} for lm in hand_lms]
-                        out.append(pts)
-
-                label, score, raw_label = _extract_gesture(result)
-                await ws.send_text(
-                    json.dumps(
-                        {
-                            "type": "result",
-                            "landmarks": out if out else None,
-                            "gesture": {
-                                "label": label,
-                                "score": score,
-                                "raw": raw_label,
-                            },
-                            "metrics": {"inference_ms": inference_ms},
-                        }
-                    )
-                )
+                new_config = _normalize_config(msg.get("config") or {})
             except Exception:
-                # Keep the socket alive on occasional malformed frames or decode errors.
                 continue
+            if new_config != current_config:
+                candidate = {"id": session["id"]}
+                _gesture_session_graph(candidate, model_path, new_config)
+                try:
+                    applied_config, warning = await _run_vision_job(
+                        _warm_graph, candidate["key"], session["id"], candidate["factory"]
+                    )
+                except Exception as exc:
+                    print(f"[ws] config apply failed: {exc}")
+                    await ws.send_text(
+                        json.dumps(
+                            {
+                                "type": "error",
+                                "message": "Config invalide ou modele indisponible.",
+                            }
+                        )
+                    )
+                    continue
+                session.update(candidate)
+                current_config = new_config
+            await ws.send_text(
+                json.dumps(
+                    {
+                        "type": "config",
+                        "applied": applied_config,
+                        "warning": warning,
+                    }
+                )
+            )
     except WebSocketDisconnect as exc:
         print(f"[ws] client disconnected (code={exc.code})")
     except Exception as exc:
         print(f"[ws] unexpected error: {exc}")
     finally:
-        try:
-            recognizer.close()
-        except Exception:
-            pass
+        # In-flight jobs release their lease themselves; graphs stay warm.
+        worker.cancel()
+        _close_recording(recording, "ws")
 
 
 @app.websocket("/ws/emotion")
 async def ws_emotion(ws: WebSocket):
     await ws.accept()
-    face_mesh = mp.solutions.face_mesh.FaceMesh(
-        static_image_mode=False,
-        max_num_faces=1,
-        refine_landmarks=True,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5,
-    )
+    session = {
+        "id": uuid.uuid4().hex,
+        "key": _graph_pool_key("face_mesh"),
+        "rate": _new_rate_state(),
+        "encoding": _landmark_encoding(ws),
+        "filter": _new_temporal_filter(),
+        "roi": _new_roi_state() if ROI_ENABLED else None,
+    }
+    if EMOTION_BATCH_ENABLED:
+        await _run_vision_job(
+            _warm_graph, _graph_pool_key("face_mesh_image"), "batch", _create_image_face_mesh
+        )
+    else:
+        await _run_vision_job(_warm_graph, session["key"], session["id"], _create_face_mesh)
+    mailbox = _new_mailbox()
+    worker = asyncio.create_task(_vision_worker(ws, session, mailbox, _infer_emotion))
+    recording = _open_recording("/ws/emotion", session)
     try:
         while True:
-            payload = await ws.receive_text()
+            text, data = await _receive_frame_message(ws)
+            _record_message(recording, text, data)
+            if text is not None and text.lstrip().startswith("{"):
+                continue
+            _mailbox_put(mailbox, (text, data, time.perf_counter()))
+    except WebSocketDisconnect as exc:
+        print(f"[ws/emotion] client disconnected (code={exc.code})")
+    except Exception as exc:
+        print(f"[ws/emotion] unexpected error: {exc}")
+    finally:
+        worker.cancel()
+        _close_recording(recording, "ws/emotion")
+
+
+async def _audio_stream_worker(ws: WebSocket, stream: dict):
+    while True:
+        await stream["ready"].wait()
+        stream["ready"].clear()
+        final = stream["stopped"]
+        jobs, decode_ms = await asyncio.to_thread(_advance_audio_stream, stream, final)
+        for kind, segment in jobs:
+            if kind == "partial" and _ASR_DISPATCH["queue"]:
+                # Partials are best effort: skip them while transcription is backed up.
+                continue
             try:
-                if payload.lstrip().startswith("{"):
-                    continue
+                job = _enqueue_asr(segment["audio"], stream["language"])
+                if job["position"]:
+                    await ws.send_text(json.dumps({"type": "queue", "position": job["position"]}))
+                result = await job["future"]
+            except Exception as exc:
+                message = exc.detail if isinstance(exc, HTTPException) else str(exc)
+                await ws.send_text(json.dumps({"type": "error", "message": message}))
+                return
+            event = _audio_segment_event(stream, kind, segment, result)
+            event["metrics"]["decode_ms"] = decode_ms
+            await ws.send_text(json.dumps(event))
+        if final:
+            text = " ".join(text for text in stream["segments"] if text)
+            await ws.send_text(
+                json.dumps({"type": "final", "text": text, "segments": len(stream["segments"])})
+            )
+            return
+        # Chunks arriving meanwhile are coalesced into the next decode.
+        await asyncio.sleep(AUDIO_STREAM_DECODE_SECONDS)
 
-                data_url = payload
-                if "," not in data_url:
-                    await ws.send_text(
-                        json.dumps(
-                            {
-                                "type": "emotion",
-                                "face": False,
-                                "emotion": {"label": "Aucun visage detecte"},
-                            }
-                        )
-                    )
-                    continue
-                b64 = data_url.split(",", 1)[1]
-                jpg_bytes = base64.b64decode(b64)
 
-                arr = np.frombuffer(jpg_bytes, dtype=np.uint8)
-                frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-                if frame is None:
+@app.websocket("/ws/audio")
+async def ws_audio(ws: WebSocket):
+    await ws.accept()
+    lang = str(ws.query_params.get("language", ASR_DEFAULT_LANGUAGE)).lower()
+    if lang not in ASR_SUPPORTED_LANGUAGES:
+        lang = ASR_DEFAULT_LANGUAGE
+    stream = _new_audio_stream(lang)
+    worker = asyncio.create_task(_audio_stream_worker(ws, stream))
+    try:
+        while True:
+            text, data = await _receive_frame_message(ws)
+            if data is not None:
+                stream["pending"] += data
+                stream["bytes"] += len(data)
+                if stream["bytes"] > AUDIO_STREAM_MAX_BYTES:
                     await ws.send_text(
-                        json.dumps(
-                            {
-                                "type": "emotion",
-                                "face": False,
-                                "emotion": {"label": "Aucun visage detecte"},
-                            }
-                        )
+                        json.dumps({"type": "error", "message": "Enregistrement trop long."})
                     )
+                    stream["stopped"] = True
+                else:
+                    stream["ready"].set()
                     continue
-
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                start_ts = time.perf_counter()
-                results = face_mesh.process(rgb)
-                inference_ms = (time.perf_counter() - start_ts) * 1000.0
-
-                if not results.multi_face_landmarks:
-                    await ws.send_text(
-                        json.dumps(
-                            {
-                                "type": "emotion",
-                                "face": False,
-                                "emotion": {"label": "Aucun visage detecte"},
-                                "metrics": {"inference_ms": inference_ms},
-                            }
-                        )
-                    )
+            elif text is not None:
+                try:
+                    msg = json.loads(text)
+                except ValueError:
                     continue
-
-                face_landmarks = results.multi_face_landmarks[0].landmark
-                label, metrics = _estimate_emotion(face_landmarks)
-                metrics["inference_ms"] = float(inference_ms)
-                guides = _extract_face_guides(face_landmarks)
-
-                await ws.send_text(
-                    json.dumps(
-                        {
-                            "type": "emotion",
-                            "face": True,
-                            "emotion": {"label": label},
-                            "metrics": metrics,
-                            "guides": guides,
-                        }
-                    )
-                )
-            except Exception:
-                continue
+                if msg.get("type") != "stop":
+                    continue
+                stream["stopped"] = True
+            stream["ready"].set()
+            await worker
+            await ws.close()
+            return
     except WebSocketDisconnect as exc:
-        print(f"[ws/emotion] client disconnected (code={exc.code})")
+        print(f"[ws/audio] client disconnected (code={exc.code})")
     except Exception as exc:
-        print(f"[ws/emotion] unexpected error: {exc}")
+        print(f"[ws/audio] unexpected error: {exc}")
     finally:
-        try:
-            face_mesh.close()
-        except Exception:
-            pass
+        worker.cancel()
+        _close_audio_stream(stream)